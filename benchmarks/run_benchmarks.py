@@ -0,0 +1,219 @@
+"""Benchmarks for Warbler's construct, layout, and save pipeline.
+
+Each workload runs in its own subprocess, so that its peak memory use can be
+measured on its own. The wall time, the time spent building pages (Paragraph
+construction, Page.add, and layout) and saving, the peak RSS, and the bytes
+written are recorded for each workload in a JSON results file.
+
+    python benchmarks/run_benchmarks.py                      # run every workload
+    python benchmarks/run_benchmarks.py letter report       # run some workloads
+    python benchmarks/run_benchmarks.py --scale 0.1          # smaller, quicker runs
+    python benchmarks/run_benchmarks.py --save-baseline      # store the results as the baseline
+
+If a baseline file exists (benchmarks/baseline.json by default), each result
+is compared against it, and the script exits with status 1 if any workload's
+wall time or peak RSS got worse by more than --tolerance. Baselines are only
+meaningful on the machine they were recorded on, so they aren't committed.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+FONT_PATH = BENCHMARKS_DIR.parent / 'tests' / 'Minecraft.ttf'
+
+LOREM_IPSUM = (
+    'Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore et '
+    'dolore magna aliqua. Tortor consequat id porta nibh venenatis cras sed felis eget. Augue lacus viverra '
+    'vitae congue eu. Ut tortor pretium viverra suspendisse potenti nullam ac tortor.'
+)
+
+
+def build_letter(warbler, scale, font='Helvetica'):
+    # A one-page business letter.
+    doc = warbler.Document()
+    page = doc.add_page()
+    page.add('ACME Corporation', font=font, font_size=20)
+    page.add('1234 Main Street, Springfield', font=font)
+    page.add('Dear customer,', font=font)
+    for _ in range(4):
+        page.add(LOREM_IPSUM, font=font, text_alignment='justified', hyphenation='en-us')
+    page.add('Sincerely, The Management', font=font)
+    return doc
+
+
+def build_letter_ttf(warbler, scale):
+    # The same letter, using a TrueType font.
+    return build_letter(warbler, scale, font=FONT_PATH)
+
+
+def build_report(warbler, scale):
+    # A long report: a heading and several paragraphs on each page.
+    doc = warbler.Document()
+    for page_number in range(max(1, int(500 * scale))):
+        page = doc.add_page()
+        page.add('Section %d' % (page_number + 1), font='Helvetica-Bold', font_size=16)
+        for _ in range(5):
+            page.add(LOREM_IPSUM)
+    return doc
+
+
+def build_labels(warbler, scale):
+    # A sheet run of address labels, 30 per page.
+    doc = warbler.Document()
+    page = None
+    for label_number in range(max(1, int(10000 * scale))):
+        if label_number % 30 == 0:
+            page = doc.add_page()
+        page.add('Label %05d, 1234 Main Street, Springfield' % label_number, font_size=8)
+    return doc
+
+
+def build_annotations(warbler, scale):
+    # Detector output: tens of thousands of boxes on one page, each with its
+    # own fill color.
+    doc = warbler.Document()
+    page = doc.add_page()
+    count = max(1, int(30000 * scale))
+    boxes = [(20 + i % 100 * 5.5, 20 + i // 100 % 150 * 5, 4.5, 4) for i in range(count)]
+    colors = [(i % 256, i // 256 % 256, 128) for i in range(count)]
+    page.add_square_annotations(boxes, fill_color=colors, stroke_color='black')
+    return doc
+
+
+WORKLOADS = {
+    'letter': build_letter,
+    'letter-ttf': build_letter_ttf,
+    'report': build_report,
+    'labels': build_labels,
+    'annotations': build_annotations,
+}
+
+
+def peak_rss_bytes():
+    import resource
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS.
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def run_workload(name, scale):
+    # Runs in the child process and returns this workload's measurements.
+    start_time = time.perf_counter()
+    import warbler
+
+    warbler.Document  # Resolve the lazy import, so that it counts as import time.
+    import_time = time.perf_counter() - start_time
+
+    build_start_time = time.perf_counter()
+    doc = WORKLOADS[name](warbler, scale)
+    build_time = time.perf_counter() - build_start_time
+
+    save_start_time = time.perf_counter()
+    pdf_bytes = doc.to_bytes()
+    save_time = time.perf_counter() - save_start_time
+
+    return {
+        'wall_time': time.perf_counter() - start_time,
+        'import_time': import_time,
+        'build_time': build_time,
+        'save_time': save_time,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'bytes_written': len(pdf_bytes),
+        'pages': int(doc.get_document_info().get_number_of_pages()),
+    }
+
+
+def compare(results, baseline, tolerance):
+    # Prints each result next to its baseline and returns the names of the
+    # workloads that regressed.
+    regressions = []
+    print('%-12s %10s %10s %12s %12s %8s' % ('workload', 'wall (s)', 'baseline', 'peak RSS MB', 'baseline', 'change'))
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if base is None or base.get('scale') != result['scale']:
+            print('%-12s %10.3f %10s %12.1f %12s' % (name, result['wall_time'], '-', result['peak_rss_bytes'] / 2**20, '-'))
+            continue
+        time_change = result['wall_time'] / base['wall_time'] - 1
+        rss_change = result['peak_rss_bytes'] / base['peak_rss_bytes'] - 1
+        regressed = time_change > tolerance or rss_change > tolerance
+        print(
+            '%-12s %10.3f %10.3f %12.1f %12.1f %+7.0f%%%s'
+            % (
+                name,
+                result['wall_time'],
+                base['wall_time'],
+                result['peak_rss_bytes'] / 2**20,
+                base['peak_rss_bytes'] / 2**20,
+                time_change * 100,
+                '  REGRESSION' if regressed else '',
+            )
+        )
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Warbler construct, layout, and save pipeline.')
+    parser.add_argument('workloads', nargs='*', help='workloads to run: %s (default: all)' % ', '.join(WORKLOADS))
+    parser.add_argument(
+        '--scale', type=float, default=1.0, help='multiplier for the report, labels, and annotations sizes'
+    )
+    parser.add_argument('--output', default=str(BENCHMARKS_DIR / 'results.json'), help='results file to write')
+    parser.add_argument('--baseline', default=str(BENCHMARKS_DIR / 'baseline.json'), help='baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='also write the results to the baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before failing (default: 0.2)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        json.dump(run_workload(args.child, args.scale), sys.stdout)
+        return 0
+
+    for name in args.workloads:
+        if name not in WORKLOADS:
+            parser.error('unknown workload %r' % (name,))
+
+    results = {}
+    for name in args.workloads or list(WORKLOADS):
+        print('Running %s...' % name, file=sys.stderr)
+        child = subprocess.run(
+            [sys.executable, __file__, '--child', name, '--scale', str(args.scale)],
+            stdout=subprocess.PIPE,
+            check=True,
+            universal_newlines=True,
+        )
+        results[name] = dict(json.loads(child.stdout), scale=args.scale)
+
+    results_file = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    with open(args.output, 'w') as output_file:
+        json.dump(results_file, output_file, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results_file, baseline_file, indent=2)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
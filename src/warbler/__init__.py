@@ -5,92 +5,142 @@ TODO_DESCRIPTION"""
 
 __version__ = '0.1.0'
 
-# Importing the Warbler wrappers
-from .util import (
-    _normalize_text_alignment,
-    _normalize_vertical_alignment,
-    _normalize_horizontal_alignment,
-    _normalize_color,
-    _normalize_hyphenation,
+import importlib
+
+# Importing borb (and the Warbler wrappers around it) is slow, so nothing is
+# imported until it is first used. Each name that Warbler re-exports is mapped
+# to the module it comes from, and the module-level __getattr__() below
+# imports that module the first time the name is accessed. This keeps both
+# `warbler.Document` and `from warbler import Document` working.
+_LAZY_IMPORTS = {
+    # Importing the Warbler wrappers
+    '_normalize_text_alignment': '.util',
+    '_normalize_vertical_alignment': '.util',
+    '_normalize_horizontal_alignment': '.util',
+    '_normalize_color': '.util',
+    '_normalize_hyphenation': '.util',
+    'normalize_colors': '.util',
+    'clear_font_cache': '.util',
+    'font_cache_info': '.util',
+    'clear_text_width_cache': '.util',
+    'text_width_cache_info': '.util',
+    'preload_hyphenation': '.util',
+    'clear_subset_font_cache': '.subset',
+    'clear_image_cache': '.images',
+    'Document': '.document',
+    'Page': '.document',
+    'PageTemplate': '.document',
+    'Paragraph': '.document',
+    'AddManyResult': '.document',
+    'register_page_size': '.document',
+    'DocumentWriter': '.writer',
+    'Profile': '.profiling',
+    'ParagraphStyle': '.style',
+    'ParagraphSpec': '.style',
+    'SquareAnnotation': '.annotation',
+    'Rectangle': '.shapes',
+    'render_many': '.batch',
+    'render_async': '.aio',
+    'RenderResult': '.batch',
+    'RenderFailure': '.batch',
+    'RenderCache': '.cache',
+    'cache_key': '.cache',
+    # Importing directly from Borb:
+    # Color
+    'Color': 'borb.pdf.canvas.color.color',
+    'RGBColor': 'borb.pdf.canvas.color.color',
+    'CMYKColor': 'borb.pdf.canvas.color.color',
+    'GrayColor': 'borb.pdf.canvas.color.color',
+    'HSVColor': 'borb.pdf.canvas.color.color',
+    'HexColor': 'borb.pdf.canvas.color.color',
+    'X11Color': 'borb.pdf.canvas.color.color',
+    'Pantone': 'borb.pdf.canvas.color.pantone',
+    # Image
+    'Barcode': 'borb.pdf.canvas.layout.image.barcode',
+    'BarcodeType': 'borb.pdf.canvas.layout.image.barcode',
+    'Chart': 'borb.pdf.canvas.layout.image.chart',
+    'Image': 'borb.pdf.canvas.layout.image.image',
+    'Alignment': 'borb.pdf.canvas.layout.layout_element',
+    # List
+    'List': 'borb.pdf.canvas.layout.list.list',
+    'OrderedList': 'borb.pdf.canvas.layout.list.ordered_list',
+    'RomanNumeralOrderedList': 'borb.pdf.canvas.layout.list.roman_list',
+    'UnorderedList': 'borb.pdf.canvas.layout.list.unordered_list',
+    # PageLayout
+    'PageLayout': 'borb.pdf.canvas.layout.page_layout.page_layout',
+    'MultiColumnLayout': 'borb.pdf.canvas.layout.page_layout.multi_column_layout',
+    'SingleColumnLayout': 'borb.pdf.canvas.layout.page_layout.multi_column_layout',
+    'SingleColumnLayoutWithOverflow': 'borb.pdf.canvas.layout.page_layout.single_column_layout_with_overflow',
+    # Flow
+    'InlineFlow': 'borb.pdf.canvas.layout.page_layout.inline_flow',
+    'BlockFlow': 'borb.pdf.canvas.layout.page_layout.block_flow',
+    # Shape
+    'ConnectedShape': 'borb.pdf.canvas.layout.shape.connected_shape',
+    'DisconnectedShape': 'borb.pdf.canvas.layout.shape.disconnected_shape',
+    'SmartArt': 'borb.pdf.canvas.layout.smart_art.smart_art',
+    # Table
+    'FixedColumnWidthTable': 'borb.pdf.canvas.layout.table.fixed_column_width_table',
+    'FlexibleColumnWidthTable': 'borb.pdf.canvas.layout.table.flexible_column_width_table',
+    'Table': 'borb.pdf.canvas.layout.table.table',
+    'TableCell': 'borb.pdf.canvas.layout.table.table',
+    'TableUtil': 'borb.pdf.canvas.layout.table.table_util',
+    # Forms
+    'FormField': 'borb.pdf.canvas.layout.forms.form_field',
+    'TextField': 'borb.pdf.canvas.layout.forms.text_field',
+    'TextArea': 'borb.pdf.canvas.layout.forms.text_area',
+    'DropDownList': 'borb.pdf.canvas.layout.forms.drop_down_list',
+    'CountryDropDownList': 'borb.pdf.canvas.layout.forms.country_drop_down_list',
+    'CheckBox': 'borb.pdf.canvas.layout.forms.check_box',
+    'PushButton': 'borb.pdf.canvas.layout.forms.push_button',
+    'JavaScriptPushButton': 'borb.pdf.canvas.layout.forms.push_button',
+    # Paragraph
+    # 'Paragraph': 'borb.pdf.canvas.layout.text.paragraph',
+    'HeterogeneousParagraph': 'borb.pdf.canvas.layout.text.heterogeneous_paragraph',
+    'Heading': 'borb.pdf.canvas.layout.text.heading',
+    'ChunkOfText': 'borb.pdf.canvas.layout.text.chunk_of_text',
+    'Lipsum': 'borb.pdf.canvas.lipsum.lipsum',
+    # Document, Page, PDF
+    # 'Document': 'borb.pdf.document.document',
+    # 'Page': 'borb.pdf.page.page',
+    'PDF': 'borb.pdf.pdf',
+    # Additional imports:
+    'TrueTypeFont': 'borb.pdf.canvas.font.simple_font.true_type_font',
+}
+
+# The Warbler submodules can also be accessed as attributes, e.g. warbler.util:
+_SUBMODULES = (
+    'aio',
+    'annotation',
+    'batch',
+    'cache',
+    'compress',
+    'document',
+    'images',
+    'profiling',
+    'shapes',
+    'style',
+    'subset',
+    'table',
+    'util',
+    'warblertypes',
+    'writer',
 )
-from .document import Document, Page, Paragraph
-from .annotation import SquareAnnotation
-from .shapes import Rectangle
 
-# Importing directly from Borb:
+__all__ = [name for name in _LAZY_IMPORTS if not name.startswith('_')]
 
-# Color
-from borb.pdf.canvas.color.color import (
-    Color,
-    RGBColor,
-    CMYKColor,
-    GrayColor,
-    HSVColor,
-    HexColor,
-    HSVColor,
-    X11Color,
-)
-from borb.pdf.canvas.color.pantone import Pantone
-
-# Image
-from borb.pdf.canvas.layout.image.barcode import Barcode
-from borb.pdf.canvas.layout.image.barcode import BarcodeType
-from borb.pdf.canvas.layout.image.chart import Chart
-from borb.pdf.canvas.layout.image.image import Image
-from borb.pdf.canvas.layout.layout_element import Alignment
-
-# List
-from borb.pdf.canvas.layout.list.list import List
-from borb.pdf.canvas.layout.list.ordered_list import OrderedList
-from borb.pdf.canvas.layout.list.roman_list import RomanNumeralOrderedList
-from borb.pdf.canvas.layout.list.unordered_list import UnorderedList
-
-# PageLayout
-from borb.pdf.canvas.layout.page_layout.page_layout import PageLayout
-from borb.pdf.canvas.layout.page_layout.multi_column_layout import MultiColumnLayout
-from borb.pdf.canvas.layout.page_layout.multi_column_layout import SingleColumnLayout
-
-# TODO  Doesn't exist for some reason???
-from borb.pdf.canvas.layout.page_layout.single_column_layout_with_overflow import (
-    SingleColumnLayoutWithOverflow,
-)
-
-# Flow
-from borb.pdf.canvas.layout.page_layout.inline_flow import InlineFlow
-from borb.pdf.canvas.layout.page_layout.block_flow import BlockFlow
-
-# Shape
-from borb.pdf.canvas.layout.shape.connected_shape import ConnectedShape
-from borb.pdf.canvas.layout.shape.disconnected_shape import DisconnectedShape
-from borb.pdf.canvas.layout.smart_art.smart_art import SmartArt
-
-# Table
-from borb.pdf.canvas.layout.table.fixed_column_width_table import FixedColumnWidthTable
-from borb.pdf.canvas.layout.table.flexible_column_width_table import FlexibleColumnWidthTable
-from borb.pdf.canvas.layout.table.table import Table, TableCell
-from borb.pdf.canvas.layout.table.table_util import TableUtil
-from borb.pdf.canvas.layout.text.heading import Heading
 
-# Forms
-from borb.pdf.canvas.layout.forms.form_field import FormField
-from borb.pdf.canvas.layout.forms.text_field import TextField
-from borb.pdf.canvas.layout.forms.text_area import TextArea
-from borb.pdf.canvas.layout.forms.drop_down_list import DropDownList
-from borb.pdf.canvas.layout.forms.country_drop_down_list import CountryDropDownList
-from borb.pdf.canvas.layout.forms.check_box import CheckBox
-from borb.pdf.canvas.layout.forms.push_button import PushButton, JavaScriptPushButton
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
 
-# Paragraph
-# from borb.pdf.canvas.layout.text.paragraph import Paragraph
-from borb.pdf.canvas.layout.text.heterogeneous_paragraph import HeterogeneousParagraph
-from borb.pdf.canvas.layout.text.heading import Heading
-from borb.pdf.canvas.layout.text.chunk_of_text import ChunkOfText
-from borb.pdf.canvas.lipsum.lipsum import Lipsum
+    # Cache the value so that __getattr__() isn't called for this name again.
+    globals()[name] = value
+    return value
 
-# Document, Page, PDF
-# from borb.pdf.document.document import Document
-# from borb.pdf.page.page import Page
-from borb.pdf.pdf import PDF
 
-# Additional imports:
-from borb.pdf.canvas.font.simple_font.true_type_font import TrueTypeFont
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_IMPORTS) | set(_SUBMODULES))
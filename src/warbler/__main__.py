@@ -1,4 +1,326 @@
-import warbler
+"""Batch-renders PDFs from a page template and a file of records.
+
+    python -m warbler TEMPLATE RECORDS [--out-dir DIR | --merge FILE] [--jobs N] [--cache DIR]
+
+TEMPLATE is a JSON file describing the page, for example:
+
+    {
+        "size": "letter",
+        "blocks": [
+            {"text": "Invoice {invoice_id}", "style": {"font": "Helvetica-Bold", "font_size": 20}},
+            {"text": "Bill to: {name}"},
+            {"text": "Total: {total}", "style": {"text_alignment": "right"}}
+        ]
+    }
+
+Each block's text has {field} placeholders that are filled in from the
+record, and its optional style has the same settings as Page.add(). RECORDS
+is a JSON Lines or CSV file (or - for stdin), read one record at a time.
+"""
+
+import argparse
+import collections
+import csv
+import io
+import json
+import os
+import sys
+import time
+import typing
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# --merge sends the records to the worker processes in chunks of this many.
+MERGE_CHUNK_SIZE = 16
+
+# What one page of a record's document is made of, for --merge: its width
+# and height, its content stream, and its fonts by resource name (each the
+# index of the template block whose style uses it, or a standard font's
+# name). Unlike pages, these can be sent back from worker processes.
+_PageContents = collections.namedtuple('_PageContents', ['width', 'height', 'content_stream', 'fonts'])
+
+
+class _TemplateBuilder:
+    # Builds a Document for one record from a page template. Instances are
+    # pickled and sent to render_many()'s worker processes, so the template's
+    # ParagraphStyle objects are compiled lazily, once per process.
+    def __init__(self, template: Dict[str, Any]):
+        self.template = template
+        self._styles: Optional[List[Any]] = None
+
+    def __getstate__(self):
+        return {'template': self.template, '_styles': None}
+
+    def _get_styles(self) -> List[Any]:
+        from .style import ParagraphStyle
+
+        if self._styles is None:
+            self._styles = [ParagraphStyle(**block.get('style', {})) for block in self.template['blocks']]
+        return self._styles
+
+    def __call__(self, record: Dict[str, Any]) -> 'Document':
+        from .document import Document, Page
+
+        doc = Document()
+        page = Page(size=self.template.get('size', 'letter'))
+        doc.add_page(page)
+        for block, style in zip(self.template['blocks'], self._get_styles()):
+            page.add(block['text'].format_map(record), style=style)
+        return doc
+
+    def page_contents(self, record: Dict[str, Any]) -> List[_PageContents]:
+        # Builds the record's document, and returns what each of its pages
+        # is made of, so that make_page() can make the page again in another
+        # process.
+        from borb.pdf.canvas.font.simple_font.font_type_1 import StandardType1Font as BorbStandardType1Font
+
+        doc = self(record)
+        styles = self._get_styles()
+        contents = []
+        for page_number in range(int(doc.get_document_info().get_number_of_pages())):
+            page = doc.get_page(page_number)
+            fonts: Dict[str, Union[int, str]] = {}
+            for name, font in page['Resources'].get('Font', {}).items():
+                if isinstance(font, BorbStandardType1Font):
+                    fonts[str(name)] = str(font['BaseFont'])
+                else:
+                    fonts[str(name)] = next(i for i, style in enumerate(styles) if style._borb_kwargs['font'] is font)
+            contents.append(
+                _PageContents(
+                    Decimal(page['MediaBox'][2]),
+                    Decimal(page['MediaBox'][3]),
+                    bytes(page['Contents']['DecodedBytes']),
+                    fonts,
+                )
+            )
+        return contents
+
+    def make_page(self, contents: _PageContents) -> 'Page':
+        # Makes a page from what page_contents() returned for it, with this
+        # process's copies of its fonts.
+        from borb.io.read.types import Dictionary as BorbDictionary, Name as BorbName
+        from .document import Page
+        from .util import _standard_font
+
+        styles = self._get_styles()
+        page = Page(contents.width, contents.height)
+        page._initialize_page_content_stream()
+        page['Resources'][BorbName('Font')] = BorbDictionary()
+        for name, font in contents.fonts.items():
+            page['Resources']['Font'][BorbName(name)] = (
+                _standard_font(font) if isinstance(font, str) else styles[font]._borb_kwargs['font']
+            )
+        page.append_to_content_stream(contents.content_stream.decode('latin1'))
+        return page
+
+    def cache_inputs(self, record: Dict[str, Any]) -> Tuple[Any, ...]:
+        # Everything that the record's PDF is built from, for the --cache
+        # key: the page size and each block's filled-in text and compiled
+        # style (which hashes fonts by their contents). The record's fields
+        # that the template doesn't use aren't part of it.
+        from .document import _pageSizeFromName
+
+        blocks = zip(self.template['blocks'], self._get_styles())
+        return (
+            _pageSizeFromName(self.template.get('size', 'letter')),
+            [(block['text'].format_map(record), style) for block, style in blocks],
+        )
+
+
+class _RecordFilename:
+    # Fills in a filename pattern like "invoice-{invoice_id}.pdf" from the
+    # record's index and fields. (A class rather than a lambda so it can be
+    # pickled for the worker processes.)
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+
+    def __call__(self, index: int, record: Dict[str, Any]) -> str:
+        return self.pattern.format_map(dict(record, index=index))
+
+
+def _read_records(records_file: typing.TextIO, records_format: str) -> Iterator[Dict[str, Any]]:
+    # Yields one record at a time so that the records file never has to fit
+    # in memory.
+    if records_format == 'csv':
+        yield from csv.DictReader(records_file)
+    else:
+        for line in records_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _guess_format(records_filename: str) -> str:
+    return 'csv' if records_filename.lower().endswith('.csv') else 'jsonl'
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))]
+
+
+def _print_summary(rendered: int, failed: int, elapsed: float, durations: List[float]) -> None:
+    durations = sorted(durations)
+    print(
+        'Rendered %d records (%d failed) in %.2f seconds, %.1f records/second.'
+        % (rendered, failed, elapsed, rendered / elapsed if elapsed else 0.0)
+    )
+    print(
+        'Latency per record: p50 %.1f ms, p95 %.1f ms, max %.1f ms.'
+        % (
+            _percentile(durations, 50) * 1000,
+            _percentile(durations, 95) * 1000,
+            (durations[-1] if durations else 0.0) * 1000,
+        )
+    )
+
+
+def _page_contents_chunk(
+    builder: _TemplateBuilder, chunk: List[Tuple[int, Dict[str, Any]]]
+) -> List[Tuple[int, float, Optional[List[_PageContents]], Optional[str]]]:
+    # Returns an (index, duration, page contents, error) tuple for each
+    # record in the chunk, where error is None if the record was built.
+    outcomes = []
+    for index, record in chunk:
+        record_start_time = time.perf_counter()
+        try:
+            contents = builder.page_contents(record)
+        except Exception as exc:
+            outcomes.append((index, 0.0, None, '%s: %s' % (type(exc).__name__, exc)))
+        else:
+            outcomes.append((index, time.perf_counter() - record_start_time, contents, None))
+    return outcomes
+
+
+def _page_contents_in_order(
+    builder: _TemplateBuilder, chunks: Iterable[List[Tuple[int, Dict[str, Any]]]], jobs: int
+) -> Iterator[List[Tuple[int, float, Optional[List[_PageContents]], Optional[str]]]]:
+    # Yields each chunk's outcomes from _page_contents_chunk(), in the order
+    # of the chunks. With more than one job, the chunks are built across a
+    # pool of worker processes, with just enough of them in flight to keep
+    # every worker busy, so the records are still read lazily.
+    if jobs == 1:
+        for chunk in chunks:
+            yield _page_contents_chunk(builder, chunk)
+        return
+
+    import concurrent.futures
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending: typing.Deque[Tuple[List[Tuple[int, Dict[str, Any]]], concurrent.futures.Future]] = collections.deque()
+        chunks = iter(chunks)
+        while True:
+            for chunk in chunks:
+                pending.append((chunk, executor.submit(_page_contents_chunk, builder, chunk)))
+                if len(pending) >= jobs * 2:
+                    break
+            if not pending:
+                return
+            chunk, future = pending.popleft()
+            try:
+                yield future.result()
+            except Exception as exc:
+                # (E.g. a worker process that died.)
+                yield [(index, 0.0, None, '%s: %s' % (type(exc).__name__, exc)) for index, _ in chunk]
+
+
+def _render_merged(builder: _TemplateBuilder, records: Iterator[Dict[str, Any]], merge_filename: str, jobs: int):
+    # Puts every record's pages into one Document, in the order of the
+    # records. The records' documents are built (and laid out) in worker
+    # processes, and their pages are made again in this process from what
+    # they're made of, since pages can't be moved between processes.
+    from .batch import _chunked
+    from .document import Document
+
+    merged_doc = Document()
+    rendered = 0
+    failures = []
+    durations = []
+    start_time = time.perf_counter()
+    for outcomes in _page_contents_in_order(builder, _chunked(enumerate(records), MERGE_CHUNK_SIZE), jobs):
+        for index, duration, contents, error in outcomes:
+            if error is not None:
+                failures.append((index, error))
+                continue
+            for page_contents in contents:
+                merged_doc.add_page(builder.make_page(page_contents))
+            rendered += 1
+            durations.append(duration)
+    merged_doc.save(merge_filename, atomic=True)
+    return rendered, failures, time.perf_counter() - start_time, durations
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m warbler', description='Render one PDF per record from a page template.'
+    )
+    parser.add_argument('template', help='JSON page template file')
+    parser.add_argument('records', help='JSON Lines or CSV records file, or - for stdin')
+    parser.add_argument(
+        '--format', choices=('jsonl', 'csv'), help='format of the records file (default: guessed from its extension)'
+    )
+    output_group = parser.add_mutually_exclusive_group()
+    output_group.add_argument('--out-dir', default='.', help='folder to write one PDF per record into (default: .)')
+    output_group.add_argument('--merge', metavar='FILE', help='write all records into this single PDF instead')
+    parser.add_argument(
+        '--filename',
+        default='{index:06}.pdf',
+        help='filename pattern for --out-dir, filled in from the record index and fields (default: {index:06}.pdf)',
+    )
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=None, help='number of worker processes (default: the number of CPUs)'
+    )
+    parser.add_argument('--cache', metavar='DIR', help='reuse PDFs rendered by earlier runs from this cache folder')
+    parser.add_argument(
+        '--cache-size', metavar='MB', type=int, default=1024, help='size limit of the cache folder (default: 1024)'
+    )
+    args = parser.parse_args(argv)
+    if args.cache and args.merge:
+        parser.error("--cache can't be used with --merge")
+    if args.cache_size < 1:
+        parser.error('--cache-size must be at least 1')
+    if args.jobs is not None and args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+
+    # Only import the rest of Warbler (and borb) after parsing the arguments,
+    # so that --help stays fast.
+    from .batch import render_many
+    from .cache import RenderCache
+
+    with open(args.template, encoding='utf-8') as template_file:
+        builder = _TemplateBuilder(json.load(template_file))
+
+    records_format = args.format or _guess_format(args.records)
+    if args.records == '-':
+        records_file = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+    else:
+        records_file = open(args.records, encoding='utf-8', newline='')
+
+    with records_file:
+        records = _read_records(records_file, records_format)
+        if args.merge:
+            rendered, failures, elapsed, durations = _render_merged(
+                builder, records, args.merge, args.jobs or os.cpu_count() or 1
+            )
+        else:
+            cache = RenderCache(args.cache, max_size=args.cache_size * 1024 * 1024) if args.cache else None
+            result = render_many(
+                builder,
+                records,
+                args.out_dir,
+                workers=args.jobs,
+                filename=_RecordFilename(args.filename),
+                cache=cache,
+                cache_inputs=builder.cache_inputs,
+            )
+            rendered, elapsed, durations = result.rendered, result.elapsed, result.durations
+            failures = [(failure.index, failure.error.strip().splitlines()[-1]) for failure in result.failures]
+
+    for index, error in failures:
+        print('Record %d failed: %s' % (index, error), file=sys.stderr)
+    _print_summary(rendered, len(failures), elapsed, durations)
+    return 1 if failures else 0
+
 
 if __name__ == '__main__':
-    pass
+    sys.exit(main())
@@ -0,0 +1,267 @@
+from .cache import RenderCache, _render_key
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+import secrets
+import threading
+import typing
+import weakref
+
+# The number of renders (and async saves) that run at the same time on each
+# event loop, unless a limiter is passed in. The rest wait their turn, first
+# come first served, so a burst of large documents can't tie up every
+# executor worker while small ones pile up behind them. This is also the
+# number of worker processes in the pool that render_async() uses by default.
+MAX_CONCURRENT_RENDERS = os.cpu_count() or 1
+
+# Async writers are sent the PDF in chunks of this many bytes. (The same as
+# Document.save() uses for file-like objects.)
+_CHUNK_SIZE = 64 * 1024
+
+_default_limiters: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]' = (
+    weakref.WeakKeyDictionary()
+)
+
+# render_async()'s default executor, made the first time it's needed (and
+# again if a worker process dies, or in a forked child process), and the id
+# of the process that made it.
+_default_process_pool: Optional[ProcessPoolExecutor] = None
+_default_process_pool_pid: Optional[int] = None
+_default_process_pool_lock = threading.Lock()
+
+FileType = Union[str, Path, typing.BinaryIO, Any]
+
+
+async def render_async(
+    build_fn: Callable[[Any], Any],
+    record: Any,
+    file: Optional[FileType] = None,
+    executor: Optional[Executor] = None,
+    limiter: Optional[asyncio.Semaphore] = None,
+    cache: Optional[RenderCache] = None,
+    cache_inputs: Optional[Callable[[Any], Any]] = None,
+    **save_kwargs,
+) -> Optional[bytes]:
+    # Calls build_fn(record) and saves the Document it returns, in an
+    # executor, so that the event loop keeps serving other requests in the
+    # meantime. The file is a filename, a binary file-like object, or an
+    # async writer (anything with an async write() method, or a write() and
+    # an async drain() method like asyncio.StreamWriter), which the PDF is
+    # sent to in chunks, waiting whenever the writer falls behind. If file is
+    # None, the PDF's bytes are returned instead. The other keyword arguments
+    # are passed to Document.save().
+    #
+    # If executor is None, the document is built and saved in a pool of
+    # MAX_CONCURRENT_RENDERS worker processes that's shared by every render
+    # in this process, so build_fn and record must be picklable. Only
+    # processes render in parallel: each process writes one document at a
+    # time, since documents can share fonts and other objects (see
+    # compress._write_lock). So with a thread executor, documents are built
+    # in parallel, but their saves take turns. A worker process saves
+    # straight to a filename, and sends the PDF back in one piece for any
+    # other file, which is then sent to an async writer in chunks. limiter
+    # is an asyncio.Semaphore that limits how many renders run at once; by
+    # default, renders on the same event loop share one that allows
+    # MAX_CONCURRENT_RENDERS.
+    #
+    # With a RenderCache, the PDF is looked up in the cache (under the same
+    # key that render_many() uses, which also includes the save arguments,
+    # and with the same rules for build_fn and cache_inputs) before waiting
+    # for the limiter, so that hits are never held up behind renders. On a
+    # miss, the PDF is rendered to bytes and stored in the cache before it's
+    # written to the file.
+    if executor is None:
+        executor = _get_default_process_pool()
+    if cache is not None:
+        return await _render_cached(build_fn, record, file, executor, limiter, cache, cache_inputs, save_kwargs)
+    async with limiter or _default_limiter():
+        if isinstance(executor, ProcessPoolExecutor):
+            return await _render_in_process(build_fn, record, file, executor, save_kwargs)
+        return await _run_save(lambda: build_fn(record), file, executor, save_kwargs)
+
+
+async def _save_async(
+    document: Any,
+    file: FileType,
+    executor: Optional[Executor],
+    limiter: Optional[asyncio.Semaphore],
+    save_kwargs: typing.Dict[str, Any],
+) -> None:
+    # Document.save_async(): a Document can't be sent to another process, so
+    # this needs an executor that runs in this one, and saves in the same
+    # process take turns (see _run_save()).
+    if isinstance(executor, ProcessPoolExecutor):
+        raise ValueError('save_async() needs a thread executor; use render_async() to build documents in processes')
+    async with limiter or _default_limiter():
+        await _run_save(lambda: document, file, executor, save_kwargs)
+
+
+def _get_default_process_pool() -> ProcessPoolExecutor:
+    global _default_process_pool, _default_process_pool_pid
+
+    with _default_process_pool_lock:
+        pool = _default_process_pool
+        # (A pool whose worker process died fails everything it's given.)
+        if pool is None or _default_process_pool_pid != os.getpid() or getattr(pool, '_broken', False):
+            pool = _default_process_pool = ProcessPoolExecutor(max_workers=MAX_CONCURRENT_RENDERS)
+            _default_process_pool_pid = os.getpid()
+        return pool
+
+
+def _default_limiter() -> asyncio.Semaphore:
+    # (A Semaphore belongs to the event loop that first waits on it, so each
+    # loop gets its own.)
+    loop = asyncio.get_running_loop()
+    limiter = _default_limiters.get(loop)
+    if limiter is None:
+        limiter = _default_limiters[loop] = asyncio.Semaphore(MAX_CONCURRENT_RENDERS)
+    return limiter
+
+
+def _is_async_writer(file: Any) -> bool:
+    return hasattr(file, 'drain') or inspect.iscoroutinefunction(getattr(file, 'write', None))
+
+
+async def _write_to_async_writer(writer: Any, data: bytes) -> None:
+    result = writer.write(data)
+    if inspect.isawaitable(result):
+        await result
+    drain = getattr(writer, 'drain', None)
+    if drain is not None:
+        await drain()
+
+
+def _run_in_executor(executor: Optional[Executor], function: Callable[[], Any]) -> 'asyncio.Future[Any]':
+    # Like loop.run_in_executor(), but the function runs in a copy of the
+    # current context (like asyncio.to_thread()), so that an active Profile
+    # measures it.
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(executor, context.run, function)
+
+
+async def _run_save(
+    get_document: Callable[[], Any],
+    file: Optional[FileType],
+    executor: Optional[Executor],
+    save_kwargs: typing.Dict[str, Any],
+) -> Optional[bytes]:
+    # Gets the document and saves it to file in the executor, which runs in
+    # this process. Each process writes one document at a time (see
+    # compress._write_lock), so for an async writer, the PDF is written to
+    # memory first, and then sent to the writer in chunks, waiting whenever
+    # it falls behind. (Streaming it while it's written would hold up every
+    # other save in the process while a slow client reads it.)
+    if file is None:
+        return await _run_in_executor(executor, lambda: get_document().to_bytes(**save_kwargs))
+    if not _is_async_writer(file):
+        await _run_in_executor(executor, lambda: get_document().save(file, **save_kwargs))
+        return None
+
+    save_kwargs = dict(save_kwargs)
+    if save_kwargs.pop('atomic', False):
+        raise ValueError('atomic saves need a filename, not a file-like object')
+    pdf_bytes = await _run_in_executor(executor, lambda: get_document().to_bytes(**save_kwargs))
+    return await _write_bytes(pdf_bytes, file)
+
+
+async def _render_in_process(
+    build_fn: Callable[[Any], Any],
+    record: Any,
+    file: Optional[FileType],
+    executor: ProcessPoolExecutor,
+    save_kwargs: typing.Dict[str, Any],
+) -> Optional[bytes]:
+    loop = asyncio.get_running_loop()
+    if isinstance(file, (str, Path)):
+        await loop.run_in_executor(executor, functools.partial(_render_to_file, build_fn, record, file, save_kwargs))
+        return None
+
+    pdf_bytes = await loop.run_in_executor(executor, functools.partial(_render_to_bytes, build_fn, record, save_kwargs))
+    return await _write_bytes(pdf_bytes, file)
+
+
+async def _render_cached(
+    build_fn: Callable[[Any], Any],
+    record: Any,
+    file: Optional[FileType],
+    executor: Optional[Executor],
+    limiter: Optional[asyncio.Semaphore],
+    cache: RenderCache,
+    cache_inputs: Optional[Callable[[Any], Any]],
+    save_kwargs: typing.Dict[str, Any],
+) -> Optional[bytes]:
+    # (to_bytes() doesn't take the atomic argument, so _write_bytes() handles it.)
+    save_kwargs = dict(save_kwargs)
+    atomic = save_kwargs.pop('atomic', False)
+    if atomic and not isinstance(file, (str, Path)):
+        raise ValueError('atomic saves need a filename, not a file-like object')
+
+    def look_up() -> typing.Tuple[str, Optional[bytes]]:
+        key = _render_key(build_fn, record, cache_inputs, save_kwargs)
+        return key, cache.get(key)
+
+    key, pdf_bytes = await _run_in_executor(None, look_up)
+    if pdf_bytes is None:
+        async with limiter or _default_limiter():
+            if isinstance(executor, ProcessPoolExecutor):
+                pdf_bytes = await _render_in_process(build_fn, record, None, executor, save_kwargs)
+            else:
+                pdf_bytes = await _run_save(lambda: build_fn(record), None, executor, save_kwargs)
+        await _run_in_executor(None, functools.partial(cache.put, key, pdf_bytes))
+    return await _write_bytes(pdf_bytes, file, atomic)
+
+
+async def _write_bytes(pdf_bytes: bytes, file: Optional[FileType], atomic: bool = False) -> Optional[bytes]:
+    # Writes an already rendered PDF to the file, or returns it if file is
+    # None.
+    loop = asyncio.get_running_loop()
+    if file is None:
+        return pdf_bytes
+    if isinstance(file, (str, Path)):
+        await loop.run_in_executor(None, _write_file, file, pdf_bytes, atomic)
+        return None
+    if not _is_async_writer(file):
+        await loop.run_in_executor(None, file.write, pdf_bytes)
+        return None
+    for start in range(0, len(pdf_bytes), _CHUNK_SIZE):
+        await _write_to_async_writer(file, pdf_bytes[start : start + _CHUNK_SIZE])
+    return None
+
+
+def _write_file(filename: Union[str, Path], pdf_bytes: bytes, atomic: bool) -> None:
+    if not atomic:
+        with open(filename, 'wb') as pdf_file_handle:
+            pdf_file_handle.write(pdf_bytes)
+        return
+
+    # (The same as an atomic Document.save().)
+    folder, basename = os.path.split(os.path.abspath(filename))
+    temp_filename = os.path.join(folder, '.%s.%s.tmp' % (basename, secrets.token_hex(4)))
+    try:
+        with open(temp_filename, 'xb') as pdf_file_handle:
+            pdf_file_handle.write(pdf_bytes)
+            pdf_file_handle.flush()
+            os.fsync(pdf_file_handle.fileno())
+        os.replace(temp_filename, filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+
+
+def _render_to_bytes(build_fn: Callable[[Any], Any], record: Any, save_kwargs: typing.Dict[str, Any]) -> bytes:
+    # Runs in a worker process.
+    return build_fn(record).to_bytes(**save_kwargs)
+
+
+def _render_to_file(
+    build_fn: Callable[[Any], Any], record: Any, file: Union[str, Path], save_kwargs: typing.Dict[str, Any]
+) -> None:
+    # Runs in a worker process.
+    build_fn(record).save(file, **save_kwargs)
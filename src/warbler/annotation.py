@@ -1,13 +1,25 @@
+from borb.pdf.canvas.layout.annotation.annotation import Annotation as BorbAnnotation
 from borb.pdf.canvas.layout.annotation.square_annotation import SquareAnnotation as BorbSquareAnnotation
 from borb.pdf.canvas.color.color import Color as BorbColor
 from borb.pdf.canvas.geometry.rectangle import Rectangle as BorbRectangle
+from borb.io.read.types import List as BorbList, Name as BorbName
 
+import itertools
+import math
+import numbers
 import typing
-from typing import Optional, Union, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Union, Tuple
 from decimal import Decimal
 
 from .warblertypes import RectangleType, ColorType, NumberType
-from .util import _normalize_rectangle, _normalize_color
+from .util import _normalize_rectangle, _normalize_color, normalize_colors
+from .util import _LeanDecimal, _LeanDictionary, _LeanList, _LeanString
+
+# The names in a square annotation's dictionary, shared by all of the
+# annotations that Page.add_square_annotations() adds.
+_TYPE, _ANNOT, _RECT, _NM, _M, _F, _C, _SUBTYPE, _SQUARE, _IC, _P = (
+    BorbName(name) for name in ('Type', 'Annot', 'Rect', 'NM', 'M', 'F', 'C', 'Subtype', 'Square', 'IC', 'P')
+)
 
 
 class SquareAnnotation(BorbSquareAnnotation):
@@ -19,8 +31,10 @@ class SquareAnnotation(BorbSquareAnnotation):
         rectangle_difference: Optional[Tuple[NumberType, NumberType, NumberType, NumberType]] = None,
     ):
         bounding_box = _normalize_rectangle(bounding_box)
-        fill_color = _normalize_color(fill_color)
-        stroke_color = _normalize_color(stroke_color)
+        if fill_color is not None:
+            fill_color = _normalize_color(fill_color)
+        if stroke_color is not None:
+            stroke_color = _normalize_color(stroke_color)
         if rectangle_difference is not None:
             rectangle_difference = (
                 Decimal(rectangle_difference[0]),
@@ -35,3 +49,122 @@ class SquareAnnotation(BorbSquareAnnotation):
             stroke_color=stroke_color,
             rectangle_difference=rectangle_difference,
         )
+
+
+def _add_square_annotations(page: Any, rectangles: Any, fill_color: Any, stroke_color: Any) -> None:
+    # Page.add_square_annotations(): adds the same dictionaries to the page's
+    # annotations that SquareAnnotation and Page.add_annotation() would, but
+    # all of the rectangles are checked at once, and everything that's the
+    # same for every annotation (the names, the timestamp, the flags, each
+    # distinct color's array, and each distinct number) is made once and
+    # shared between them. That leaves a dictionary, its rectangle's array,
+    # and its name (which has to be unique) for each annotation, which are
+    # made without borb's per-object methods (see util._LeanObject).
+    rows = _rectangle_rows(rectangles)
+    numbers_by_value: Dict[Decimal, _LeanDecimal] = {}  # Numbers that repeat (e.g. on a grid) share one object.
+    stroke_colors = _color_arrays(stroke_color, len(rows), numbers_by_value)
+    fill_colors = _color_arrays(fill_color, len(rows), numbers_by_value)
+
+    if 'Annots' not in page:
+        page[BorbName('Annots')] = BorbList()
+        page['Annots'].set_parent(page)
+    annotations = page['Annots']
+    timestamp = _LeanString(BorbAnnotation._timestamp_to_str())
+    flags = _LeanDecimal(4)
+
+    for index, row, stroke, fill in zip(itertools.count(len(annotations)), rows, stroke_colors, fill_colors):
+        # (Decimal arithmetic, like borb's, so that the numbers round the
+        # same way when they're written.)
+        x, y = Decimal(row[0]), Decimal(row[1])
+        rect = _LeanList().set_is_inline(True)
+        for value in (x, y, x + Decimal(row[2]), y + Decimal(row[3])):
+            rect.append(_shared_number(value, numbers_by_value))
+
+        annotation = _LeanDictionary()
+        annotation[_TYPE] = _ANNOT
+        annotation[_RECT] = rect
+        annotation[_NM] = _LeanString('annotation-%03d' % index)
+        annotation[_M] = timestamp
+        annotation[_F] = flags
+        if stroke is not None:
+            annotation[_C] = stroke
+        annotation[_SUBTYPE] = _SQUARE
+        if fill is not None:
+            annotation[_IC] = fill
+        annotation[_P] = page
+        annotations.append(annotation)
+
+
+def _rectangle_rows(rectangles: Any) -> List[Sequence[Any]]:
+    # Returns the (x, y, width, height) of each rectangle, from a sequence of
+    # them, a flat sequence of 4 numbers per rectangle, or a NumPy-style array
+    # of either shape (anything with a tolist() method, like array.array).
+    # Raises ValueError if any of them isn't 4 finite numbers or has a
+    # negative width or height.
+    if hasattr(rectangles, 'tolist'):
+        rectangles = rectangles.tolist()  # (One call converts the whole array, instead of one per number.)
+    rectangles = list(rectangles)
+    if rectangles and isinstance(rectangles[0], numbers.Number):
+        if len(rectangles) % 4 != 0:
+            raise ValueError(
+                'a flat sequence of rectangles must have 4 numbers per rectangle, not %d numbers' % len(rectangles)
+            )
+        rows: List[Sequence[Any]] = list(zip(*[iter(rectangles)] * 4))
+    else:
+        rows = [
+            (row.get_x(), row.get_y(), row.get_width(), row.get_height()) if isinstance(row, BorbRectangle) else row
+            for row in rectangles
+        ]
+        if any(len(row) != 4 for row in rows):
+            raise ValueError('each rectangle must be 4 numbers: x, y, width, and height')
+
+    try:
+        is_finite = all(map(math.isfinite, itertools.chain.from_iterable(rows)))
+    except (TypeError, ValueError, OverflowError):
+        is_finite = False
+    if not is_finite:
+        raise ValueError('the rectangles must be made of finite numbers')
+    for index, row in enumerate(rows):
+        if row[2] < 0 or row[3] < 0:
+            raise ValueError('rectangle %d has a negative width or height' % index)
+    return rows
+
+
+def _shared_number(value: Decimal, numbers_by_value: Dict[Decimal, _LeanDecimal]) -> _LeanDecimal:
+    number = numbers_by_value.get(value)
+    if number is None:
+        number = numbers_by_value[value] = _LeanDecimal(value)
+    return number
+
+
+def _color_arrays(
+    color: Any, count: int, numbers_by_value: Dict[Decimal, _LeanDecimal]
+) -> List[Optional[BorbList]]:
+    # Returns the color array for each of count annotations, from one color
+    # for all of them or a sequence (or array) of count colors. Each distinct
+    # color's array is made once, and shared by the annotations that use it.
+    if color is None:
+        return [None] * count
+    if hasattr(color, 'tolist'):
+        color = color.tolist()
+    if isinstance(color, (str, BorbColor)) or (len(color) == 3 and isinstance(color[0], numbers.Number)):
+        return [_color_array(_normalize_color(color), numbers_by_value)] * count
+
+    colors = normalize_colors(color)
+    if len(colors) != count:
+        raise ValueError(
+            'there must be one color per rectangle, not %d colors for %d rectangles' % (len(colors), count)
+        )
+    arrays: Dict[int, BorbList] = {}  # By the id of the (interned) color.
+    for normalized in colors:
+        if id(normalized) not in arrays:
+            arrays[id(normalized)] = _color_array(normalized, numbers_by_value)
+    return [arrays[id(normalized)] for normalized in colors]
+
+
+def _color_array(color: BorbColor, numbers_by_value: Dict[Decimal, _LeanDecimal]) -> BorbList:
+    rgb = color.to_rgb()
+    array = _LeanList().set_is_inline(True)
+    for value in (rgb.red, rgb.green, rgb.blue):
+        array.append(_shared_number(value, numbers_by_value))
+    return array
@@ -0,0 +1,248 @@
+import collections
+import concurrent.futures
+import itertools
+import os
+import time
+import traceback
+from collections import namedtuple
+from pathlib import Path
+import typing
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple, Union
+
+from .cache import RenderCache, _build_fn_identity, _render_key
+from .document import Document
+from .util import _normalize_font, preload_hyphenation
+
+# A record that build_fn() or Document.save() raised an exception for. The
+# error is the formatted traceback, since exceptions from worker processes
+# can't always be pickled.
+RenderFailure = namedtuple('RenderFailure', ['index', 'error'])
+
+# The outcome of a render_many() call. durations has the number of seconds
+# each successfully rendered record took to build and save.
+RenderResult = namedtuple('RenderResult', ['rendered', 'failures', 'durations', 'elapsed'])
+
+FilenameType = Union[str, Callable[[int, Any], str]]
+
+
+def render_many(
+    build_fn: Callable[[Any], Document],
+    records: Iterable[Any],
+    out_dir: Union[str, Path],
+    workers: Optional[int] = None,
+    filename: FilenameType = '{index:06}.pdf',
+    fonts: Iterable[Union[str, Path]] = (),
+    hyphenation: Iterable[str] = (),
+    progress: Optional[Callable[[int, int], None]] = None,
+    chunk_size: int = 16,
+    cache: Optional[RenderCache] = None,
+    cache_inputs: Optional[Callable[[Any], Any]] = None,
+) -> RenderResult:
+    # Renders one PDF per record across a pool of worker processes. build_fn
+    # is called with each record and returns a Document, which is saved in
+    # out_dir. The filename is either a format string (given the record's
+    # index as `index`) or a function that takes the index and record.
+    #
+    # build_fn must be picklable (a module-level function, not a lambda) so
+    # that it can be sent to the worker processes. Pass workers=1 to render
+    # in the current process instead. The TrueType fonts in fonts and the
+    # hyphenation patterns for the language codes in hyphenation are loaded
+    # once in each worker, when the worker starts.
+    #
+    # A record that fails doesn't stop the batch: its traceback is collected
+    # in the RenderResult's failures. A record that can't be pickled fails
+    # every record in its chunk, and a record that kills its worker process
+    # fails on its own (see _render_in_pool()). progress, if given, is called
+    # with the number of rendered and failed records each time a chunk of
+    # records finishes.
+    #
+    # With a RenderCache, a record whose PDF is already in the cache is
+    # written from it without calling build_fn. The cache key is made from
+    # build_fn's name and code and the record. That is only enough for
+    # module-level functions (and partials of them); other build functions
+    # need cache_inputs: a function (picklable, like build_fn) that returns
+    # everything the record's document is built from (see cache_key()) for
+    # the key to be made from instead of the record. Clear the cache when a
+    # function that build_fn calls changes.
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError('workers must be at least 1')
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be at least 1')
+
+    if cache is not None:
+        _build_fn_identity(build_fn, cache_inputs is not None)  # (Raises ValueError if build_fn can't be cached.)
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    fonts = tuple(fonts)
+    hyphenation = tuple(hyphenation)
+
+    rendered = 0
+    failures: List[RenderFailure] = []
+    durations: List[float] = []
+    start_time = time.perf_counter()
+
+    def collect(outcomes):
+        nonlocal rendered
+        for index, duration, error in outcomes:
+            if error is None:
+                rendered += 1
+                durations.append(duration)
+            else:
+                failures.append(RenderFailure(index, error))
+        if progress is not None:
+            progress(rendered, len(failures))
+
+    # The records are read lazily, one chunk at a time, so that a huge
+    # iterable (like a file being read line by line) never has to fit in
+    # memory all at once.
+    chunks = _chunked(enumerate(records), chunk_size)
+
+    if workers == 1:
+        _init_worker(fonts, hyphenation)
+        for chunk in chunks:
+            collect(_render_chunk(build_fn, out_dir, filename, chunk, cache, cache_inputs))
+    else:
+        _render_in_pool(
+            workers, (fonts, hyphenation), (build_fn, out_dir, filename), (cache, cache_inputs), chunks, collect
+        )
+
+    failures.sort()
+    return RenderResult(rendered, failures, durations, time.perf_counter() - start_time)
+
+
+def _chunked(iterable: Iterable[Any], chunk_size: int) -> typing.Iterator[List[Any]]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _render_in_pool(
+    workers: int,
+    init_args: Tuple[Any, ...],
+    render_args: Tuple[Any, ...],
+    cache_args: Tuple[Any, ...],
+    chunks: Iterable[List[Tuple[int, Any]]],
+    collect: Callable[[List[Tuple[int, float, Optional[str]]]], None],
+) -> None:
+    # Renders the chunks across a pool of worker processes, with just enough
+    # chunks in flight to keep every worker busy, and passes each chunk's
+    # outcomes to collect().
+    #
+    # A worker process that dies (e.g. from a segfault, or running out of
+    # memory) breaks the whole pool, and every chunk that was in flight fails
+    # with it, even though only one record was at fault. So a new pool is
+    # started, and the records of those chunks are rendered again, each in a
+    # chunk of its own. A record that was in flight both times the pool broke
+    # is then rendered while nothing else is, and only fails if it breaks the
+    # pool again.
+    chunks = iter(chunks)
+    retries: Deque[Tuple[List[Tuple[int, Any]], int]] = collections.deque()  # (chunk, times the pool broke on it)
+    pending: Dict[concurrent.futures.Future, Tuple[List[Tuple[int, Any]], int]] = {}
+    executor = None
+    try:
+        while True:
+            if executor is None:
+                executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=workers, initializer=_init_worker, initargs=init_args
+                )
+            is_broken = False
+            while len(pending) < workers * 2 and not any(breaks >= 2 for _, breaks in pending.values()):
+                if retries:
+                    if retries[0][1] >= 2 and pending:
+                        break  # (Wait for the pool to be free for a record that is rendered on its own.)
+                    chunk, breaks = retries.popleft()
+                else:
+                    chunk, breaks = next(chunks, None), 0
+                    if chunk is None:
+                        break
+                try:
+                    future = executor.submit(_render_chunk, *render_args, chunk, *cache_args)
+                except concurrent.futures.BrokenExecutor:
+                    retries.appendleft((chunk, breaks))
+                    is_broken = True
+                    break
+                pending[future] = (chunk, breaks)
+            if not pending and not retries:
+                return
+
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            if is_broken or any(isinstance(future.exception(), concurrent.futures.BrokenExecutor) for future in done):
+                is_broken = True
+                done, _ = concurrent.futures.wait(pending)  # (Every future fails quickly once the pool is broken.)
+            for future in done:
+                chunk, breaks = pending.pop(future)
+                try:
+                    outcomes = future.result()
+                except concurrent.futures.BrokenExecutor:
+                    if breaks >= 2:
+                        outcomes = _chunk_failed(chunk)
+                    elif breaks == 1:
+                        retries.appendleft((chunk, 2))
+                        continue
+                    else:
+                        retries.extend(([record], 1) for record in chunk)
+                        continue
+                except Exception:
+                    outcomes = _chunk_failed(chunk)  # (E.g. a record that can't be pickled.)
+                collect(outcomes)
+            if is_broken:
+                executor.shutdown()
+                executor = None
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def _chunk_failed(chunk: List[Tuple[int, Any]]) -> List[Tuple[int, float, Optional[str]]]:
+    # The outcomes of a chunk that couldn't be rendered at all, with the
+    # traceback of the exception being handled as each record's error.
+    error = traceback.format_exc()
+    return [(index, 0.0, error) for index, _ in chunk]
+
+
+def _init_worker(fonts: Tuple[Union[str, Path], ...], hyphenation: Tuple[str, ...]) -> None:
+    # Runs once in each worker process, so that fonts and hyphenation
+    # patterns are loaded once per worker instead of once per record.
+    for font in fonts:
+        _normalize_font(font)
+    preload_hyphenation(*hyphenation)
+
+
+def _render_chunk(
+    build_fn: Callable[[Any], Document],
+    out_dir: Path,
+    filename: FilenameType,
+    chunk: List[Tuple[int, Any]],
+    cache: Optional[RenderCache] = None,
+    cache_inputs: Optional[Callable[[Any], Any]] = None,
+) -> List[Tuple[int, float, Optional[str]]]:
+    # Returns an (index, duration, error) tuple for each record in the chunk,
+    # where error is None if the record was rendered successfully.
+    outcomes = []
+    for index, record in chunk:
+        record_start_time = time.perf_counter()
+        try:
+            if isinstance(filename, str):
+                record_filename = filename.format(index=index)
+            else:
+                record_filename = filename(index, record)
+            if cache is None:
+                build_fn(record).save(out_dir / record_filename)
+            else:
+                key = _render_key(build_fn, record, cache_inputs)
+                pdf_bytes = cache.get(key)
+                if pdf_bytes is None:
+                    pdf_bytes = build_fn(record).to_bytes()
+                    cache.put(key, pdf_bytes)
+                (out_dir / record_filename).write_bytes(pdf_bytes)
+        except Exception:
+            outcomes.append((index, 0.0, traceback.format_exc()))
+        else:
+            outcomes.append((index, time.perf_counter() - record_start_time, None))
+    return outcomes
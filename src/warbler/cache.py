@@ -0,0 +1,389 @@
+from borb.pdf.canvas.color.color import Color as BorbColor
+from borb.pdf.canvas.font.font import Font as BorbFont
+from borb.pdf.canvas.layout.hyphenation.hyphenation import Hyphenation as BorbHyphenation
+from PIL import Image as PILImage
+
+from . import __version__
+from .images import _image_digest
+from .style import ParagraphSpec, ParagraphStyle
+from .subset import _get_font_file
+from .util import _SharedHyphenation
+
+from decimal import Decimal
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import functools
+import hashlib
+import importlib.metadata
+import os
+import re
+import sys
+import threading
+import time
+import types
+import uuid
+
+# The default size limit of a RenderCache's folder, in bytes.
+RENDER_CACHE_MAX_SIZE = 1024 * 1024 * 1024
+
+# When the cache grows past its size limit, the least recently used PDFs are
+# deleted until it's down to this fraction of the limit, so that eviction
+# (which lists the whole folder) doesn't happen again on the very next put.
+_EVICTION_TARGET = 0.9
+
+# Other processes sharing a cache's folder store PDFs in it too, so each
+# process lists the folder again (and evicts if it's too big) once it has
+# stored this fraction of max_size since it last listed it. With N processes
+# sharing the folder, it can only grow past max_size by N times this fraction
+# of it (plus one PDF per process).
+_RELIST_FRACTION = 1 / 32
+
+# Temporary files older than this many seconds were left behind by a process
+# that crashed while writing them, and are deleted during eviction.
+_STALE_TEMP_FILE_AGE = 600
+
+_KEY_REGEX = re.compile(r'^[0-9a-f]{64}$')
+
+# Hashing a font's whole font file for every key would cost more than the
+# rest of the key, so each font's hash is remembered (along with the font, so
+# that its id can't be reused by another font).
+_FONT_DIGESTS_MAX_SIZE = 256
+_font_digests: Dict[int, Tuple[Any, bytes]] = {}
+_font_digests_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _borb_version() -> str:
+    # (Looking up a package's version reads its metadata from disk.)
+    try:
+        return importlib.metadata.version('borb')
+    except importlib.metadata.PackageNotFoundError:
+        return ''
+
+
+def cache_key(*inputs: Any) -> str:
+    """Returns a stable hash of a document's build inputs, for use as a RenderCache key."""
+    # The inputs can be None, bools, numbers, strs, bytes, lists, tuples,
+    # sets, dicts, enums (like Alignment), borb colors, fonts, and
+    # hyphenation objects, ParagraphStyles, ParagraphSpecs, PIL images, and
+    # Paths, which are hashed by the contents of the file. Fonts and images
+    # are hashed by their contents too, so a key only matches if they haven't
+    # changed. The Warbler and borb versions are part of every key, since
+    # upgrading either one can change the PDF.
+    digest = hashlib.sha256()
+    _update_digest(digest, ('warbler', __version__, 'borb', _borb_version()))
+    _update_digest(digest, inputs)
+    return digest.hexdigest()
+
+
+def _item_digest(value: Any) -> bytes:
+    # The hash of a set item or dict key on its own, which they're sorted by.
+    digest = hashlib.sha256()
+    _update_digest(digest, value)
+    return digest.digest()
+
+
+def _update_digest(digest: Any, value: Any) -> None:
+    # Every value is written with a type tag and, for variable-length values,
+    # its length, so that different inputs can't run together into the same
+    # bytes (e.g. ('ab', 'c') and ('a', 'bc')).
+    if value is None or isinstance(value, bool):
+        _update_tagged(digest, b'c', repr(value).encode('ascii'))
+    elif isinstance(value, Enum):
+        _update_tagged(digest, b'e', ('%s.%s' % (type(value).__qualname__, value.name)).encode('utf-8'))
+    elif isinstance(value, int):
+        _update_tagged(digest, b'i', str(value).encode('ascii'))
+    elif isinstance(value, float):
+        _update_tagged(digest, b'f', repr(value).encode('ascii'))
+    elif isinstance(value, Decimal):
+        _update_tagged(digest, b'd', str(value).encode('ascii'))
+    elif isinstance(value, str):
+        _update_tagged(digest, b's', value.encode('utf-8', 'surrogatepass'))
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        _update_tagged(digest, b'b', bytes(value))
+    elif isinstance(value, ParagraphStyle):
+        _update_tagged(digest, b'y', b'')
+        _update_digest(digest, value._borb_kwargs)
+    elif isinstance(value, ParagraphSpec):
+        _update_tagged(digest, b'p', b'')
+        _update_digest(digest, (value.text, value.style))
+    elif isinstance(value, BorbColor):
+        # (A color's class decides whether it's written as RGB, CMYK, or gray.)
+        _update_tagged(digest, b'r', type(value).__qualname__.encode('utf-8'))
+        _update_digest(digest, sorted(vars(value).items()))
+    elif isinstance(value, BorbFont):
+        # (Checked before dicts, since borb fonts are PDF dictionaries.)
+        _update_tagged(digest, b'n', _font_digest(value))
+    elif isinstance(value, _SharedHyphenation):
+        _update_tagged(digest, b'h', value.iso_language_code.encode('utf-8'))
+    elif isinstance(value, PILImage.Image):
+        _update_tagged(digest, b'g', _image_digest(value))
+    elif isinstance(value, Path):
+        _update_tagged(digest, b'a', _file_digest(value))
+    elif isinstance(value, (list, tuple)):
+        _update_tagged(digest, b'l', str(len(value)).encode('ascii'))
+        for item in value:
+            _update_digest(digest, item)
+    elif isinstance(value, (set, frozenset)):
+        # (Set items have no order, so they're sorted by their own hashes.)
+        _update_tagged(digest, b't', b''.join(sorted(_item_digest(item) for item in value)))
+    elif isinstance(value, dict):
+        _update_tagged(digest, b'm', str(len(value)).encode('ascii'))
+        for item_key, item_value in sorted(value.items(), key=lambda item: _item_digest(item[0])):
+            _update_digest(digest, item_key)
+            _update_digest(digest, item_value)
+    elif isinstance(value, BorbHyphenation):
+        raise TypeError('only hyphenation made from a language code can be part of a cache key')
+    else:
+        raise TypeError('%s objects can\'t be part of a cache key' % (type(value).__name__,))
+
+
+def _update_tagged(digest: Any, tag: bytes, data: bytes) -> None:
+    digest.update(tag)
+    digest.update(str(len(data)).encode('ascii'))
+    digest.update(b':')
+    digest.update(data)
+
+
+def _font_digest(font: BorbFont) -> bytes:
+    with _font_digests_lock:
+        cached = _font_digests.get(id(font))
+        if cached is not None and cached[0] is font:
+            return cached[1]
+
+    font_file = _get_font_file(font)
+    if font_file is not None:
+        font_digest = hashlib.sha256(font_file['DecodedBytes']).digest()
+    else:
+        # A standard font, which isn't embedded, is the same as any other
+        # font with its name.
+        font_digest = ('%s %s' % (type(font).__qualname__, font.get('BaseFont', ''))).encode('utf-8')
+
+    with _font_digests_lock:
+        if len(_font_digests) >= _FONT_DIGESTS_MAX_SIZE:
+            _font_digests.clear()
+        _font_digests[id(font)] = (font, font_digest)
+    return font_digest
+
+
+def _file_digest(path: Path) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _render_key(
+    build_fn: Callable[[Any], Any],
+    record: Any,
+    cache_inputs: Optional[Callable[[Any], Any]],
+    save_kwargs: Optional[Dict[str, Any]] = None,
+) -> str:
+    # The key that render_many() and render_async() cache a record's PDF
+    # under: build_fn's identity, the record (or what cache_inputs() returns
+    # for it), and the keyword arguments for Document.save().
+    inputs = record if cache_inputs is None else cache_inputs(record)
+    return cache_key(_build_fn_identity(build_fn, cache_inputs is not None), inputs, save_kwargs or {})
+
+
+def _build_fn_identity(build_fn: Callable[[Any], Any], has_cache_inputs: bool) -> Tuple[Any, ...]:
+    # Tells build functions apart by their names and a hash of their code,
+    # so that editing a build function's body changes its keys. (Changes to
+    # the functions that it calls don't, though.)
+    #
+    # Without cache_inputs, the record is the only other input, so build_fn
+    # must be a module-level function, or a functools.partial of one (whose
+    # arguments become part of the key). Lambdas, nested functions, and
+    # callable objects can have state that the key can't see, like the
+    # variables they close over or the object's attributes, so they need
+    # cache_inputs to return everything the document is built from.
+    if isinstance(build_fn, functools.partial):
+        return (
+            'partial',
+            _build_fn_identity(build_fn.func, has_cache_inputs),
+            build_fn.args,
+            build_fn.keywords,
+        )
+    if isinstance(build_fn, types.FunctionType):
+        function = build_fn
+        has_state = '<lambda>' in function.__qualname__ or '<locals>' in function.__qualname__
+    else:
+        # A bound method or a callable object.
+        function = getattr(build_fn, '__func__', None) or getattr(type(build_fn), '__call__', None)
+        has_state = True
+    if has_state and not has_cache_inputs:
+        raise ValueError(
+            'build_fn must be a module-level function to be cached by its records; pass cache_inputs for %r'
+            % (build_fn,)
+        )
+    if not isinstance(function, types.FunctionType):
+        raise ValueError('build_fn %r has no Python code to make a cache key from' % (build_fn,))
+    return (function.__module__, function.__qualname__, sys.implementation.cache_tag, _code_digest(function.__code__))
+
+
+def _code_digest(code: types.CodeType) -> bytes:
+    # A hash of a function's bytecode, and of the constants and names that
+    # it uses, including those of the functions and classes nested in it.
+    digest = hashlib.sha256(code.co_code)
+    digest.update(repr(code.co_names).encode('utf-8', 'surrogatepass'))
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            digest.update(_code_digest(constant))
+        elif isinstance(constant, frozenset):
+            # (A frozenset's order changes with each process's hash seed.)
+            digest.update(repr(sorted(constant, key=repr)).encode('utf-8', 'surrogatepass'))
+        else:
+            digest.update(repr(constant).encode('utf-8', 'surrogatepass'))
+    return digest.digest()
+
+
+class RenderCache:
+    # A folder of rendered PDFs, each one stored under the cache_key() of the
+    # inputs it was built from. A hit reads the PDF's bytes back from the
+    # file, without building, laying out, or saving the document at all.
+    #
+    # The folder can be shared by any number of threads and processes (such
+    # as render_many()'s workers, or the workers of several servers): each
+    # PDF is written to a temporary file that is then renamed into place, so
+    # a reader sees either the whole PDF or no PDF. When the folder grows
+    # past max_size bytes, the least recently used PDFs are deleted (by
+    # whichever process notices first; see _RELIST_FRACTION). A RenderCache
+    # can be pickled and sent to worker processes.
+    def __init__(self, directory: Union[str, Path], max_size: int = RENDER_CACHE_MAX_SIZE):
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1')
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._init_process_state()
+
+    def _init_process_state(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._listed_size: Optional[int] = None  # (Unknown until the folder is first listed.)
+        self._unlisted_size = 0  # The size of the PDFs stored since the folder was last listed.
+
+    def __getstate__(self):
+        return {'directory': self.directory, 'max_size': self.max_size}
+
+    def __setstate__(self, state):
+        self.directory = state['directory']
+        self.max_size = state['max_size']
+        self._init_process_state()
+
+    def __repr__(self):
+        return 'RenderCache(%r, max_size=%d)' % (str(self.directory), self.max_size)
+
+    def _path(self, key: str) -> Path:
+        if not isinstance(key, str) or not _KEY_REGEX.match(key):
+            raise ValueError('key must be a key returned by cache_key(), not %r' % (key,))
+        return self.directory / key[:2] / (key + '.pdf')
+
+    def get(self, key: str) -> Optional[bytes]:
+        # Returns the cached PDF's bytes, or None if there isn't one.
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                pdf_bytes = file.read()
+        except FileNotFoundError:
+            pdf_bytes = None
+        if not pdf_bytes or not pdf_bytes.startswith(b'%PDF'):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # Mark the PDF as recently used. (Another process may have evicted
+        # it in the meantime, which is fine, since it was already read.)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return pdf_bytes
+
+    def put(self, key: str, pdf_bytes: bytes) -> None:
+        # Stores the PDF's bytes. If another process stores the same key at
+        # the same time, the last one wins, which is fine since both PDFs
+        # were built from the same inputs. A PDF that can't be stored (e.g.
+        # because the disk is full) is skipped rather than failing the render
+        # that made it.
+        path = self._path(key)
+        temp_path = path.with_name('.%s.%s.tmp' % (key, uuid.uuid4().hex))
+        try:
+            path.parent.mkdir(exist_ok=True)
+            with open(temp_path, 'wb') as file:
+                file.write(pdf_bytes)
+            os.replace(temp_path, path)
+        except OSError:
+            _remove_quietly(str(temp_path))
+            return
+        except BaseException:
+            _remove_quietly(str(temp_path))
+            raise
+
+        with self._lock:
+            self._unlisted_size += len(pdf_bytes)
+            if (
+                self._listed_size is None
+                or self._listed_size + self._unlisted_size > self.max_size
+                or self._unlisted_size > self.max_size * _RELIST_FRACTION
+            ):
+                self._evict()
+
+    def _evict(self) -> None:
+        # Lists the whole folder, since other processes add and delete PDFs
+        # too, and deletes the least recently used PDFs until the folder is
+        # under its target size. Files that another process deleted first
+        # are skipped.
+        entries: List[Tuple[float, int, str]] = []
+        total_size = 0
+        now = time.time()
+        for subdirectory in os.scandir(self.directory):
+            if not subdirectory.is_dir():
+                continue
+            for entry in os.scandir(subdirectory.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith('.tmp'):
+                    if now - stat.st_mtime > _STALE_TEMP_FILE_AGE:
+                        _remove_quietly(entry.path)
+                    continue
+                if entry.name.endswith('.pdf'):
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total_size += stat.st_size
+
+        if total_size > self.max_size:
+            target_size = self.max_size * _EVICTION_TARGET
+            entries.sort()
+            for mtime, size, path in entries:
+                if total_size <= target_size:
+                    break
+                _remove_quietly(path)
+                total_size -= size
+        self._listed_size = total_size
+        self._unlisted_size = 0
+
+    def clear(self) -> None:
+        # Deletes every cached PDF. (Temporary files are left for the puts
+        # that are still writing them.)
+        with self._lock:
+            for subdirectory in os.scandir(self.directory):
+                if subdirectory.is_dir():
+                    for entry in os.scandir(subdirectory.path):
+                        if entry.name.endswith('.pdf'):
+                            _remove_quietly(entry.path)
+            self._listed_size = 0
+            self._unlisted_size = 0
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass  # (Already deleted by another process, or, on Windows, open in one.)
@@ -0,0 +1,515 @@
+from borb.pdf import Document as BorbDocument, Page as BorbPage
+from borb.io.read.types import Dictionary as BorbDictionary, Element as BorbElement
+from borb.io.read.types import HexadecimalString as BorbHexadecimalString, List as BorbList, Name as BorbName
+from borb.io.read.types import Reference as BorbReference, Stream as BorbStream
+from borb.io.write.any_object_transformer import AnyObjectTransformer as BorbAnyObjectTransformer
+from borb.io.write.document.document_transformer import DocumentTransformer as BorbDocumentTransformer
+from borb.io.write.object.array_transformer import ArrayTransformer as BorbArrayTransformer
+from borb.io.write.object.dictionary_transformer import DictionaryTransformer as BorbDictionaryTransformer
+from borb.io.write.object.stream_transformer import StreamTransformer as BorbStreamTransformer
+from borb.io.write.transformer import Transformer as BorbTransformer
+from borb.io.write.transformer import WriteTransformerState as BorbWriteTransformerState
+from PIL import Image as PILImage
+
+from .images import _check_image_dpi
+from .util import _LeanReference
+
+from collections import namedtuple
+from typing import Any, Dict, Iterable, List, Set, Tuple
+import io
+import random
+import re
+import threading
+import typing
+import zlib
+
+# The settings that Document.save() and Document.to_bytes() use for each
+# preset. A content_compression_level of None means the same level as
+# compression_level, and an image_dpi of None means images aren't scaled.
+_SaveOptions = namedtuple(
+    '_SaveOptions',
+    'subset_fonts compression_level content_compression_level object_streams image_dpi',
+    defaults=(None, False, None),
+)
+SAVE_PRESETS = {
+    # Matches what borb does on its own, plus font subsetting.
+    'default': _SaveOptions(subset_fonts=True, compression_level=9),
+    # For temporary and intermediate files: nothing is compressed or subset.
+    'fast': _SaveOptions(subset_fonts=False, compression_level=0),
+    # For files that are kept or sent: everything that can be compressed is.
+    'small': _SaveOptions(subset_fonts=True, compression_level=9, object_streams=True),
+}
+
+# Documents can share borb objects: the cached TrueType fonts, the standard
+# fonts, PageTemplates' forms, and filled templates' pages. borb stores the
+# reference that it numbers each object with on the object itself while
+# writing, and subsetting fonts and sharing images swap entries in shared
+# resource dictionaries for the length of a save. So only one document (or
+# DocumentWriter page) is written at a time in each process. Building
+# documents still runs in parallel.
+_write_lock = threading.RLock()
+
+# Objects are packed into object streams in groups of this many, so that a
+# reader only has to decompress the group with the object it needs.
+OBJECT_STREAM_MAX_OBJECTS = 100
+
+_STARTXREF_REGEX = re.compile(rb'startxref\s+(\d+)\s+%%EOF\s*$')
+_XREF_SUBSECTION_REGEX = re.compile(rb'(\d+) (\d+)\r?\n')
+_XREF_ENTRY_REGEX = re.compile(rb'(\d{10}) (\d{5}) ([nf])\r?\n')
+_OBJECT_HEADER_REGEX = re.compile(rb'(\d+) (\d+) obj\s')
+_SIZE_REGEX = re.compile(rb'\s*/Size \d+')
+
+
+def _save_options(preset: str, **overrides) -> _SaveOptions:
+    # Returns the preset's options, with the overrides that aren't None
+    # replacing the preset's settings.
+    if preset not in SAVE_PRESETS:
+        raise ValueError('preset must be one of %s, not %r' % (', '.join(map(repr, SAVE_PRESETS)), preset))
+    options = SAVE_PRESETS[preset]._replace(**{k: v for k, v in overrides.items() if v is not None})
+    if options.content_compression_level is None:
+        options = options._replace(content_compression_level=options.compression_level)
+    for compression_level in (options.compression_level, options.content_compression_level):
+        if not isinstance(compression_level, int) or not 0 <= compression_level <= 9:
+            raise ValueError(
+                'compression levels must be from 0 (no compression) to 9 (smallest), not %r' % (compression_level,)
+            )
+    _check_image_dpi(options.image_dpi)
+    return options
+
+
+def _write_pdf(
+    document: BorbDocument, destination: typing.BinaryIO, pages: Iterable[BorbPage], options: _SaveOptions
+) -> None:
+    # Writes the document the same way borb's PDF.dumps() does, but with the
+    # compression options. pages are the document's pages, whose content
+    # streams use options.content_compression_level.
+    if options.object_streams:
+        with io.BytesIO() as pdf_bytes:
+            _write_pdf(document, pdf_bytes, pages, options._replace(object_streams=False))
+            destination.write(_pack_object_streams(pdf_bytes.getvalue(), options.compression_level))
+        return
+
+    context = _WriteTransformerState(root_object=document, destination=destination)
+    context.compression_level = options.compression_level
+    transformer = _AnyObjectTransformer()
+    for i, handler in enumerate(transformer._handlers):
+        if type(handler) is BorbDocumentTransformer:
+            handler = _DocumentTransformer()
+        elif type(handler) is BorbDictionaryTransformer:
+            handler = _DictionaryTransformer()
+        elif type(handler) is BorbArrayTransformer:
+            handler = _ArrayTransformer()
+        elif type(handler) is BorbStreamTransformer:
+            handler = _StreamTransformer(
+                options.compression_level, options.content_compression_level, _content_stream_ids(pages)
+            )
+        # (Every handler numbers the objects it refers to with its own
+        # get_reference() method, so each one gets the faster version.)
+        handler.get_reference = _get_reference
+        handler._parent = transformer
+        transformer._handlers[i] = handler
+    transformer.transform(document, context=context, destination=destination)
+
+
+def _content_stream_ids(pages: Iterable[BorbPage]) -> Set[int]:
+    content_stream_ids = set()
+    for page in pages:
+        contents = page.get('Contents')
+        if isinstance(contents, BorbStream):
+            content_stream_ids.add(id(contents))
+        elif isinstance(contents, BorbList):
+            content_stream_ids.update(id(stream) for stream in contents)
+    return content_stream_ids
+
+
+class _WriteTransformerState(BorbWriteTransformerState):
+    # borb's bookkeeping for writing a document makes the time it takes grow
+    # with the square of the number of objects, which matters for documents
+    # with thousands of annotations or pages. This keeps the same records in
+    # a way that takes linear time, and _DocumentTransformer and
+    # _get_reference() use them to write exactly the same PDF as borb would.
+    def __init__(self, root_object: Any, destination: typing.BinaryIO):
+        super().__init__(root_object=root_object, destination=destination)
+        self.resolved_references = _ResolvedReferences()
+        self.objects_by_key: Dict[Tuple[int, int], List[Any]] = {}  # See _get_reference().
+        self.number_of_objects = 0
+
+
+class _ResolvedReferences(list):
+    # The references to the objects that have been written. borb checks
+    # whether each object it writes is already in this list; the set makes
+    # that check take constant time instead of searching the list.
+    def __init__(self):
+        super().__init__()
+        self._references: Set[BorbReference] = set()
+
+    def append(self, reference: BorbReference) -> None:
+        super().append(reference)
+        self._references.add(reference)
+
+    def __contains__(self, reference: Any) -> bool:
+        return reference in self._references
+
+
+def _get_reference(obj: Any, context: _WriteTransformerState) -> BorbReference:
+    # Returns the reference for an object that is written as its own numbered
+    # object, numbering it if it's new. This numbers the objects the same way
+    # as borb's Transformer.get_reference(), which reuses the number of an
+    # equal object that was already numbered. But borb searches every object
+    # with the same hash, and only hashes dictionaries' keys (so every
+    # annotation has the same hash), and then finds the next free number by
+    # collecting every number used so far. This also buckets objects by a hash
+    # of their values, and counts the numbers instead. Like borb, objects that
+    # are marked unique (like form fields' widgets and appearance streams)
+    # always get their own number.
+    if id(obj) in context.indirect_objects_by_id:
+        return context.indirect_objects_by_id[id(obj)].get_reference()
+
+    obj_hash = BorbTransformer._hash(obj)
+    key = (obj_hash, _hash_values(obj))
+    is_unique = getattr(obj, 'is_unique', None)
+    if is_unique is None or not is_unique():
+        for other in context.objects_by_key.get(key, ()):
+            if other == obj:
+                reference = other.get_reference()
+                obj.set_reference(reference)
+                return reference
+
+    context.number_of_objects += 1
+    reference = _LeanReference(context.number_of_objects)
+    obj.set_reference(reference)
+    context.indirect_objects_by_hash.setdefault(obj_hash, []).append(obj)
+    context.objects_by_key.setdefault(key, []).append(obj)
+    context.indirect_objects_by_id[id(obj)] = obj
+    return reference
+
+
+def _hash_values(obj: Any) -> int:
+    # A hash of a dictionary's or list's values, one level deep. Equal objects
+    # always have the same hash.
+    if isinstance(obj, dict):
+        return hash(frozenset((key, _hash_or_zero(value)) for key, value in obj.items()))
+    if isinstance(obj, list):
+        return hash(tuple(_hash_or_zero(value) for value in obj))
+    return 0
+
+
+def _hash_or_zero(value: Any) -> int:
+    try:
+        return hash(value)
+    except TypeError:
+        return 0
+
+
+class _AnyObjectTransformer(BorbAnyObjectTransformer):
+    def __init__(self):
+        super().__init__()
+        self._handlers_by_type: Dict[type, Any] = {}
+
+    def transform(self, object_to_transform, context=None, destination=None):
+        # (Overridden method)
+        # borb asks each of its handlers in turn whether it writes an object,
+        # for every object it writes. Only dictionaries (like pages, or the
+        # document information dictionary) are written differently depending
+        # on what's in them, so the handler for any other type of object is
+        # looked up once per type.
+        if context is None or isinstance(object_to_transform, dict):
+            return super().transform(object_to_transform, context, destination)
+        object_type = type(object_to_transform)
+        handler = self._handlers_by_type.get(object_type)
+        if handler is None:
+            handler = next((h for h in self._handlers if h.can_be_transformed(object_to_transform)), None)
+            if handler is None:
+                return None
+            self._handlers_by_type[object_type] = handler
+        handler.transform(object_to_transform, context=context)
+
+
+# The types of the values that borb's DictionaryTransformer and
+# ArrayTransformer write as references to separate objects (unless they're
+# inline). (Only dictionaries' XMP metadata elements are.)
+_DICTIONARY_REFERENCE_TYPES = (BorbDictionary, BorbList, PILImage.Image, BorbElement)
+_ARRAY_REFERENCE_TYPES = (BorbDictionary, BorbList, PILImage.Image)
+
+
+def _queue_objects(
+    transformer: BorbTransformer,
+    values: Iterable[Any],
+    reference_types: Tuple[type, ...],
+    context: _WriteTransformerState,
+    queue: List[Any],
+) -> List[Any]:
+    # Returns the values of a dictionary or list the way they're written, the
+    # same as borb's DictionaryTransformer and ArrayTransformer: each value
+    # of one of reference_types that isn't inline is replaced with a
+    # reference to it, and added to queue to be written after.
+    written_values = []
+    for value in values:
+        if isinstance(value, reference_types) and not value.is_inline():
+            written_values.append(transformer.get_reference(value, context))
+            queue.append(value)
+        else:
+            written_values.append(value)
+    return written_values
+
+
+class _DictionaryTransformer(BorbDictionaryTransformer):
+    def transform(self, object_to_transform, context=None):
+        # (Overridden method)
+        # Writes exactly what borb's does, but without making a new
+        # Dictionary of what's written, since each new Dictionary takes
+        # longer to make than writing it does (see util._LeanObject).
+        object_ref = object_to_transform.get_reference()
+        if object_ref is not None and object_ref in context.resolved_references:
+            return
+
+        queue: List[Any] = []
+        values = _queue_objects(self, object_to_transform.values(), _DICTIONARY_REFERENCE_TYPES, context, queue)
+        started_object = False
+        if object_ref is not None:
+            if object_ref.byte_offset is None:
+                started_object = True
+                self._start_object(object_to_transform, context)
+            context.resolved_references.append(object_ref)
+
+        root_transformer = self.get_root_transformer()
+        context.destination.write(b'<<')
+        for i, (key, value) in enumerate(zip(object_to_transform.keys(), values)):
+            if i > 0:
+                context.destination.write(b' ')
+            root_transformer.transform(key, context)
+            context.destination.write(b' ')
+            root_transformer.transform(value, context)
+        context.destination.write(b'>>' if object_to_transform.is_inline() else b'>>\n')
+
+        if started_object:
+            self._end_object(object_to_transform, context)
+        for value in queue:
+            root_transformer.transform(value, context)
+
+
+class _ArrayTransformer(BorbArrayTransformer):
+    def transform(self, object_to_transform, context=None):
+        # (Overridden method)
+        # The same as _DictionaryTransformer.transform(), for lists.
+        object_ref = object_to_transform.get_reference()
+        if object_ref is not None and object_ref in context.resolved_references:
+            return
+
+        queue: List[Any] = []
+        values = _queue_objects(self, object_to_transform, _ARRAY_REFERENCE_TYPES, context, queue)
+        started_object = False
+        if object_ref is not None:
+            if object_ref.byte_offset is None:
+                started_object = True
+                self._start_object(object_to_transform, context)
+            context.resolved_references.append(object_ref)
+
+        root_transformer = self.get_root_transformer()
+        context.destination.write(b'[')
+        for i, value in enumerate(values):
+            if i > 0:
+                context.destination.write(b' ')
+            root_transformer.transform(value, context)
+        context.destination.write(b']' if object_to_transform.is_inline() else b']\n')
+
+        if started_object:
+            self._end_object(object_to_transform, context)
+        for value in queue:
+            root_transformer.transform(value, context)
+
+
+class _DocumentTransformer(BorbDocumentTransformer):
+    def transform(self, object_to_transform, context=None):
+        # (Overridden method)
+        # The same as borb's, except for how the references left over from
+        # the last time the document was written are cleared. borb keeps a
+        # list of the objects it has already cleared, and compares each
+        # object to every one of them (whole dictionaries at a time).
+        context.destination.write(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n')
+        _clear_references(object_to_transform)
+
+        trailer = object_to_transform['XRef']['Trailer']
+        random_id = BorbHexadecimalString('%032x' % random.randrange(16**32))
+        if 'ID' not in trailer:
+            trailer[BorbName('ID')] = BorbList().set_is_inline(True)
+            trailer['ID'].append(random_id)
+            trailer['ID'].append(random_id)
+        else:
+            trailer['ID'][1] = random_id
+        trailer['ID'].set_is_inline(True)
+
+        self._build_empty_document_info_dictionary(object_to_transform)
+        self.get_root_transformer().transform(object_to_transform['XRef'], context)
+
+
+def _clear_references(root: Any) -> None:
+    # Clears the reference of every object that can be reached from root.
+    objects_done: Set[int] = set()
+    objects_todo = [root]
+    while objects_todo:
+        obj = objects_todo.pop()
+        if id(obj) in objects_done:
+            continue
+        objects_done.add(id(obj))
+        set_reference = getattr(obj, 'set_reference', None)
+        if set_reference is not None:
+            set_reference(None)
+        if isinstance(obj, list):
+            objects_todo.extend(obj)
+        elif isinstance(obj, dict):
+            objects_todo.extend(obj.keys())
+            objects_todo.extend(obj.values())
+
+
+class _StreamTransformer(BorbStreamTransformer):
+    # borb compresses every stream at the WriteTransformerState's one
+    # compression level. This writes content streams (pages' contents and
+    # Form XObjects) at their own level, and everything else (mostly font
+    # files) at the usual level. Streams whose bytes are already encoded
+    # (like images' JPEG data) are written as they are, but borb drops their
+    # /Filter at level 0, so they are always written at level 9, the same as
+    # borb's ImageTransformer does for images.
+    def __init__(self, compression_level: int, content_compression_level: int, content_stream_ids: Set[int]):
+        super().__init__()
+        self._compression_level = compression_level
+        self._content_compression_level = content_compression_level
+        self._content_stream_ids = content_stream_ids
+
+    def transform(self, object_to_transform, context=None):
+        # (Overridden method)
+        if 'DecodedBytes' not in object_to_transform:
+            compression_level = 9
+        elif id(object_to_transform) in self._content_stream_ids or object_to_transform.get('Subtype') == 'Form':
+            compression_level = self._content_compression_level
+        else:
+            compression_level = self._compression_level
+        if compression_level == self._compression_level:
+            return super().transform(object_to_transform, context)
+        context.compression_level = compression_level
+        try:
+            return super().transform(object_to_transform, context)
+        finally:
+            context.compression_level = self._compression_level
+
+    def _end_object(self, object_to_transform, context) -> None:
+        # (Overridden method)
+        # borb writes the objects that a stream refers to (like a Form
+        # XObject's fonts) after ending the stream's object, so switch back
+        # to the usual level for them.
+        super()._end_object(object_to_transform, context)
+        context.compression_level = self._compression_level
+
+
+def _pack_object_streams(pdf: bytes, compression_level: int) -> bytes:
+    # Rewrites a PDF that borb wrote, with a cross-reference table, so that
+    # every object except the streams is packed into object streams, which
+    # are compressed at compression_level. The cross-reference table is
+    # replaced with a (compressed) cross-reference stream. Both need PDF 1.5,
+    # and borb writes PDF 1.7 headers.
+    startxref_match = _STARTXREF_REGEX.search(pdf, max(0, len(pdf) - 64))
+    if startxref_match is None:
+        raise ValueError('the PDF has no startxref')
+    start_of_xref = int(startxref_match.group(1))
+    trailer_start = pdf.index(b'trailer', start_of_xref)
+    trailer = pdf[trailer_start + len(b'trailer') : pdf.index(b'startxref', trailer_start)].strip()
+    byte_offsets = _read_xref_table(pdf[start_of_xref:trailer_start])
+
+    # Each object runs from its byte offset to the "endobj" before the next
+    # object (borb writes comments between some objects).
+    sorted_offsets = sorted((byte_offset, object_number) for object_number, byte_offset in byte_offsets.items())
+    stream_objects: List[Tuple[int, bytes]] = []
+    packed_objects: List[Tuple[int, bytes]] = []
+    for i, (byte_offset, object_number) in enumerate(sorted_offsets):
+        end = sorted_offsets[i + 1][0] if i + 1 < len(sorted_offsets) else start_of_xref
+        end = pdf.rindex(b'endobj', byte_offset, end)
+        header = _OBJECT_HEADER_REGEX.match(pdf, byte_offset)
+        if header is None or int(header.group(1)) != object_number or header.group(2) != b'0':
+            raise ValueError('the cross-reference table has the wrong byte offset for object %d' % object_number)
+        body = pdf[header.end() : end].strip()
+        if body.endswith(b'endstream'):
+            stream_objects.append((object_number, pdf[byte_offset:end] + b'endobj\n'))
+        else:
+            packed_objects.append((object_number, body))
+
+    # The cross-reference stream's entries are (type, field 2, field 3): 0 for
+    # free object numbers, 1 (byte offset, 0) for objects in the file, and
+    # 2 (object stream number, index) for objects in object streams.
+    entries: Dict[int, Tuple[int, int, int]] = {0: (0, 0, 65535)}
+    output = bytearray(pdf[: sorted_offsets[0][0]] if sorted_offsets else pdf[:start_of_xref])
+    for object_number, stream_object in stream_objects:
+        entries[object_number] = (1, len(output), 0)
+        output += stream_object
+
+    next_object_number = max(byte_offsets, default=0) + 1
+    for i in range(0, len(packed_objects), OBJECT_STREAM_MAX_OBJECTS):
+        group = packed_objects[i : i + OBJECT_STREAM_MAX_OBJECTS]
+        object_stream_number = next_object_number
+        next_object_number += 1
+        offsets = []
+        position = 0
+        for index, (object_number, body) in enumerate(group):
+            entries[object_number] = (2, object_stream_number, index)
+            offsets.append(b'%d %d' % (object_number, position))
+            position += len(body) + 1
+        first = b' '.join(offsets) + b'\n'
+        entries[object_stream_number] = (1, len(output), 0)
+        output += _stream_object(
+            object_stream_number,
+            b'/Type /ObjStm /N %d /First %d' % (len(group), len(first)),
+            first + b'\n'.join(body for object_number, body in group),
+            compression_level,
+        )
+
+    xref_stream_number = next_object_number
+    start_of_xref_stream = len(output)
+    entries[xref_stream_number] = (1, start_of_xref_stream, 0)
+    offset_width = max(1, (start_of_xref_stream.bit_length() + 7) // 8)
+    rows = bytearray()
+    for object_number in range(xref_stream_number + 1):
+        entry_type, field_2, field_3 = entries.get(object_number, (0, 0, 0))
+        rows.append(entry_type)
+        rows += field_2.to_bytes(offset_width, 'big') + field_3.to_bytes(2, 'big')
+    trailer_entries = _SIZE_REGEX.sub(b'', trailer[2:-2]).strip()
+    output += _stream_object(
+        xref_stream_number,
+        b'/Type /XRef /Size %d /W [1 %d 2] %s' % (xref_stream_number + 1, offset_width, trailer_entries),
+        bytes(rows),
+        compression_level,
+    )
+    output += b'startxref\n%d\n%%%%EOF' % start_of_xref_stream
+    return bytes(output)
+
+
+def _read_xref_table(xref: bytes) -> Dict[int, int]:
+    # Returns the byte offset of each object in use in a cross-reference
+    # table, keyed by object number.
+    byte_offsets = {}
+    position = xref.index(b'xref') + len(b'xref')
+    while True:
+        while xref[position : position + 1].isspace():
+            position += 1
+        subsection = _XREF_SUBSECTION_REGEX.match(xref, position)
+        if subsection is None:
+            return byte_offsets
+        position = subsection.end()
+        first_object_number, count = int(subsection.group(1)), int(subsection.group(2))
+        for object_number in range(first_object_number, first_object_number + count):
+            entry = _XREF_ENTRY_REGEX.match(xref, position)
+            if entry is None:
+                raise ValueError('the cross-reference table is damaged at object %d' % object_number)
+            position = entry.end()
+            if entry.group(3) == b'n' and object_number != 0:
+                byte_offsets[object_number] = int(entry.group(1))
+
+
+def _stream_object(object_number: int, dictionary_entries: bytes, data: bytes, compression_level: int) -> bytes:
+    if compression_level:
+        data = zlib.compress(data, compression_level)
+        dictionary_entries += b' /Filter /FlateDecode'
+    return b'%d 0 obj\n<<%s /Length %d>>\nstream\n%s\nendstream\nendobj\n' % (
+        object_number,
+        dictionary_entries,
+        len(data),
+        data,
+    )
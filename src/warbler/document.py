@@ -6,29 +6,57 @@ from borb.pdf import (
     Alignment as BorbAlignment,
     SingleColumnLayout as BorbSingleColumnLayout,
 )
+from borb.io.read.types import Decimal as BorbDecimal, Dictionary as BorbDictionary, List as BorbList
+from borb.io.read.types import Name as BorbName, Stream as BorbStream
 from borb.pdf.canvas.font.font import Font as BorbFont
 from borb.pdf.canvas.layout.hyphenation.hyphenation import Hyphenation as BorbHyphenation
 from borb.pdf.canvas.color.color import Color as BorbColor, HexColor as BorbHexColor
+from borb.pdf.canvas.geometry.rectangle import Rectangle as BorbRectangle
 from borb.pdf.page.page_size import PageSize as BorbPageSize
 
-from .util import (
-    _normalize_text_alignment,
-    _normalize_alignment,
-    _normalize_color,
-    _normalize_hyphenation,
-    _normalize_font,
-)
+from .aio import _save_async
+from .annotation import _add_square_annotations
+from .compress import _SaveOptions, _save_options, _write_lock, _write_pdf
+from .images import _share_images
+from .profiling import _page_entries, _record_document, _timed
+from .style import ParagraphSpec, ParagraphStyle
+from .subset import _copy_dictionary, _subset_fonts
+from .table import _add_table, _table_style
+from .util import _standard_font, _text_width
 from .warblertypes import NumberType, ColorType, OneNumForFourType, AlignmentType, OneBoolForFourType
 
+from collections import namedtuple
+from concurrent.futures import Executor
 from decimal import Decimal
-from typing import Union, Tuple
+from typing import Dict, Iterable, Union, Tuple
 import typing
+import asyncio
+import functools
+import io
+import itertools
+import os
+import re
+import secrets
+import time
 from pathlib import Path
 
 
+# The outcome of a Page.add_many() call. count is the number of texts that
+# were added, y is where the last of them ends (in points from the bottom of
+# the page), and remaining is an iterator of the texts that didn't fit.
+AddManyResult = namedtuple('AddManyResult', ['count', 'y', 'remaining'])
+
+
+# A place on a template page that Document.fill() paints text in: the
+# ParagraphStyle for the text, and the space (from the left margin to the
+# right margin, and as tall as the slot) that the text is laid out in.
+_Slot = namedtuple('_Slot', ['style', 'available_space'])
+
+
 class Document(BorbDocument):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self._frozen = False
 
     def add_page(self, *args, **kwargs) -> BorbPage:
         # (Overridden method)
@@ -40,23 +68,406 @@ class Document(BorbDocument):
             self.add_page(page)
             return page
         else:
+            if self._frozen:
+                raise ValueError('cannot add pages to a frozen Document')
+            # Lay out the last page's deferred paragraphs first, so that any
+            # text that doesn't fit on it goes on the pages right after it.
+            kids = self._get_kids()
+            if len(kids) > 0 and isinstance(kids[-1], Page) and kids[-1].deferred_paragraphs:
+                kids[-1].layout_deferred()
             return super().add_page(*args, **kwargs)
 
-    def save(self, filename: str) -> None:
+    def _get_kids(self) -> BorbList:
+        # Returns the list of the document's pages. (The page count that
+        # get_number_of_pages() reads can lag behind it while pages are added.)
+        return self['XRef']['Trailer']['Root']['Pages']['Kids'] if 'XRef' in self else BorbList()
+
+    def freeze(self) -> 'Document':
+        # (New Warbler method)
+        # Makes this document a template for fill(). Its deferred paragraphs
+        # are laid out, and from then on nothing can be added to it or to its
+        # pages (except with borb methods like add_annotation(), which
+        # shouldn't be used on them either), so that the documents that fill()
+        # makes can share its pages' content. Returns the document.
+        if not self._frozen:
+            self._layout_deferred_paragraphs()
+            for page in self._get_kids():
+                if isinstance(page, Page):
+                    page._frozen = True
+            self._frozen = True
+        return self
+
+    @_timed('layout')
+    def fill(self, values: Dict[str, typing.Any]) -> 'Document':
+        # (New Warbler method)
+        # Returns a new Document made from this one, with the text in values
+        # (a dict of slot names and the text for them) painted in the slots
+        # that Page.add_slot() reserved. A slot that isn't in values is left
+        # empty. This document is frozen first (see freeze()), and can then
+        # be filled any number of times:
+        #
+        #     template = warbler.Document()
+        #     page = template.add_page()
+        #     page.add('INVOICE', font_size=20)
+        #     page.add_slot('customer')
+        #     page.add('Thank you for your business.')
+        #     for record in records:
+        #         template.fill({'customer': record['name']}).save(...)
+        #
+        # The new pages share everything that doesn't change with the
+        # template's pages (their content streams, fonts, images, and
+        # annotations' contents), so only the slots' text is laid out, and
+        # each call takes time in proportion to the slots that are filled.
+        # Pages can be added after the new pages, but not to them. Documents
+        # made from the same template can be filled and saved in different
+        # threads at the same time.
+        self.freeze()
+        document = Document()
+        # (Writing a document temporarily changes its pages and their shared
+        # resources, e.g. borb swaps the page tree's pages for references,
+        # so the template is read while no document is being written.)
+        with _write_lock:
+            pages = self._get_kids()
+            for name in values:
+                if not any(name in getattr(page, 'slots', ()) for page in pages):
+                    raise ValueError('the template has no slot named %r' % (name,))
+            for page in pages:
+                document.add_page(_filled_page(page, values))
+        return document
+
+    def save(
+        self,
+        file: Union[str, Path, typing.BinaryIO],
+        atomic: bool = False,
+        subset_fonts: typing.Optional[bool] = None,
+        compression_level: typing.Optional[int] = None,
+        content_compression_level: typing.Optional[int] = None,
+        object_streams: typing.Optional[bool] = None,
+        preset: str = 'default',
+        image_dpi: typing.Optional[NumberType] = None,
+    ) -> None:
         # (New Warbler method that makes saving PDF files easier.)
-        with open(filename, 'wb') as pdf_file_handle:
-            BorbPDF.dumps(pdf_file_handle, self)
+        # The file can be a filename or any binary file-like object with a
+        # write() method, such as an HTTP response or an upload stream.
+        #
+        # The preset is 'default', 'fast' (for temporary and intermediate
+        # files: nothing is compressed), or 'small' (everything that can be
+        # compressed is). Any of these other arguments that aren't None
+        # replace the preset's setting:
+        # - subset_fonts: If True, embedded TrueType fonts only include the
+        #   glyphs that the document uses.
+        # - compression_level: The Flate compression level for streams, from
+        #   0 (not compressed, fastest) to 9 (smallest, the default).
+        # - content_compression_level: The level for content streams (the
+        #   text and drawing on each page), if it's different.
+        # - object_streams: If True, all of the objects that aren't streams
+        #   are packed into compressed object streams, and the cross-reference
+        #   table is written as a compressed stream too.
+        # Images are always JPEG-compressed, and each distinct image is written
+        # once, even if a separate copy of it was loaded for each page. If
+        # image_dpi is given, images with more pixels than they need to be
+        # shown at image_dpi pixels per inch (at the largest size they are
+        # drawn at) are scaled down. Encoded images are cached, so documents
+        # in a batch that show the same image only encode it once.
+        options = _save_options(
+            preset,
+            subset_fonts=subset_fonts,
+            compression_level=compression_level,
+            content_compression_level=content_compression_level,
+            object_streams=object_streams,
+            image_dpi=image_dpi,
+        )
+        if hasattr(file, 'write'):
+            if atomic:
+                raise ValueError('atomic saves need a filename, not a file-like object')
+            pdf_stream = _PDFStreamWriter(file)
+            self._dumps(pdf_stream, options)
+            pdf_stream.flush()
+            return
+
+        if not atomic:
+            with open(file, 'wb') as pdf_file_handle:
+                self._dumps(pdf_file_handle, options)
+            return
+
+        # For atomic saves, write to a temporary file in the same folder and
+        # then rename it over the destination. Readers never see a
+        # half-written PDF: they either get the old file or the new one.
+        folder, basename = os.path.split(os.path.abspath(file))
+        temp_filename = os.path.join(folder, '.%s.%s.tmp' % (basename, secrets.token_hex(4)))
+        try:
+            with open(temp_filename, 'xb') as pdf_file_handle:
+                self._dumps(pdf_file_handle, options)
+                pdf_file_handle.flush()
+                os.fsync(pdf_file_handle.fileno())
+            os.replace(temp_filename, file)
+        except BaseException:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            raise
+
+    @_timed('save')
+    def _dumps(self, pdf_file_handle: typing.BinaryIO, options: _SaveOptions) -> None:
+        if 'XRef' not in self:
+            with _write_lock:
+                BorbPDF.dumps(pdf_file_handle, self)
+            return
+        start_time = time.perf_counter()
+        start_of_pdf = pdf_file_handle.tell()
+        self._layout_deferred_paragraphs()
+        number_of_pages = int(self.get_document_info().get_number_of_pages() or 0)
+        pages = [self.get_page(i) for i in range(number_of_pages)]
+        # (See _write_lock for why documents are written one at a time.)
+        with _write_lock, _share_images(pages, options.image_dpi):
+            if not options.subset_fonts:
+                _write_pdf(self, pdf_file_handle, pages, options)
+            else:
+                with _subset_fonts(pages):
+                    _write_pdf(self, pdf_file_handle, pages, options)
+        _record_document(
+            _page_entries(pages), pdf_file_handle.tell() - start_of_pdf, time.perf_counter() - start_time
+        )
+
+    def _layout_deferred_paragraphs(self) -> None:
+        # Lays out every page's deferred paragraphs before the document is
+        # written. (Overflowing text adds pages at the end, which are checked
+        # too.)
+        i = 0
+        while i < int(self.get_document_info().get_number_of_pages() or 0):
+            page = self.get_page(i)
+            if isinstance(page, Page) and page.deferred_paragraphs:
+                page.layout_deferred()
+            i += 1
+
+    @_timed('layout')
+    def add_text(
+        self, text: str, style: typing.Optional[ParagraphStyle] = None, **style_kwargs
+    ) -> BorbPage:
+        # (New Warbler method)
+        # Adds text as a Paragraph after everything else on the document's
+        # last page, adding new pages (with the same size and PageTemplate as
+        # the last one) as needed. A paragraph that doesn't fit in the rest of
+        # the page is split between two lines and continued on the next page.
+        # The style arguments work the same as Page.add_many(). Returns the
+        # page that the text ends on.
+        #
+        # Only the new paragraph is laid out, so each call takes about the same
+        # time no matter how long the document already is.
+        style = _style_from_arguments(style, style_kwargs)
+        paragraph = Paragraph(text, style=style)
+        page = self._get_flow_page()
+        lines: typing.Optional[_ParagraphLines] = None  # (Set once the paragraph has to be split.)
+        while True:
+            layout = page._get_default_layout()
+            available_space = page._available_space(layout, paragraph)
+            part = None
+            if available_space is not None:
+                if lines is None:
+                    if page._fits(layout, paragraph, available_space):
+                        page._paint_in_layout(layout, paragraph, available_space)
+                        return page
+                    lines = _ParagraphLines(paragraph, available_space, style)
+                part = lines.next_part(page, layout, available_space)
+
+            if part is not None:
+                page._paint_in_layout(layout, part, available_space)
+                if lines.is_done():
+                    return page
+            elif page._layout_is_empty(layout):
+                raise ValueError('text is too tall to fit on an empty page')
+
+            page = self._add_page_like(page)
+
+    def _get_flow_page(self) -> 'Page':
+        # Returns the page that add_text() continues on: the last page, unless
+        # it can't be flowed into, in which case a new page is added.
+        number_of_pages = int(self.get_document_info().get_number_of_pages() or 0) if 'XRef' in self else 0
+        if number_of_pages == 0:
+            return self.add_page()
+        page = self.get_page(number_of_pages - 1)
+        if isinstance(page, Page) and page.deferred_paragraphs:
+            page.layout_deferred()
+            return self._get_flow_page()  # (The deferred paragraphs may have added pages.)
+        if isinstance(page, Page) and not page._frozen:
+            if page.default_layout_obj is None or page.default_layout_obj.get_page() is page:
+                return page
+        return self._add_page_like(page)
+
+    @_timed('layout')
+    def add_table(
+        self,
+        rows: Iterable[typing.Any],
+        header: typing.Optional[typing.Sequence[typing.Any]] = None,
+        column_widths: typing.Optional[typing.Sequence[NumberType]] = None,
+        sample_size: int = 100,
+        style: typing.Optional[ParagraphStyle] = None,
+        header_style: typing.Optional[ParagraphStyle] = None,
+        **style_kwargs,
+    ) -> BorbPage:
+        # (New Warbler method)
+        # Adds a table after everything else on the document's last page,
+        # continuing on new pages (with the same size and PageTemplate as the
+        # last one) as needed, with the header row repeated at the top of
+        # each page. rows is any iterable of rows, like a csv.reader or a
+        # database cursor, and is read one row at a time. Each row is a
+        # sequence of values (shown with str(), or empty for None), or a dict
+        # of them by the header's names. Returns the page the table ends on.
+        #
+        # Unless column_widths (relative widths, like borb's
+        # FixedColumnWidthTable's) are given, the columns are measured from
+        # the header and the first sample_size rows, and fitted to the width
+        # of the page. Text that's too wide for its cell wraps onto more
+        # lines, with words that are too wide for a line broken between
+        # characters. The cells use the style's font, font size, font color,
+        # leading, padding, text alignment, background color, and borders.
+        # The style arguments work the same as Page.add_many(), but start
+        # from a table style (10 point text, 3 points of padding, and thin
+        # borders). header_style is the header row's ParagraphStyle, and is
+        # the same as the other rows' if it's None.
+        #
+        # Unlike borb's tables, the rows aren't made into layout elements,
+        # so adding a table takes time in proportion to its number of rows.
+        # To keep memory use flat too, use DocumentWriter.add_table().
+        style = _table_style(style, style_kwargs)
+        header_style = header_style or style
+        page = self._get_flow_page()
+        return _add_table(page, self._add_page_like, rows, header, column_widths, sample_size, style, header_style)
+
+    def _add_page_like(self, page: BorbPage) -> 'Page':
+        # Adds a new page with the same size and template as page.
+        new_page = _page_like(page)
+        self.add_page(new_page)
+        return new_page
+
+    async def save_async(
+        self,
+        file: Union[str, Path, typing.BinaryIO, typing.Any],
+        atomic: bool = False,
+        executor: typing.Optional[Executor] = None,
+        limiter: typing.Optional[asyncio.Semaphore] = None,
+        **save_kwargs,
+    ) -> None:
+        # (New Warbler method)
+        # Saves the document in a thread executor (the event loop's default
+        # one if executor is None), so the event loop isn't blocked while the
+        # PDF is written. Besides filenames and binary file-like objects, the
+        # file can be an async writer, like an asyncio.StreamWriter or an HTTP
+        # response with an async write() method. The PDF is sent to it in
+        # chunks, waiting whenever the writer falls behind.
+        # limiter is the same as for warbler.render_async(). The other
+        # arguments are the same as for save(). Each process writes one
+        # document at a time, so saves in the same process take turns; to
+        # write documents in parallel, use warbler.render_async(), which
+        # builds and saves them in worker processes.
+        #
+        # Don't change the document until this finishes.
+        await _save_async(self, file, executor, limiter, dict(save_kwargs, atomic=atomic))
+
+    def to_bytes(
+        self,
+        subset_fonts: typing.Optional[bool] = None,
+        compression_level: typing.Optional[int] = None,
+        content_compression_level: typing.Optional[int] = None,
+        object_streams: typing.Optional[bool] = None,
+        preset: str = 'default',
+        image_dpi: typing.Optional[NumberType] = None,
+    ) -> bytes:
+        # (New Warbler method)
+        # Returns the PDF file's contents as a bytes object, without writing
+        # it to disk. BytesIO.getvalue() hands over its buffer without making
+        # another copy of the document. The arguments are the same as for
+        # save().
+        options = _save_options(
+            preset,
+            subset_fonts=subset_fonts,
+            compression_level=compression_level,
+            content_compression_level=content_compression_level,
+            object_streams=object_streams,
+            image_dpi=image_dpi,
+        )
+        with io.BytesIO() as pdf_bytes:
+            self._dumps(pdf_bytes, options)
+            return pdf_bytes.getvalue()
+
+
+class _PDFStreamWriter:
+    # borb calls tell() while writing to record each object's byte offset for
+    # the cross-reference table, which streams like sockets and HTTP responses
+    # don't support. This wrapper counts the bytes written instead, so the
+    # offsets are always relative to the start of the PDF. It also collects
+    # borb's many tiny writes into larger chunks.
+    CHUNK_SIZE: int = 64 * 1024
+
+    def __init__(self, stream: typing.BinaryIO):
+        self._stream = stream
+        self._buffer = bytearray()
+        self._position = 0
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        self._position += len(data)
+        if len(self._buffer) >= self.CHUNK_SIZE:
+            self.flush()
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        if self._buffer:
+            self._stream.write(bytes(self._buffer))
+            self._buffer.clear()
 
 
 class Page(BorbPage):
-    def __init__(self, width: NumberType = Decimal(612), height: NumberType = Decimal(792), size: str = ''):
+    def __init__(
+        self,
+        width: NumberType = Decimal(612),
+        height: NumberType = Decimal(792),
+        size: str = '',
+        template: typing.Optional['PageTemplate'] = None,
+    ):
         if size != '':
             width, height = _pageSizeFromName(size)
 
         super().__init__(width, height)
 
         self.default_layout_obj: BorbSingleColumnLayout = None
+        self._template = template
+        self.deferred_paragraphs: typing.List[ParagraphSpec] = []  # Queued by defer(), in order.
+        self.slots: Dict[str, _Slot] = {}  # Reserved by add_slot(), by name.
+        self._frozen = False  # Set by Document.freeze().
+
+        if template is not None:
+            # Draw the template's shared Form XObject underneath everything
+            # else on the page.
+            if 'Resources' not in self:
+                self[BorbName('Resources')] = BorbDictionary().set_parent(self)
+            if 'XObject' not in self['Resources']:
+                self['Resources'][BorbName('XObject')] = BorbDictionary()
+            self['Resources']['XObject'][BorbName('Template')] = template._get_form_xobject()
+            self.append_to_content_stream('q /Template Do Q\n')
 
+    def append_to_content_stream(self, s: str) -> 'Page':
+        # (Overridden method)
+        # borb compresses the whole content stream again every time something
+        # is painted on the page, which makes filling a page with many
+        # paragraphs (e.g. with add_many()) quadratic. The compressed bytes
+        # are never used, though: borb compresses the decoded bytes itself
+        # when it saves the page. So this only appends to the decoded bytes,
+        # and removes the out-of-date compressed bytes.
+        self._raise_if_frozen()
+        self._initialize_page_content_stream()
+        content_stream = self['Contents']
+        decoded_bytes = content_stream[BorbName('DecodedBytes')]
+        if decoded_bytes and decoded_bytes[-1:] not in b' \t\n' and s[:1] not in ' \t\n':
+            s = ' ' + s
+        content_stream[BorbName('DecodedBytes')] = decoded_bytes + s.encode('latin1')
+        content_stream.pop(BorbName('Bytes'), None)
+        content_stream.pop(BorbName('Length'), None)
+        return self
+
+    @_timed('layout', page_layout=True)
     def add(
         self,
         text: str,
@@ -77,16 +488,15 @@ class Page(BorbPage):
         multiplied_leading: typing.Optional[NumberType] = None,
         background_color: typing.Optional[ColorType] = None,
         hyphenation: typing.Optional[Union[BorbHyphenation, str]] = None,
+        style: typing.Optional[ParagraphStyle] = None,
     ):
         # (New Warbler method)
         # Adds text in a Paragraph object to a default SingleColumnLayout
         # object that it generates if needed. Returns the default layout object.
 
-        if self.default_layout_obj is None:
-            self.default_layout_obj = BorbSingleColumnLayout(self)
-
-        # Add text as a new Paragraph object. (The Paragraph object handles type casting.)
-        self.default_layout_obj.add(
+        # Add text as a new Paragraph object. (The Paragraph object handles type casting,
+        # or skips it entirely if a ParagraphStyle is passed for style.)
+        self._get_default_layout().add(
             Paragraph(
                 text,
                 respect_newlines_in_text=respect_newlines_in_text,
@@ -106,13 +516,281 @@ class Page(BorbPage):
                 multiplied_leading=multiplied_leading,
                 background_color=background_color,
                 hyphenation=hyphenation,
+                style=style,
             )
         )
 
         return self.default_layout_obj  # Because Layout objects return self, this method returns the layout object.
 
+    @_timed('layout', page_layout=True)
+    def add_many(
+        self, texts: Iterable[str], style: typing.Optional[ParagraphStyle] = None, **style_kwargs
+    ) -> AddManyResult:
+        # (New Warbler method)
+        # Adds a Paragraph for each text in texts, all in the same style, to
+        # the default layout. The style is either a ParagraphStyle, the same
+        # keyword arguments as add(), or a ParagraphStyle with some of its
+        # settings overridden by keyword arguments. Either way, it's
+        # normalized once for all of the texts instead of once per text.
+        #
+        # Unlike add(), this never spills over onto a new page: it stops at
+        # the first text that doesn't fit on this page and returns an
+        # AddManyResult, whose remaining iterator can be passed to add_many()
+        # on the next page.
+        style = _style_from_arguments(style, style_kwargs)
+        layout = self._get_default_layout()
+
+        texts = iter(texts)
+        count = 0
+        if layout.get_page() is self:  # (Otherwise, add() has already filled this page.)
+            for text in texts:
+                if not self._add_if_it_fits(layout, Paragraph(text, style=style)):
+                    return AddManyResult(count, self._layout_y(layout), itertools.chain([text], texts))
+                count += 1
+        return AddManyResult(count, self._layout_y(layout), texts)
+
+    def defer(
+        self, text: Union[str, ParagraphSpec], style: typing.Optional[ParagraphStyle] = None, **style_kwargs
+    ) -> ParagraphSpec:
+        # (New Warbler method)
+        # Queues text to be added to the page later, as a ParagraphSpec that
+        # only holds the text and its style. The style arguments work the
+        # same as add_many(); pass the same ParagraphStyle for many texts to
+        # share it instead of making a new one each time. A ParagraphSpec
+        # from another page's deferred_paragraphs can be passed instead of
+        # text, to move it between pages. Returns the ParagraphSpec.
+        #
+        # The queued paragraphs are laid out, in order and the same way add()
+        # would, when anything else is added to the page, the next page is
+        # added to the document, or the page is saved (or layout_deferred()
+        # is called). Pages that are thrown away before then never make the
+        # borb Paragraph objects at all.
+        self._raise_if_frozen()
+        if isinstance(text, ParagraphSpec):
+            if style is not None or style_kwargs:
+                raise ValueError('a ParagraphSpec already has a style')
+            spec = text
+        else:
+            spec = ParagraphSpec(text, _style_from_arguments(style, style_kwargs))
+        self.deferred_paragraphs.append(spec)
+        return spec
+
+    @_timed('layout', page_layout=True)
+    def add_slot(
+        self,
+        name: str,
+        placeholder: str = '',
+        height: typing.Optional[NumberType] = None,
+        style: typing.Optional[ParagraphStyle] = None,
+        **style_kwargs,
+    ) -> None:
+        # (New Warbler method)
+        # Reserves a place on the page for text that Document.fill() paints
+        # in later, below everything else on the page so far, where add()
+        # would put a paragraph. The slot is as tall as the placeholder text
+        # in the style (one line for the default empty placeholder), or
+        # height points tall, and spans the width of the page's margins. Text
+        # added to the page after it goes below the slot. The style arguments
+        # work the same as add_many(). Nothing is painted in the slot on this
+        # page itself.
+        self._raise_if_frozen()
+        if name in self.slots:
+            raise ValueError('the page already has a slot named %r' % (name,))
+        style = _style_from_arguments(style, style_kwargs)
+        layout = self._get_default_layout()
+        paragraph = Paragraph(placeholder, style=style)
+        available_space = self._available_space(layout, paragraph) if layout.get_page() is self else None
+        if available_space is None or not self._fits(layout, paragraph, available_space):
+            raise ValueError('there is no room left on the page for the slot %r' % (name,))
+
+        # The placeholder paragraph takes up the slot's space in the layout,
+        # without being painted.
+        top = available_space.get_y() + available_space.get_height()
+        layout_box = paragraph.get_previous_layout_box()
+        if height is not None:
+            height = Decimal(height)
+            if height <= 0 or height > top - layout._vertical_margin_bottom:
+                raise ValueError('there is no room left on the page for a slot %s points tall' % (height,))
+            layout_box = BorbRectangle(layout_box.get_x(), top - height, layout_box.get_width(), height)
+            paragraph._previous_layout_box = layout_box
+        layout._previous_element = paragraph
+        layout._previous_element_layout_rect = layout_box
+        self.slots[name] = _Slot(
+            style,
+            BorbRectangle(
+                available_space.get_x(), layout_box.get_y(), available_space.get_width(), top - layout_box.get_y()
+            ),
+        )
+
+    @_timed('layout', page_layout=True)
+    def add_square_annotations(
+        self,
+        rectangles: typing.Any,
+        fill_color: typing.Optional[typing.Any] = None,
+        stroke_color: typing.Optional[typing.Any] = None,
+    ) -> 'Page':
+        # (New Warbler method)
+        # Adds a square annotation for each rectangle, the same as calling
+        # add_annotation() with a SquareAnnotation for each one, but in one
+        # pass, for pages with thousands of boxes (e.g. highlights or
+        # redactions from a detector). rectangles is a sequence of (x, y,
+        # width, height) rectangles, a flat sequence of 4 numbers per
+        # rectangle, or a NumPy-style array of either shape (anything with a
+        # tolist() method, like array.array). fill_color and stroke_color are
+        # each one color for every annotation, a sequence or array of one
+        # color per rectangle, or None for no color. All of the rectangles are
+        # checked before any are added. Returns self, like add_annotation().
+        self._raise_if_frozen()
+        _add_square_annotations(self, rectangles, fill_color, stroke_color)
+        return self
+
+    @_timed('layout', page_layout=True)
+    def layout_deferred(self) -> None:
+        # (New Warbler method)
+        # Lays out the paragraphs that defer() queued. Text that doesn't fit
+        # continues on a new page, the same as with add().
+        while self.deferred_paragraphs:
+            specs, self.deferred_paragraphs = self.deferred_paragraphs, []
+            layout = self._get_default_layout()
+            for spec in specs:
+                layout.add(Paragraph(spec.text, style=spec.style))
+
+    def _raise_if_frozen(self) -> None:
+        if self._frozen:
+            raise ValueError('cannot change a page of a frozen Document')
+
+    def _get_default_layout(self) -> BorbSingleColumnLayout:
+        if self.default_layout_obj is None:
+            self.default_layout_obj = BorbSingleColumnLayout(self)
+            if self._template is not None and self._template.default_layout_obj is not None:
+                # Text added to the page goes below the template's text, the
+                # same as if the template's text had been added to the page.
+                self.default_layout_obj._previous_element = self._template.default_layout_obj._previous_element
+        if self.deferred_paragraphs:
+            self.layout_deferred()  # (Anything added now goes after the deferred paragraphs.)
+        return self.default_layout_obj
+
+    def _add_if_it_fits(self, layout: BorbSingleColumnLayout, paragraph: BorbParagraph) -> bool:
+        # Places the paragraph below the layout's previous element, the same
+        # way SingleColumnLayout.add() does, but returns False instead of
+        # moving on to a new page when the paragraph doesn't fit.
+        available_space = self._available_space(layout, paragraph)
+        if available_space is None:
+            return False
+        if not self._fits(layout, paragraph, available_space):
+            if self._layout_is_empty(layout):
+                raise ValueError('text is too tall to fit on an empty page')
+            return False
+        self._paint_in_layout(layout, paragraph, available_space)
+        return True
+
+    def _layout_is_empty(self, layout: BorbSingleColumnLayout) -> bool:
+        # Returns True if nothing has been added to the layout yet. (On a page
+        # with a template, the layout starts out after the template's text.)
+        if self._template is not None and self._template.default_layout_obj is not None:
+            return layout._previous_element is self._template.default_layout_obj._previous_element
+        return layout._previous_element is None
+
+    def _available_space(
+        self, layout: BorbSingleColumnLayout, paragraph: BorbParagraph
+    ) -> typing.Optional[BorbRectangle]:
+        # Returns the space left for the paragraph below the layout's previous
+        # element, or None if there is no space left at all.
+        previous_element = layout._previous_element
+        if previous_element is None:
+            previous_y = layout._page_height - layout._vertical_margin_top
+            previous_margin_bottom = Decimal(0)
+        else:
+            previous_y = previous_element.get_previous_layout_box().get_y()
+            previous_margin_bottom = previous_element.get_margin_bottom()
+
+        available_height = (
+            previous_y
+            - layout._vertical_margin_bottom
+            - layout._get_margin_between_elements(previous_element, paragraph)
+            - max(previous_margin_bottom, paragraph.get_margin_top())
+            - paragraph.get_margin_bottom()
+        )
+        if available_height < 0:
+            return None
+        return BorbRectangle(
+            layout._horizontal_margin + paragraph.get_margin_left(),
+            layout._vertical_margin_bottom + paragraph.get_margin_bottom(),
+            layout._column_width - paragraph.get_margin_right() - paragraph.get_margin_left(),
+            available_height,
+        )
+
+    def _fits(self, layout: BorbSingleColumnLayout, paragraph: BorbParagraph, available_space: BorbRectangle) -> bool:
+        layout_box = paragraph.get_layout_box(available_space)
+        return (
+            layout_box.get_height() <= available_space.get_height()
+            and layout_box.get_y() >= layout._vertical_margin_bottom
+        )
+
+    def _paint_in_layout(
+        self, layout: BorbSingleColumnLayout, paragraph: BorbParagraph, available_space: BorbRectangle
+    ) -> None:
+        paragraph.paint(self, available_space)
+        layout._previous_element = paragraph
+        layout._previous_element_layout_rect = paragraph.get_previous_layout_box()
+
+    def _layout_y(self, layout: BorbSingleColumnLayout) -> Decimal:
+        # Returns where the layout's last element ends, or the top margin if
+        # nothing has been added yet.
+        if layout._previous_element is None:
+            return layout._page_height - layout._vertical_margin_top
+        return layout._previous_element.get_previous_layout_box().get_y()
+
+
+class PageTemplate(Page):
+    # (New Warbler class)
+    # Content that is repeated on many pages, like a letterhead, footer, or
+    # logo, laid out once and then drawn on every page that uses it:
+    #
+    #     letterhead = warbler.PageTemplate()
+    #     letterhead.add('ACME Corporation', font_size=20)
+    #     for statement in statements:
+    #         page = warbler.Page(template=letterhead)
+    #         page.add(statement)
+    #         doc.add_page(page)
+    #
+    # Content is added to a template the same way as to a Page. The first
+    # time a page uses the template, the template's content becomes a Form
+    # XObject that all of the pages share, so the PDF holds the drawing only
+    # once. Nothing more can be added to the template after that. Only the
+    # drawing is shared: annotations and form fields on a template are not.
+    #
+    # The template is drawn from the page's lower left corner, so it should
+    # usually be the same size as the pages that use it.
+    def __init__(self, width: NumberType = Decimal(612), height: NumberType = Decimal(792), size: str = ''):
+        super().__init__(width, height, size)
+        self._form_xobject: typing.Optional[BorbStream] = None
+
+    def append_to_content_stream(self, s: str) -> 'PageTemplate':
+        # (Overridden method)
+        if self._form_xobject is not None:
+            raise ValueError('cannot add to a PageTemplate after a page has used it')
+        return super().append_to_content_stream(s)
+
+    def _get_form_xobject(self) -> BorbStream:
+        if self._form_xobject is None:
+            self.layout_deferred()
+            form_xobject = BorbStream()
+            form_xobject[BorbName('Type')] = BorbName('XObject')
+            form_xobject[BorbName('Subtype')] = BorbName('Form')
+            form_xobject[BorbName('BBox')] = BorbList().set_is_inline(True)
+            for value in self['MediaBox']:
+                form_xobject['BBox'].append(BorbDecimal(value))
+            if 'Resources' in self:
+                form_xobject[BorbName('Resources')] = self['Resources']
+            form_xobject[BorbName('DecodedBytes')] = self['Contents']['DecodedBytes'] if 'Contents' in self else b''
+            form_xobject[BorbName('Filter')] = BorbName('FlateDecode')
+            self._form_xobject = form_xobject
+        return self._form_xobject
+
 
 class Paragraph(BorbParagraph):
+    @_timed('paragraph')
     def __init__(
         self,
         text: str,
@@ -133,244 +811,293 @@ class Paragraph(BorbParagraph):
         multiplied_leading: typing.Optional[NumberType] = None,
         background_color: typing.Optional[ColorType] = None,
         hyphenation: typing.Optional[Union[BorbHyphenation, str]] = None,
+        style: typing.Optional[ParagraphStyle] = None,
     ):
-        font = _normalize_font(font)
+        # A style normalizes all of the keyword arguments at once. If a
+        # ParagraphStyle was passed in, the other style arguments are ignored
+        # and no normalization needs to be done at all.
+        if style is None:
+            style = ParagraphStyle(
+                respect_newlines_in_text=respect_newlines_in_text,
+                respect_spaces_in_text=respect_spaces_in_text,
+                font=font,
+                font_size=font_size,
+                text_alignment=text_alignment,
+                alignment=alignment,
+                font_color=font_color,
+                border=border,
+                border_radius=border_radius,
+                border_color=border_color,
+                border_width=border_width,
+                padding=padding,
+                margin=margin,
+                fixed_leading=fixed_leading,
+                multiplied_leading=multiplied_leading,
+                background_color=background_color,
+                hyphenation=hyphenation,
+            )
 
-        font_size = Decimal(font_size)
-        border_width = Decimal(border_width)
-        if fixed_leading is not None:
-            fixed_leading = Decimal(fixed_leading)
-        if multiplied_leading is not None:
-            multiplied_leading = Decimal(multiplied_leading)
+        borb_kwargs = style._borb_kwargs
+        if isinstance(borb_kwargs['font'], str):
+            # Use the shared font object instead of having borb load the
+            # standard font all over again for this paragraph.
+            borb_kwargs = dict(borb_kwargs, font=_standard_font(borb_kwargs['font']))
+        super().__init__(text, **borb_kwargs)
 
-        text_alignment = _normalize_text_alignment(text_alignment)
-        vertical_alignment, horizontal_alignment = _normalize_alignment(alignment)
+        # Set by _from_lines() for the parts of a paragraph split across pages:
+        self._fixed_lines: typing.Optional[typing.List[str]] = None
+        self._justify_last_line = False
 
-        font_color = _normalize_color(font_color)
-        border_color = _normalize_color(border_color)
-        if background_color is not None:
-            background_color = _normalize_color(background_color)
+    @classmethod
+    def _from_lines(cls, lines: typing.List[str], style: ParagraphStyle, is_last_part: bool) -> 'Paragraph':
+        # Creates a paragraph with exactly these lines, for one part of a
+        # paragraph that Document.add_text() split across pages. Justified
+        # text keeps justifying the last line of every part but the last.
+        paragraph = cls(' '.join(lines), style=style)
+        paragraph._fixed_lines = lines
+        paragraph._justify_last_line = not is_last_part
+        return paragraph
 
-        if isinstance(border, bool):
-            border_top = border_right = border_bottom = border_left = border
-        else:
-            border_top = border[0]
-            border_right = border[1]
-            border_bottom = border[2]
-            border_left = border[3]
-
-        if isinstance(border_radius, Decimal) or isinstance(border_radius, int) or isinstance(border_radius, float):
-            border_radius = Decimal(border_radius)
-            border_radius_top_left = border_radius
-            border_radius_top_right = border_radius
-            border_radius_bottom_right = border_radius
-            border_radius_bottom_left = border_radius
-        else:
-            border_radius_top_left = Decimal(border_radius[0])
-            border_radius_top_right = Decimal(border_radius[1])
-            border_radius_bottom_right = Decimal(border_radius[2])
-            border_radius_bottom_left = Decimal(border_radius[3])
-
-        if isinstance(padding, Decimal) or isinstance(padding, int) or isinstance(padding, float):
-            padding = Decimal(padding)
-            padding_top = padding
-            padding_right = padding
-            padding_bottom = padding
-            padding_left = padding
-        else:
-            padding_top = Decimal(padding[0])
-            padding_right = Decimal(padding[1])
-            padding_bottom = Decimal(padding[2])
-            padding_left = Decimal(padding[3])
-
-        if isinstance(margin, Decimal) or isinstance(margin, int) or isinstance(margin, float) or margin is None:
-            if margin is not None:
-                margin = Decimal(margin)
-            margin_top = margin
-            margin_right = margin
-            margin_bottom = margin
-            margin_left = margin
-        else:
-            margin_top = Decimal(margin[0])
-            margin_right = Decimal(margin[1])
-            margin_bottom = Decimal(margin[2])
-            margin_left = Decimal(margin[3])
-
-        if hyphenation is not None:
-            hyphenation = _normalize_hyphenation(hyphenation)
-
-        super().__init__(
-            text,
-            respect_newlines_in_text=respect_newlines_in_text,
-            respect_spaces_in_text=respect_spaces_in_text,
-            font=font,
-            font_size=font_size,
-            text_alignment=text_alignment,
-            vertical_alignment=vertical_alignment,
-            horizontal_alignment=horizontal_alignment,
-            font_color=font_color,
-            border_top=border_top,
-            border_right=border_right,
-            border_bottom=border_bottom,
-            border_left=border_left,
-            border_radius_top_left=border_radius_top_left,
-            border_radius_top_right=border_radius_top_right,
-            border_radius_bottom_right=border_radius_bottom_right,
-            border_radius_bottom_left=border_radius_bottom_left,
-            border_color=border_color,
-            border_width=border_width,
-            padding_top=padding_top,
-            padding_right=padding_right,
-            padding_bottom=padding_bottom,
-            padding_left=padding_left,
-            margin_top=margin_top,
-            margin_right=margin_right,
-            margin_bottom=margin_bottom,
-            margin_left=margin_left,
-            fixed_leading=fixed_leading,
-            multiplied_leading=multiplied_leading,
-            background_color=background_color,
-            hyphenation=hyphenation,
-        )  # TODO - pass the correct params here
+    def _get_content_box(self, available_space: BorbRectangle) -> BorbRectangle:
+        # (Overridden method)
+        content_box = super()._get_content_box(available_space)
+        if self._justify_last_line and self._text_alignment == BorbAlignment.JUSTIFIED:
+            self._previous_lines_of_text[-1]._text_alignment = BorbAlignment.JUSTIFIED
+        return content_box
+
+    def _split_text(self, bounding_box: BorbRectangle) -> typing.List[str]:
+        # (Overridden method)
+        # Breaks the text into lines the same way borb does, but instead of
+        # measuring each candidate line from scratch (which makes long
+        # paragraphs quadratic), it adds up the widths of the words on the
+        # line, which come from the shared text width cache.
+        if self._fixed_lines is not None:
+            return self._fixed_lines
+        font, font_size = self._font, self._font_size
+        respect_spaces = self._respect_spaces_in_text
+
+        tokens_to_preserve = set()
+        if self._respect_newlines_in_text:
+            tokens_to_preserve.add('\n')
+        if respect_spaces:
+            tokens_to_preserve.update((' ', '\t'))
+        words = [w for w in _WORD_SPLIT_REGEX.split(self._text) if w and (w in tokens_to_preserve or w not in ' \t\n')]
+
+        space_width = _text_width(font, font_size, ' ')
+        lines_of_text: typing.List[str] = []
+        line_width = Decimal(0)  # The width of lines_of_text[-1].
+        for w in words:
+            if w == '\n' and self._respect_newlines_in_text:
+                lines_of_text.append('')
+                line_width = Decimal(0)
+                continue
+
+            # The width of the current line, plus the space before the next word:
+            line_width_before_word = Decimal(0)
+            if lines_of_text:
+                line_width_before_word = line_width
+                if lines_of_text[-1] and not respect_spaces:
+                    line_width_before_word += space_width
+
+            # Rounded to 2 digits, as borb does, so rounding errors don't matter.
+            potential_width = line_width_before_word + _text_width(font, font_size, w)
+            if round(bounding_box.width - potential_width, 2) >= Decimal(0):
+                if not lines_of_text:
+                    lines_of_text.append(w)
+                else:
+                    if lines_of_text[-1] and not respect_spaces:
+                        lines_of_text[-1] += ' '
+                    lines_of_text[-1] += w
+                line_width = potential_width
+                continue
+
+            # The word doesn't fit on this line, but perhaps it can be hyphenated:
+            hyphenated_word_parts = [w]
+            if self._hyphenation is not None and not respect_spaces:
+                hyphenated_word_parts = self._hyphenation.hyphenate(w).split(chr(173))
+
+            hyphenation_split_index = 0
+            for i in range(1, len(hyphenated_word_parts)):
+                first_part = ''.join(hyphenated_word_parts[0:i]) + '-'
+                if round(bounding_box.width - line_width_before_word - _text_width(font, font_size, first_part), 2) > Decimal(0):
+                    hyphenation_split_index = i
+                else:
+                    break
+
+            if hyphenation_split_index == 0:
+                lines_of_text.append(w)
+                line_width = _text_width(font, font_size, w)
+                continue
+
+            if not lines_of_text:
+                lines_of_text.append('')
+            elif lines_of_text[-1] and not respect_spaces:
+                lines_of_text[-1] += ' '
+            lines_of_text[-1] += ''.join(hyphenated_word_parts[0:hyphenation_split_index]) + '-'
+            rest_of_word = ''.join(hyphenated_word_parts[hyphenation_split_index:])
+            lines_of_text.append(rest_of_word)
+            line_width = _text_width(font, font_size, rest_of_word)
+
+        while lines_of_text and lines_of_text[-1] == '':
+            lines_of_text.pop()
+
+        return lines_of_text if lines_of_text else ['']
+
+
+def _style_from_arguments(style: typing.Optional[ParagraphStyle], style_kwargs: Dict[str, typing.Any]) -> ParagraphStyle:
+    # Page.add_many(), Page.defer(), and Document.add_text() take a
+    # ParagraphStyle, the keyword arguments for one, or a ParagraphStyle plus
+    # overrides.
+    if style is None:
+        if not style_kwargs:
+            return _default_paragraph_style()
+        return ParagraphStyle(**style_kwargs)
+    elif style_kwargs:
+        return style.derive(**style_kwargs)
+    return style
+
+
+@functools.lru_cache(maxsize=None)
+def _default_paragraph_style() -> ParagraphStyle:
+    # ParagraphStyles can't be changed after they're made, so every call
+    # without any style arguments can share this one.
+    return ParagraphStyle()
+
+
+class _ParagraphLines:
+    # A paragraph that Document.add_text() is splitting across pages. The
+    # paragraph is broken into lines only once, and each page then lays out
+    # only the lines that it gets, so a paragraph that runs for N pages takes
+    # time in proportion to N, not N squared. Every part keeps the line
+    # breaks of the whole paragraph.
+    def __init__(self, paragraph: 'Paragraph', available_space: BorbRectangle, style: ParagraphStyle):
+        paragraph.get_layout_box(
+            BorbRectangle(available_space.get_x(), Decimal(0), available_space.get_width(), Decimal(2**31))
+        )
+        self.lines = [line._text for line in paragraph._previous_lines_of_text]
+        self.style = style
+        self.position = 0  # (The index of the first line that isn't on a page yet.)
+
+        # The line height (for guessing how many lines fit on each page) and
+        # the height of the paragraph's padding and border.
+        content_height = paragraph._previous_content_box.get_height()
+        self.line_height = content_height / len(self.lines)
+        self.other_height = paragraph.get_previous_layout_box().get_height() - content_height
+
+    def next_part(
+        self, page: 'Page', layout: BorbSingleColumnLayout, available_space: BorbRectangle
+    ) -> typing.Optional['Paragraph']:
+        # Returns a paragraph of as many of the next lines as fit in
+        # available_space, or None if not even one line fits. Justified text
+        # keeps justifying the last line of every part but the last.
+        count = int((available_space.get_height() - self.other_height) / self.line_height)
+        count = max(0, min(count, len(self.lines) - self.position))
+        while count > 0:
+            end = self.position + count
+            is_last_part = end == len(self.lines)
+            part = Paragraph._from_lines(self.lines[self.position : end], self.style, is_last_part=is_last_part)
+            if page._fits(layout, part, available_space):
+                self.position = end
+                return part
+            count -= 1
+        return None
+
+    def is_done(self) -> bool:
+        return self.position == len(self.lines)
+
+
+# Splits text into words, keeping the spaces, tabs, and newlines between them.
+_WORD_SPLIT_REGEX = re.compile(r'([ \t\n])')
+
+
+# Page sizes by (family, orientation) key, e.g. ('LETTER', 'LANDSCAPE').
+# This starts with all of borb's page sizes, and register_page_size() can
+# add custom ones.
+_PAGE_SIZES: Dict[Tuple[str, str], Tuple[Decimal, Decimal]] = {}
+for _borbPageSize in BorbPageSize:
+    _family, _orientation = _borbPageSize.name.rsplit('_', 1)
+    _PAGE_SIZES[(_family, _orientation)] = (_borbPageSize.value[0], _borbPageSize.value[1])
+
+
+def _filled_page(template_page: BorbPage, values: Dict[str, typing.Any]) -> Page:
+    # Returns a copy of a frozen template page for Document.fill(), with the
+    # text in values painted in the page's slots. The copy shares the
+    # template page's entries, except for the ones it has to change: its
+    # annotations (which point back at their page), and if any slots are
+    # filled in, its content (the template page's content stream, followed
+    # by a new one with the slots' text) and its fonts (which the new text
+    # may add to).
+    page_info = template_page.get_page_info()
+    page = Page(page_info.get_width(), page_info.get_height())
+    for key, value in template_page.items():
+        if key != 'Parent':
+            page[key] = value
+    if 'Annots' in template_page:
+        page[BorbName('Annots')] = BorbList()
+        for annotation in template_page['Annots']:
+            annotation = _copy_dictionary(annotation)
+            annotation[BorbName('P')] = page
+            page['Annots'].append(annotation)
+
+    slots = [(slot, values[name]) for name, slot in getattr(template_page, 'slots', {}).items() if name in values]
+    if slots:
+        template_contents = page.pop('Contents', None)
+        page[BorbName('Resources')] = _copy_dictionary(page['Resources']) if 'Resources' in page else BorbDictionary()
+        if 'Font' in page['Resources']:
+            page['Resources'][BorbName('Font')] = _copy_dictionary(page['Resources']['Font'])
+        for slot, text in slots:
+            paragraph = Paragraph(str(text), style=slot.style)
+            # (Rounded like borb's own checks, since its Decimal arithmetic
+            # doesn't always come out exact.)
+            height = paragraph.get_layout_box(slot.available_space).get_height()
+            if round(height, 2) > round(slot.available_space.get_height(), 2):
+                raise ValueError('the text for a slot is too tall to fit in it: %r' % (text,))
+            paragraph.paint(page, slot.available_space)
+
+        contents = BorbList()
+        if isinstance(template_contents, BorbList):
+            contents.extend(template_contents)
+        elif template_contents is not None:
+            contents.append(template_contents)
+        contents.append(page['Contents'])
+        page[BorbName('Contents')] = contents
+    page._frozen = True
+    return page
+
+
+def _page_like(page: BorbPage) -> Page:
+    # Returns a new page with the same size and template as page.
+    page_info = page.get_page_info()
+    return Page(page_info.get_width(), page_info.get_height(), template=getattr(page, '_template', None))
+
+
+def register_page_size(name: str, width: NumberType, height: NumberType) -> None:
+    """Adds a custom page size (in points) that can be used as Page(size=name). The landscape orientation swaps the width and height."""
+    family, orientation = _parsePageSizeName(name)
+    if orientation == 'LANDSCAPE':
+        width, height = height, width
+    _PAGE_SIZES[(family, 'PORTRAIT')] = (Decimal(width), Decimal(height))
+    _PAGE_SIZES[(family, 'LANDSCAPE')] = (Decimal(height), Decimal(width))
+
+
+@functools.lru_cache(maxsize=256)
+def _parsePageSizeName(pageSizeName: str) -> Tuple[str, str]:
+    # Turns names like 'letter', 'A4 landscape', or 'LEGAL_PORTRAIT' into a
+    # (family, orientation) key. The orientation defaults to portrait.
+    pageSizeName = re.sub(r'[\s_-]+', '', pageSizeName.upper())
+
+    orientation = 'PORTRAIT'
+    for possibleOrientation in ('PORTRAIT', 'LANDSCAPE'):
+        if pageSizeName.startswith(possibleOrientation) or pageSizeName.endswith(possibleOrientation):
+            orientation = possibleOrientation
+            pageSizeName = pageSizeName.replace(possibleOrientation, '', 1)
+            break
+
+    return (pageSizeName, orientation)
 
 
 def _pageSizeFromName(pageSizeName: str) -> Tuple[Decimal, Decimal]:
-    pageSizeName = pageSizeName.upper()
-
-    if pageSizeName in 'LETTER' or ('LETTER' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.LETTER_PORTRAIT.value[0], BorbPageSize.LETTER_PORTRAIT.value[1])
-    elif 'LETTER' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.LETTER_LANDSCAPE.value[0], BorbPageSize.LETTER_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'LEGAL' or ('LEGAL' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.LEGAL_PORTRAIT.value[0], BorbPageSize.LEGAL_PORTRAIT.value[1])
-    elif 'LEGAL' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.LEGAL_LANDSCAPE.value[0], BorbPageSize.LEGAL_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'TABLOID' or ('TABLOID' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.TABLOID_PORTRAIT.value[0], BorbPageSize.TABLOID_PORTRAIT.value[1])
-    elif 'TABLOID' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.TABLOID_LANDSCAPE.value[0], BorbPageSize.TABLOID_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'LEDGER' or ('LEDGER' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.LEDGER_PORTRAIT.value[0], BorbPageSize.LEDGER_PORTRAIT.value[1])
-    elif 'LEDGER' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.LEDGER_LANDSCAPE.value[0], BorbPageSize.LEDGER_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'EXECUTIVE' or ('EXECUTIVE' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.EXECUTIVE_PORTRAIT.value[0], BorbPageSize.EXECUTIVE_PORTRAIT.value[1])
-    elif 'EXECUTIVE' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.EXECUTIVE_LANDSCAPE.value[0], BorbPageSize.EXECUTIVE_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'A0' or ('A0' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.A0_PORTRAIT.value[0], BorbPageSize.A0_PORTRAIT.value[1])
-    elif 'A0' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.A0_LANDSCAPE.value[0], BorbPageSize.A0_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'A1' or ('A1' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.A1_PORTRAIT.value[0], BorbPageSize.A1_PORTRAIT.value[1])
-    elif 'A1' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.A1_LANDSCAPE.value[0], BorbPageSize.A1_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'A2' or ('A2' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.A2_PORTRAIT.value[0], BorbPageSize.A2_PORTRAIT.value[1])
-    elif 'A2' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.A2_LANDSCAPE.value[0], BorbPageSize.A2_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'A3' or ('A3' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.A3_PORTRAIT.value[0], BorbPageSize.A3_PORTRAIT.value[1])
-    elif 'A3' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.A3_LANDSCAPE.value[0], BorbPageSize.A3_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'A4' or ('A4' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.A4_PORTRAIT.value[0], BorbPageSize.A4_PORTRAIT.value[1])
-    elif 'A4' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.A4_LANDSCAPE.value[0], BorbPageSize.A4_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'A5' or ('A5' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.A5_PORTRAIT.value[0], BorbPageSize.A5_PORTRAIT.value[1])
-    elif 'A5' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.A5_LANDSCAPE.value[0], BorbPageSize.A5_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'A6' or ('A6' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.A6_PORTRAIT.value[0], BorbPageSize.A6_PORTRAIT.value[1])
-    elif 'A6' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.A6_LANDSCAPE.value[0], BorbPageSize.A6_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'A7' or ('A7' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.A7_PORTRAIT.value[0], BorbPageSize.A7_PORTRAIT.value[1])
-    elif 'A7' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.A7_LANDSCAPE.value[0], BorbPageSize.A7_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'A8' or ('A8' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.A8_PORTRAIT.value[0], BorbPageSize.A8_PORTRAIT.value[1])
-    elif 'A8' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.A8_LANDSCAPE.value[0], BorbPageSize.A8_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'A9' or ('A9' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.A9_PORTRAIT.value[0], BorbPageSize.A9_PORTRAIT.value[1])
-    elif 'A9' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.A9_LANDSCAPE.value[0], BorbPageSize.A9_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'A10' or ('A10' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.A10_PORTRAIT.value[0], BorbPageSize.A10_PORTRAIT.value[1])
-    elif 'A10' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.A10_LANDSCAPE.value[0], BorbPageSize.A10_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'B0' or ('B0' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.B0_PORTRAIT.value[0], BorbPageSize.B0_PORTRAIT.value[1])
-    elif 'B0' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.B0_LANDSCAPE.value[0], BorbPageSize.B0_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'B1' or ('B1' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.B1_PORTRAIT.value[0], BorbPageSize.B1_PORTRAIT.value[1])
-    elif 'B1' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.B1_LANDSCAPE.value[0], BorbPageSize.B1_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'B2' or ('B2' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.B2_PORTRAIT.value[0], BorbPageSize.B2_PORTRAIT.value[1])
-    elif 'B2' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.B2_LANDSCAPE.value[0], BorbPageSize.B2_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'B3' or ('B3' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.B3_PORTRAIT.value[0], BorbPageSize.B3_PORTRAIT.value[1])
-    elif 'B3' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.B3_LANDSCAPE.value[0], BorbPageSize.B3_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'B4' or ('B4' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.B4_PORTRAIT.value[0], BorbPageSize.B4_PORTRAIT.value[1])
-    elif 'B4' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.B4_LANDSCAPE.value[0], BorbPageSize.B4_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'B5' or ('B5' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.B5_PORTRAIT.value[0], BorbPageSize.B5_PORTRAIT.value[1])
-    elif 'B5' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.B5_LANDSCAPE.value[0], BorbPageSize.B5_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'B6' or ('B6' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.B6_PORTRAIT.value[0], BorbPageSize.B6_PORTRAIT.value[1])
-    elif 'B6' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.B6_LANDSCAPE.value[0], BorbPageSize.B6_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'B7' or ('B7' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.B7_PORTRAIT.value[0], BorbPageSize.B7_PORTRAIT.value[1])
-    elif 'B7' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.B7_LANDSCAPE.value[0], BorbPageSize.B7_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'B8' or ('B8' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.B8_PORTRAIT.value[0], BorbPageSize.B8_PORTRAIT.value[1])
-    elif 'B8' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.B8_LANDSCAPE.value[0], BorbPageSize.B8_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'B9' or ('B9' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.B9_PORTRAIT.value[0], BorbPageSize.B9_PORTRAIT.value[1])
-    elif 'B9' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.B9_LANDSCAPE.value[0], BorbPageSize.B9_LANDSCAPE.value[1])
-
-    elif pageSizeName in 'B10' or ('B10' in pageSizeName and 'PORTRAIT' in pageSizeName):
-        return (BorbPageSize.B10_PORTRAIT.value[0], BorbPageSize.B10_PORTRAIT.value[1])
-    elif 'B10' in pageSizeName and 'LANDSCAPE' in pageSizeName:
-        return (BorbPageSize.B10_LANDSCAPE.value[0], BorbPageSize.B10_LANDSCAPE.value[1])
-
-    else:
-        raise ValueError('page size must be a valid page size name')
+    try:
+        return _PAGE_SIZES[_parsePageSizeName(pageSizeName)]
+    except KeyError:
+        raise ValueError('page size must be a valid page size name') from None
@@ -0,0 +1,299 @@
+from borb.io.read.types import Decimal as BorbDecimal, Dictionary as BorbDictionary, Name as BorbName
+from borb.io.read.types import Stream as BorbStream
+from borb.pdf import Page as BorbPage
+from PIL import Image as PILImage
+
+from .profiling import _timed
+from .subset import _DELIMITER, _INLINE_IMAGE_END_REGEX, _read_literal_string
+
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import contextlib
+import hashlib
+import io
+import math
+import re
+import threading
+
+# JPEG-encoding (and scaling down) an image takes much longer than writing
+# it, so the encoded images for the most recently saved documents are kept.
+# Documents in a batch often show the same images (e.g. a logo on every
+# invoice), and each one is only encoded once.
+IMAGE_CACHE_MAX_SIZE = 64
+
+_image_cache: 'OrderedDict[Tuple[bytes, int, int], bytes]' = OrderedDict()
+_image_cache_lock = threading.Lock()
+
+# The tokens in a content stream that matter for finding the size that each
+# image is drawn at: transformation matrices, XObjects, graphics state saves
+# and restores, and strings, comments, and inline images (which are skipped).
+_IMAGE_TOKEN_REGEX = re.compile(
+    rb'(?<![^%(d)s])((?:[-+.0-9]+[\x00\t\n\x0c\r ]+){6})cm(?![^%(d)s])'  # 1: a b c d e f cm
+    rb'|/([^%(d)s]+)[\x00\t\n\x0c\r ]+Do(?![^%(d)s])'  # 2: /Im1 Do
+    rb'|<[0-9A-Fa-f\x00\t\n\x0c\r ]*>'  # <hex string>
+    rb'|(\()'  # 3: (literal string)
+    rb'|(?<![^%(d)s])([qQ]|BI)(?![^%(d)s])'  # 4: q, Q, or BI
+    rb'|%%[^\r\n]*' % {b'd': _DELIMITER}
+)
+
+# The a, b, c, and d of a transformation matrix that doesn't scale, rotate,
+# or skew anything.
+_IDENTITY_MATRIX = (1.0, 0.0, 0.0, 1.0)
+
+
+@contextlib.contextmanager
+def _share_images(
+    pages: Iterable[BorbPage],
+    image_dpi: Optional[float],
+    image_streams: Optional[Dict[Tuple[bytes, int, int], BorbStream]] = None,
+) -> Iterator[None]:
+    # While the with block runs (that is, while the document is written),
+    # each image in the pages' resources is replaced with an image XObject
+    # stream of its JPEG-encoded pixels. Images with the same pixels share
+    # one stream, so each distinct image is written once, even if a separate
+    # copy of it was loaded for each page. If image_dpi is given, images are
+    # scaled down to image_dpi pixels per inch at the largest size they are
+    # drawn at. The original images are put back afterwards.
+    #
+    # image_streams holds the streams by image; a DocumentWriter passes the
+    # same dict for every page, so that its pages share them too.
+    scanner = _ImageScanner()
+    for page in pages:
+        scanner.scan(page.get('Contents'), page.get('Resources'))
+    if not scanner.images:
+        yield
+        return
+
+    # Copies of the same image are drawn at the largest size that any copy is.
+    digests = {image_id: _image_digest(image) for image_id, image in scanner.images.items()}
+    placed_sizes: Dict[bytes, Tuple[float, float]] = {}
+    unscannable_digests = set(digests[image_id] for image_id in scanner.unscannable_image_ids)
+    for image_id, (width, height) in scanner.placed_sizes.items():
+        other_width, other_height = placed_sizes.get(digests[image_id], (0.0, 0.0))
+        placed_sizes[digests[image_id]] = (max(width, other_width), max(height, other_height))
+
+    if image_streams is None:
+        image_streams = {}
+    replaced_images: List[Tuple[BorbDictionary, BorbName, Any]] = []
+    try:
+        for xobjects in scanner.xobject_resources:
+            for name, image in list(xobjects.items()):
+                if id(image) not in digests:
+                    continue
+                digest = digests[id(image)]
+                placed_size = None if digest in unscannable_digests else placed_sizes.get(digest)
+                width, height = _scaled_size(image, placed_size, image_dpi)
+                stream = image_streams.get((digest, width, height))
+                if stream is None:
+                    stream = image_streams[(digest, width, height)] = _image_stream(image, digest, width, height)
+                replaced_images.append((xobjects, name, image))
+                xobjects[name] = stream
+        yield
+    finally:
+        for xobjects, name, image in replaced_images:
+            xobjects[name] = image
+
+
+class _ImageScanner:
+    # Reads content streams and records the largest width and height (in
+    # points) that each image is drawn at, by following the transformation
+    # matrices that the content streams set up. Like _GlyphScanner, this only
+    # recognizes as much of the content stream syntax as it needs to.
+    def __init__(self):
+        self.images: Dict[int, PILImage.Image] = {}
+        self.xobject_resources: List[BorbDictionary] = []
+        self.placed_sizes: Dict[int, Tuple[float, float]] = {}
+        self.unscannable_image_ids: Set[int] = set()
+        self._has_images: Dict[int, bool] = {}
+        self._scanned: Set[Tuple[int, int, Tuple[float, ...]]] = set()
+
+    def scan(self, contents: Any, resources: Any, matrix: Tuple[float, ...] = _IDENTITY_MATRIX) -> None:
+        if not isinstance(resources, BorbDictionary):
+            return
+        xobjects = resources.get('XObject')
+        if not isinstance(xobjects, BorbDictionary) or not self._contains_images(xobjects):
+            return  # (Most pages have no images, and their content streams aren't read.)
+        if (id(contents), id(resources), matrix) in self._scanned:
+            return  # E.g. a PageTemplate's Form XObject, which many pages draw the same way.
+        self._scanned.add((id(contents), id(resources), matrix))
+
+        if not any(xobjects is other for other in self.xobject_resources):
+            self.xobject_resources.append(xobjects)
+            for xobject in xobjects.values():
+                if isinstance(xobject, PILImage.Image):
+                    self.images.setdefault(id(xobject), xobject)
+
+        if isinstance(contents, BorbStream):
+            contents = [contents]
+        if not isinstance(contents, (list, type(None))) or any(
+            not isinstance(stream, BorbStream) or 'DecodedBytes' not in stream for stream in contents or []
+        ):
+            # Without the decoded content, there's no telling how big these
+            # images are drawn, so they are kept at their full size.
+            self.unscannable_image_ids.update(
+                id(xobject) for xobject in xobjects.values() if isinstance(xobject, PILImage.Image)
+            )
+            return
+        for stream in contents or []:
+            self._scan_content_stream(bytes(stream['DecodedBytes']), xobjects, resources, matrix)
+
+    def _contains_images(self, xobjects: BorbDictionary) -> bool:
+        # Whether any of these XObjects is an image, or a form with images.
+        if id(xobjects) not in self._has_images:
+            self._has_images[id(xobjects)] = False  # (In case a form contains itself.)
+            self._has_images[id(xobjects)] = any(
+                isinstance(xobject, PILImage.Image)
+                or (
+                    _is_form(xobject)
+                    and isinstance(xobject.get('Resources'), BorbDictionary)
+                    and isinstance(xobject['Resources'].get('XObject'), BorbDictionary)
+                    and self._contains_images(xobject['Resources']['XObject'])
+                )
+                for xobject in xobjects.values()
+            )
+        return self._has_images[id(xobjects)]
+
+    def _scan_content_stream(
+        self, content: bytes, xobjects: BorbDictionary, resources: BorbDictionary, matrix: Tuple[float, ...]
+    ) -> None:
+        initial_matrix = matrix
+        saved_matrices = []
+        position = 0
+        while True:
+            match = _IMAGE_TOKEN_REGEX.search(content, position)
+            if match is None:
+                return
+            position = match.end()
+            operands, xobject_name, literal_string_start, operator = match.groups()
+
+            if operands is not None:
+                try:
+                    matrix = _multiply(tuple(float(operand) for operand in operands.split()[:4]), matrix)
+                except ValueError:
+                    pass  # (Not a number after all.)
+            elif xobject_name is not None:
+                xobject = xobjects.get(xobject_name.decode('latin1'))
+                if isinstance(xobject, PILImage.Image):
+                    # An image fills the unit square, so its size is the
+                    # length of the matrix's x and y axes.
+                    width, height = math.hypot(matrix[0], matrix[1]), math.hypot(matrix[2], matrix[3])
+                    other_width, other_height = self.placed_sizes.get(id(xobject), (0.0, 0.0))
+                    self.placed_sizes[id(xobject)] = (max(width, other_width), max(height, other_height))
+                elif _is_form(xobject):
+                    form_matrix = xobject.get('Matrix')
+                    if isinstance(form_matrix, list) and len(form_matrix) == 6:
+                        form_matrix = _multiply(tuple(float(number) for number in form_matrix[:4]), matrix)
+                    else:
+                        form_matrix = matrix
+                    # (A form without its own resources uses the page's.)
+                    self.scan(xobject, xobject.get('Resources', resources), form_matrix)
+            elif literal_string_start is not None:
+                position = _read_literal_string(content, position)[1]
+            elif operator == b'q':
+                saved_matrices.append(matrix)
+            elif operator == b'Q':
+                matrix = saved_matrices.pop() if saved_matrices else initial_matrix
+            elif operator == b'BI':
+                # Skip the inline image's data, which could look like anything.
+                end_match = _INLINE_IMAGE_END_REGEX.search(content, position)
+                position = len(content) if end_match is None else end_match.end()
+
+
+def _check_image_dpi(image_dpi: Any) -> None:
+    if image_dpi is not None and not float(image_dpi) > 0:
+        raise ValueError('image_dpi must be a positive number of pixels per inch, not %r' % (image_dpi,))
+
+
+def _is_form(xobject: Any) -> bool:
+    return isinstance(xobject, BorbStream) and xobject.get('Subtype') == 'Form'
+
+
+def _multiply(first: Tuple[float, ...], second: Tuple[float, ...]) -> Tuple[float, ...]:
+    # Multiplies the scaling, rotating, and skewing parts (a, b, c, and d) of
+    # two transformation matrices. (Translation doesn't change sizes.)
+    a, b, c, d = first
+    e, f, g, h = second
+    return (a * e + b * g, a * f + b * h, c * e + d * g, c * f + d * h)
+
+
+def _image_digest(image: PILImage.Image) -> bytes:
+    # A hash of everything that the written image depends on: its mode,
+    # size, palette, transparent color, and pixels.
+    digest = hashlib.sha1(
+        ('%s %d %d %r' % (image.mode, image.width, image.height, image.info.get('transparency'))).encode('utf-8')
+    )
+    if image.mode == 'P':
+        digest.update(bytes(image.getpalette() or []))
+    digest.update(image.tobytes())
+    return digest.digest()
+
+
+def _scaled_size(
+    image: PILImage.Image, placed_size: Optional[Tuple[float, float]], image_dpi: Optional[float]
+) -> Tuple[int, int]:
+    # The size in pixels to write an image at: smaller than its own size if
+    # it's drawn at more than image_dpi pixels per inch (in both directions),
+    # keeping the same aspect ratio.
+    if image_dpi is None or placed_size is None:
+        return image.width, image.height
+    scale = max(
+        placed_size[0] * float(image_dpi) / 72 / image.width, placed_size[1] * float(image_dpi) / 72 / image.height
+    )
+    if scale >= 1:
+        return image.width, image.height
+    return max(1, math.ceil(image.width * scale)), max(1, math.ceil(image.height * scale))
+
+
+def _image_stream(image: PILImage.Image, digest: bytes, width: int, height: int) -> BorbStream:
+    # Returns a new image XObject stream for the image, at width x height
+    # pixels, with the same entries that borb's ImageTransformer writes. The
+    # stream is made for each document, but its JPEG data comes from the
+    # cache when it can.
+    key = (digest, width, height)
+    with _image_cache_lock:
+        jpeg_bytes = _image_cache.get(key)
+        if jpeg_bytes is not None:
+            _image_cache.move_to_end(key)
+    if jpeg_bytes is None:
+        jpeg_bytes = _encode_image(image, width, height)
+        with _image_cache_lock:
+            _image_cache[key] = jpeg_bytes
+            while len(_image_cache) > IMAGE_CACHE_MAX_SIZE:
+                _image_cache.popitem(last=False)
+
+    stream = BorbStream()
+    stream[BorbName('Type')] = BorbName('XObject')
+    stream[BorbName('Subtype')] = BorbName('Image')
+    stream[BorbName('Width')] = BorbDecimal(width)
+    stream[BorbName('Height')] = BorbDecimal(height)
+    stream[BorbName('Length')] = BorbDecimal(len(jpeg_bytes))
+    stream[BorbName('Filter')] = BorbName('DCTDecode')
+    stream[BorbName('BitsPerComponent')] = BorbDecimal(8)
+    stream[BorbName('ColorSpace')] = BorbName('DeviceRGB')
+    stream[BorbName('Bytes')] = jpeg_bytes
+    return stream
+
+
+@_timed('image_processing')
+def _encode_image(image: PILImage.Image, width: int, height: int) -> bytes:
+    # The same as borb's ImageTransformer: transparent pixels are drawn on
+    # white, and the image is saved as an RGB JPEG (after being scaled down,
+    # if it's bigger than width x height).
+    if image.mode == 'P':
+        image = image.convert('RGBA')
+    if image.mode in ('RGBA', 'LA'):
+        background = PILImage.new(image.mode[:-1], image.size, 'white')
+        background.paste(image, image.split()[-1])
+        image = background
+    image = image.convert('RGB')
+    if image.size != (width, height):
+        image = image.resize((width, height), PILImage.LANCZOS)
+    with io.BytesIO() as output:
+        image.save(output, format='JPEG')
+        return output.getvalue()
+
+
+def clear_image_cache() -> None:
+    """Removes all of the JPEG-encoded images made while saving documents from the image cache."""
+    with _image_cache_lock:
+        _image_cache.clear()
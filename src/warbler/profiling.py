@@ -0,0 +1,195 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import contextvars
+import functools
+import json
+import threading
+import time
+import weakref
+
+# The Profile that is collecting timings, if any. Checking this is the only
+# work that instrumented functions do when nothing is being profiled.
+_current_profile: 'contextvars.ContextVar[Optional[Profile]]' = contextvars.ContextVar(
+    'warbler_profile', default=None
+)
+
+# The instrumented calls in progress, as [stage, seconds spent in inner
+# stages] lists. A context variable (instead of a list in the Profile) keeps
+# the calls made in different threads and asyncio tasks apart.
+_current_calls: 'contextvars.ContextVar[Tuple[List[Any], ...]]' = contextvars.ContextVar(
+    'warbler_profile_calls', default=()
+)
+
+
+class Profile:
+    # Collects how long Warbler spends in each stage of making PDFs while the
+    # with block runs:
+    #
+    #     with warbler.Profile() as profile:
+    #         doc = build_document()
+    #         doc.save('report.pdf')
+    #     print(profile.to_json(indent=2))
+    #
+    # The stages are 'font_loading' (_normalize_font()), 'paragraph'
+    # (Paragraph construction and argument normalization), 'layout'
+    # (Page.add(), Page.add_many(), Document.add_text(), Document.fill(), and
+    # the like), 'save' (writing PDFs with Document.save(),
+    # Document.to_bytes(), or a DocumentWriter), 'font_subsetting', and
+    # 'image_processing' (JPEG-encoding and scaling down images). For
+    # each stage, the report has the number of calls, the total seconds, and
+    # the "self" seconds that weren't spent in another stage (e.g.
+    # Page.add()'s layout time, not counting the Paragraph it makes). Each
+    # saved document also gets an entry with its size in bytes and, for each
+    # page, its content stream's size and the layout calls made on it.
+    #
+    # If a callback is given, it's called with the report (the same dict as
+    # as_dict() returns) when the with block ends, e.g. to send the numbers
+    # to a metrics service. The code in the with block is measured, along
+    # with the asyncio tasks and asyncio.to_thread() calls it starts, but
+    # not other threads or processes (like render_many()'s workers). A
+    # Profile inside another one adds its numbers to the outer one when it
+    # ends.
+    def __init__(self, callback: Optional[Callable[[Dict[str, Any]], Any]] = None):
+        self.callback = callback
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.documents: List[Dict[str, Any]] = []
+        self._page_layouts: Dict[int, List[Any]] = {}  # id(page): [weakref to page, calls, seconds]
+        self._lock = threading.Lock()
+        self._token: Optional[contextvars.Token] = None
+
+    def __enter__(self) -> 'Profile':
+        if self._token is not None:
+            raise ValueError('this Profile is already in use')
+        self._token = _current_profile.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        _current_profile.reset(self._token)
+        self._token = None
+        outer_profile = _current_profile.get()
+        if outer_profile is not None:
+            outer_profile._merge(self)
+        if self.callback is not None:
+            self.callback(self.as_dict())
+
+    def as_dict(self) -> Dict[str, Any]:
+        # Returns the report as a dict of lists, dicts, strs, and numbers.
+        with self._lock:
+            return {
+                'stages': {stage: dict(stats) for stage, stats in self.stages.items()},
+                'documents': [
+                    dict(document, pages=[dict(page) for page in document['pages']]) for document in self.documents
+                ],
+            }
+
+    def to_json(self, **json_kwargs) -> str:
+        # Returns the report as JSON text. The keyword arguments are passed
+        # to json.dumps(), e.g. indent=2.
+        return json.dumps(self.as_dict(), **json_kwargs)
+
+    def _add_call(self, stage: str, seconds: float, self_seconds: float, page: Any = None) -> None:
+        with self._lock:
+            self._add_stage(stage, 1, seconds, self_seconds)
+            if page is not None:
+                self._add_page_layout(page, 1, seconds)
+
+    def _add_stage(self, stage: str, calls: int, seconds: float, self_seconds: float) -> None:
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = {'calls': 0, 'seconds': 0.0, 'self_seconds': 0.0}
+        stats['calls'] += calls
+        stats['seconds'] += seconds
+        stats['self_seconds'] += self_seconds
+
+    def _add_page_layout(self, page: Any, calls: int, seconds: float) -> None:
+        # (Pages are looked up by id(), since borb's Dictionary objects
+        # aren't hashable. The weak reference checks that the id wasn't
+        # reused by a new page after the old one was garbage collected.)
+        page_layout = self._page_layouts.get(id(page))
+        if page_layout is None or page_layout[0]() is not page:
+            page_layout = self._page_layouts[id(page)] = [weakref.ref(page), 0, 0.0]
+        page_layout[1] += calls
+        page_layout[2] += seconds
+
+    def _page_entry(self, page: Any) -> Dict[str, Any]:
+        with self._lock:
+            page_layout = self._page_layouts.get(id(page))
+        if page_layout is None or page_layout[0]() is not page:
+            page_layout = [None, 0, 0.0]
+        return {
+            'content_bytes': _content_bytes(page.get('Contents')),
+            'layout_calls': page_layout[1],
+            'layout_seconds': page_layout[2],
+        }
+
+    def _add_document(self, page_entries: List[Dict[str, Any]], bytes_written: int, seconds: float) -> None:
+        with self._lock:
+            self.documents.append({'bytes_written': bytes_written, 'seconds': seconds, 'pages': page_entries})
+
+    def _merge(self, profile: 'Profile') -> None:
+        with self._lock, profile._lock:
+            for stage, stats in profile.stages.items():
+                self._add_stage(stage, stats['calls'], stats['seconds'], stats['self_seconds'])
+            self.documents.extend(profile.documents)
+            for page_ref, calls, seconds in profile._page_layouts.values():
+                page = page_ref()
+                if page is not None:
+                    self._add_page_layout(page, calls, seconds)
+
+
+def _timed(stage: str, page_layout: bool = False) -> Callable:
+    # A decorator that adds each call's time to the current Profile's stage.
+    # With page_layout=True, the call is also counted for the page (the
+    # first argument, i.e. self) that the layout was done on.
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profile = _current_profile.get()
+            if profile is None:
+                return function(*args, **kwargs)
+
+            # A stage that calls itself (like Document.add_text() calling
+            # Page methods) is only counted once, for the outermost call.
+            calls = _current_calls.get()
+            if any(outer_call[0] == stage for outer_call in calls):
+                return function(*args, **kwargs)
+
+            call = [stage, 0.0]
+            token = _current_calls.set(calls + (call,))
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                _current_calls.reset(token)
+                if calls:
+                    calls[-1][1] += seconds
+                profile._add_call(stage, seconds, seconds - call[1], args[0] if page_layout else None)
+
+        return wrapper
+
+    return decorator
+
+
+def _page_entries(pages: Iterable[Any]) -> List[Dict[str, Any]]:
+    # Returns the current Profile's entries for these pages (for
+    # _record_document()), or an empty list if nothing is being profiled.
+    profile = _current_profile.get()
+    if profile is None:
+        return []
+    return [profile._page_entry(page) for page in pages]
+
+
+def _record_document(page_entries: List[Dict[str, Any]], bytes_written: int, seconds: float) -> None:
+    # Adds an entry for a saved document to the current Profile, if there is one.
+    profile = _current_profile.get()
+    if profile is not None:
+        profile._add_document(page_entries, bytes_written, seconds)
+
+
+def _content_bytes(contents: Any) -> int:
+    # The size of a page's (uncompressed) content stream or streams.
+    if contents is None:
+        return 0
+    if isinstance(contents, list):
+        return sum(_content_bytes(stream) for stream in contents)
+    return len(contents.get('DecodedBytes', contents.get('Bytes', b'')))
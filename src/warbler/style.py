@@ -0,0 +1,153 @@
+from borb.pdf import Alignment as BorbAlignment
+from borb.pdf.canvas.font.font import Font as BorbFont
+from borb.pdf.canvas.layout.hyphenation.hyphenation import Hyphenation as BorbHyphenation
+from borb.pdf.canvas.color.color import HexColor as BorbHexColor
+
+from .util import (
+    _normalize_text_alignment,
+    _normalize_alignment,
+    _normalize_color,
+    _normalize_hyphenation,
+    _normalize_font,
+)
+from .warblertypes import NumberType, ColorType, OneNumForFourType, AlignmentType, OneBoolForFourType
+
+from decimal import Decimal
+from typing import Any, Dict, Tuple, Union
+import typing
+from pathlib import Path
+
+
+class ParagraphStyle:
+    # A ParagraphStyle normalizes the Paragraph keyword arguments (colors,
+    # alignments, fonts, the four-way border/padding/margin settings, etc.)
+    # once, and stores the result as the keyword arguments for borb's
+    # Paragraph. Passing a style to Paragraph() or Page.add() skips all of the
+    # per-call normalization, which adds up when thousands of paragraphs
+    # share the same few styles.
+    __slots__ = ('_borb_kwargs',)
+
+    def __init__(
+        self,
+        respect_newlines_in_text: bool = False,
+        respect_spaces_in_text: bool = False,
+        font: Union[BorbFont, str, Path] = "Helvetica",
+        font_size: NumberType = Decimal(12),
+        text_alignment: AlignmentType = BorbAlignment.LEFT,
+        alignment: AlignmentType = BorbAlignment.TOP,
+        font_color: ColorType = BorbHexColor("000000"),
+        border: OneBoolForFourType = False,
+        border_radius: OneNumForFourType = Decimal(0),
+        border_color: ColorType = BorbHexColor("000000"),
+        border_width: NumberType = Decimal(1),
+        padding: OneNumForFourType = Decimal(0),
+        margin: typing.Optional[OneNumForFourType] = None,
+        fixed_leading: typing.Optional[NumberType] = None,
+        multiplied_leading: typing.Optional[NumberType] = None,
+        background_color: typing.Optional[ColorType] = None,
+        hyphenation: typing.Optional[Union[BorbHyphenation, str]] = None,
+    ):
+        self._borb_kwargs: Dict[str, Any] = {}
+        self._normalize_and_update(
+            respect_newlines_in_text=respect_newlines_in_text,
+            respect_spaces_in_text=respect_spaces_in_text,
+            font=font,
+            font_size=font_size,
+            text_alignment=text_alignment,
+            alignment=alignment,
+            font_color=font_color,
+            border=border,
+            border_radius=border_radius,
+            border_color=border_color,
+            border_width=border_width,
+            padding=padding,
+            margin=margin,
+            fixed_leading=fixed_leading,
+            multiplied_leading=multiplied_leading,
+            background_color=background_color,
+            hyphenation=hyphenation,
+        )
+
+    def derive(self, **overrides) -> 'ParagraphStyle':
+        # Returns a copy of this style with some settings changed. Only the
+        # overridden settings are normalized; everything else is copied over.
+        style = ParagraphStyle.__new__(ParagraphStyle)
+        style._borb_kwargs = dict(self._borb_kwargs)
+        style._normalize_and_update(**overrides)
+        return style
+
+    def _normalize_and_update(self, **kwargs) -> None:
+        for name, value in kwargs.items():
+            self._borb_kwargs.update(_normalize_style_argument(name, value))
+
+
+class ParagraphSpec:
+    # A paragraph that hasn't been laid out yet, made by Page.defer(): just
+    # its text and a ParagraphStyle, which is usually shared with many other
+    # specs. The borb Paragraph, with its layout state and Decimal fields,
+    # is only made when the page is laid out, so a page that is thrown away
+    # (or whose specs are moved to another page) never pays for it.
+    __slots__ = ('text', 'style')
+
+    def __init__(self, text: str, style: ParagraphStyle):
+        if not isinstance(style, ParagraphStyle):
+            raise ValueError('style must be a ParagraphStyle, not %r' % (style,))
+        self.text = text
+        self.style = style
+
+
+def _normalize_style_argument(name: str, value: Any) -> Dict[str, Any]:
+    # Converts a single Warbler Paragraph keyword argument into the
+    # equivalent keyword argument(s) for borb's Paragraph.
+    if name in ('respect_newlines_in_text', 'respect_spaces_in_text'):
+        return {name: value}
+    elif name == 'font':
+        return {'font': _normalize_font(value)}
+    elif name in ('font_size', 'border_width'):
+        return {name: Decimal(value)}
+    elif name in ('fixed_leading', 'multiplied_leading'):
+        return {name: None if value is None else Decimal(value)}
+    elif name == 'text_alignment':
+        return {'text_alignment': _normalize_text_alignment(value)}
+    elif name == 'alignment':
+        vertical_alignment, horizontal_alignment = _normalize_alignment(value)
+        return {'vertical_alignment': vertical_alignment, 'horizontal_alignment': horizontal_alignment}
+    elif name in ('font_color', 'border_color'):
+        return {name: _normalize_color(value)}
+    elif name == 'background_color':
+        return {name: None if value is None else _normalize_color(value)}
+    elif name == 'border':
+        top, right, bottom, left = _expand_one_bool_for_four(value)
+        return {'border_top': top, 'border_right': right, 'border_bottom': bottom, 'border_left': left}
+    elif name == 'border_radius':
+        top_left, top_right, bottom_right, bottom_left = _expand_one_num_for_four(value)
+        return {
+            'border_radius_top_left': top_left,
+            'border_radius_top_right': top_right,
+            'border_radius_bottom_right': bottom_right,
+            'border_radius_bottom_left': bottom_left,
+        }
+    elif name in ('padding', 'margin'):
+        top, right, bottom, left = _expand_one_num_for_four(value)
+        return {name + '_top': top, name + '_right': right, name + '_bottom': bottom, name + '_left': left}
+    elif name == 'hyphenation':
+        return {'hyphenation': None if value is None else _normalize_hyphenation(value)}
+    else:
+        raise TypeError('%r is not a valid paragraph style argument' % (name,))
+
+
+def _expand_one_bool_for_four(value: OneBoolForFourType) -> Tuple[bool, bool, bool, bool]:
+    if isinstance(value, bool):
+        return (value, value, value, value)
+    return (value[0], value[1], value[2], value[3])
+
+
+def _expand_one_num_for_four(
+    value: typing.Optional[OneNumForFourType],
+) -> Tuple[typing.Optional[Decimal], typing.Optional[Decimal], typing.Optional[Decimal], typing.Optional[Decimal]]:
+    if value is None:
+        return (None, None, None, None)
+    if isinstance(value, (Decimal, int, float)):
+        value = Decimal(value)
+        return (value, value, value, value)
+    return (Decimal(value[0]), Decimal(value[1]), Decimal(value[2]), Decimal(value[3]))
@@ -0,0 +1,471 @@
+from borb.io.read.types import Decimal as BorbDecimal, Dictionary as BorbDictionary, List as BorbList
+from borb.io.read.types import Name as BorbName, Stream as BorbStream
+from borb.pdf import Page as BorbPage
+from fontTools.agl import toUnicode as fontToolsToUnicode
+from fontTools.subset import Options as FontToolsSubsetOptions, Subsetter as FontToolsSubsetter
+from fontTools.ttLib import TTFont as FontToolsTTFont
+
+from .profiling import _timed
+
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import contextlib
+import hashlib
+import io
+import re
+import threading
+
+# Subsetting a font takes much longer than writing it, so the subsets made
+# for the most recently saved documents are kept. Documents in a batch
+# often use the same characters (e.g. the same form letter with different
+# numbers filled in), and saving the same document twice reuses them too.
+SUBSET_FONT_CACHE_MAX_SIZE = 64
+
+_subset_font_cache: 'OrderedDict[Tuple[int, Tuple[int, ...]], Tuple[BorbDictionary, BorbDictionary]]' = OrderedDict()
+_subset_font_cache_lock = threading.Lock()
+
+# The tokens in a content stream that matter for finding which glyphs each
+# font shows: font selections, Form XObjects, graphics state saves and
+# restores, strings, and comments and inline images (which are skipped).
+_DELIMITER = rb'\x00\t\n\x0c\r ()<>\[\]{}/%'
+_CONTENT_STREAM_TOKEN_REGEX = re.compile(
+    rb'/([^%(d)s]+)[\x00\t\n\x0c\r ]+[-+.0-9]+[\x00\t\n\x0c\r ]+Tf(?![^%(d)s])'  # 1: /F1 12 Tf
+    rb'|/([^%(d)s]+)[\x00\t\n\x0c\r ]+Do(?![^%(d)s])'  # 2: /Im1 Do
+    rb'|<([0-9A-Fa-f\x00\t\n\x0c\r ]*)>'  # 3: <hex string>
+    rb'|(\()'  # 4: (literal string)
+    rb'|(?<![^%(d)s])([qQ]|BI)(?![^%(d)s])'  # 5: q, Q, or BI
+    rb'|%%[^\r\n]*' % {b'd': _DELIMITER}
+)
+_INLINE_IMAGE_END_REGEX = re.compile(rb'[\x00\t\n\x0c\r ]EI(?![^%s])' % _DELIMITER)
+_LITERAL_STRING_ESCAPES = {
+    ord('n'): b'\n',
+    ord('r'): b'\r',
+    ord('t'): b'\t',
+    ord('b'): b'\b',
+    ord('f'): b'\f',
+    ord('('): b'(',
+    ord(')'): b')',
+    ord('\\'): b'\\',
+}
+_SUBSET_TAG_REGEX = re.compile(r'^[A-Z]{6}\+')
+
+
+@contextlib.contextmanager
+def _subset_fonts(pages: Iterable[BorbPage]) -> Iterator[None]:
+    # While the with block runs (that is, while the document is written),
+    # each embedded TrueType font in the pages' resources is replaced with a
+    # subset that only has the glyphs that the pages show in that font. The
+    # original fonts are put back afterwards, since the font cache shares
+    # them with every other document.
+    scanner = _GlyphScanner()
+    for page in pages:
+        scanner.scan(page.get('Contents'), page.get('Resources'))
+
+    subset_fonts = {}
+    for font_id, font in scanner.fonts.items():
+        if font_id not in scanner.unscannable_font_ids:
+            subset_font = _get_subset_font(font, scanner.get_codes(font_id))
+            if subset_font is not None:
+                subset_fonts[font_id] = subset_font
+
+    replaced_fonts: List[Tuple[BorbDictionary, BorbName, Any]] = []
+    try:
+        for font_resources in scanner.font_resources:
+            for name, font in list(font_resources.items()):
+                if id(font) in subset_fonts:
+                    replaced_fonts.append((font_resources, name, font))
+                    font_resources[name] = subset_fonts[id(font)]
+        yield
+    finally:
+        for font_resources, name, font in replaced_fonts:
+            font_resources[name] = font
+
+
+class _GlyphScanner:
+    # Reads content streams and records the character codes shown in each
+    # font. This only recognizes as much of the content stream syntax as it
+    # needs to, and errs on the side of recording too many codes: every
+    # string counts as shown in the current font, not only the strings that
+    # are operands of Tj, TJ, ', and ".
+    def __init__(self):
+        self.fonts: Dict[int, BorbDictionary] = {}
+        self.font_resources: List[BorbDictionary] = []
+        self.unscannable_font_ids: Set[int] = set()
+        self._shown_strings: Dict[int, List[bytes]] = {}
+        self._scanned: Set[Tuple[int, int]] = set()
+
+    def get_codes(self, font_id: int) -> Set[int]:
+        shown_strings = self._shown_strings.get(font_id, [])
+        if _is_two_byte_font(self.fonts[font_id]):
+            return set(
+                int.from_bytes(string[i : i + 2], 'big')
+                for string in shown_strings
+                for i in range(0, len(string) - 1, 2)
+            )
+        return set(b''.join(shown_strings))
+
+    def scan(self, contents: Any, resources: Any) -> None:
+        if not isinstance(resources, BorbDictionary):
+            return
+        if (id(contents), id(resources)) in self._scanned:
+            return  # E.g. a PageTemplate's Form XObject, which many pages share.
+        self._scanned.add((id(contents), id(resources)))
+
+        fonts = resources.get('Font')
+        if not isinstance(fonts, BorbDictionary):
+            fonts = BorbDictionary()
+        xobjects = resources.get('XObject')
+        if not isinstance(xobjects, BorbDictionary):
+            xobjects = BorbDictionary()
+        if not any(_get_font_file(font) is not None for font in fonts.values()) and not any(
+            isinstance(xobject, BorbStream) and xobject.get('Subtype') == 'Form' for xobject in xobjects.values()
+        ):
+            return  # There is nothing to subset in this content stream.
+
+        self.font_resources.append(fonts)
+        for font in fonts.values():
+            self.fonts.setdefault(id(font), font)
+
+        if isinstance(contents, BorbStream):
+            contents = [contents]
+        if not isinstance(contents, (list, type(None))) or any(
+            not isinstance(stream, BorbStream) or 'DecodedBytes' not in stream for stream in contents or []
+        ):
+            # Without the decoded content, there's no telling which glyphs
+            # these fonts show, so they are left as they are.
+            self.unscannable_font_ids.update(id(font) for font in fonts.values())
+            return
+        for stream in contents or []:
+            self._scan_content_stream(bytes(stream['DecodedBytes']), fonts, xobjects, resources)
+
+    def _scan_content_stream(
+        self, content: bytes, fonts: BorbDictionary, xobjects: BorbDictionary, resources: BorbDictionary
+    ) -> None:
+        font = None
+        saved_fonts = []
+        position = 0
+        while True:
+            match = _CONTENT_STREAM_TOKEN_REGEX.search(content, position)
+            if match is None:
+                return
+            position = match.end()
+            font_name, xobject_name, hex_string, literal_string_start, operator = match.groups()
+
+            if font_name is not None:
+                font = fonts.get(font_name.decode('latin1'))
+            elif xobject_name is not None:
+                xobject = xobjects.get(xobject_name.decode('latin1'))
+                if isinstance(xobject, BorbStream) and xobject.get('Subtype') == 'Form':
+                    # (A form without its own resources uses the page's.)
+                    self.scan(xobject, xobject.get('Resources', resources))
+            elif hex_string is not None:
+                hex_string = re.sub(rb'[\x00\t\n\x0c\r ]', b'', hex_string)
+                self._record(font, bytes.fromhex((hex_string + b'0' * (len(hex_string) % 2)).decode('latin1')))
+            elif literal_string_start is not None:
+                string, position = _read_literal_string(content, position)
+                self._record(font, string)
+            elif operator == b'q':
+                saved_fonts.append(font)
+            elif operator == b'Q':
+                font = saved_fonts.pop() if saved_fonts else None
+            elif operator == b'BI':
+                # Skip the inline image's data, which could look like anything.
+                end_match = _INLINE_IMAGE_END_REGEX.search(content, position)
+                position = len(content) if end_match is None else end_match.end()
+
+    def _record(self, font: Any, string: bytes) -> None:
+        if font is not None:
+            self._shown_strings.setdefault(id(font), []).append(string)
+
+
+def _read_literal_string(content: bytes, position: int) -> Tuple[bytes, int]:
+    # Returns the literal string starting just after the ( at position, and
+    # the position after its closing ). Literal strings can contain balanced
+    # parentheses and backslash escapes.
+    string = bytearray()
+    depth = 1
+    while position < len(content):
+        byte = content[position]
+        position += 1
+        if byte == ord('\\') and position < len(content):
+            escaped = content[position]
+            position += 1
+            if escaped in _LITERAL_STRING_ESCAPES:
+                string += _LITERAL_STRING_ESCAPES[escaped]
+            elif ord('0') <= escaped <= ord('7'):
+                digits = bytes([escaped])
+                while len(digits) < 3 and position < len(content) and ord('0') <= content[position] <= ord('7'):
+                    digits += content[position : position + 1]
+                    position += 1
+                string.append(int(digits, 8) & 0xFF)
+            elif escaped == ord('\r'):
+                if content[position : position + 1] == b'\n':
+                    position += 1
+            elif escaped != ord('\n'):
+                string.append(escaped)  # An unknown escape is just the character.
+        elif byte == ord('('):
+            depth += 1
+            string.append(byte)
+        elif byte == ord(')'):
+            depth -= 1
+            if depth == 0:
+                break
+            string.append(byte)
+        else:
+            string.append(byte)
+    return bytes(string), position
+
+
+def _is_two_byte_font(font: Any) -> bool:
+    return isinstance(font, BorbDictionary) and font.get('Subtype') == 'Type0'
+
+
+def _get_font_file(font: BorbDictionary) -> Optional[BorbStream]:
+    # Returns the embedded TrueType font file stream of a simple TrueType
+    # font, or of a Type0 font with a TrueType descendant font whose CIDs
+    # are its glyph IDs, which are the two kinds of TrueType fonts that borb
+    # creates. Returns None for any other kind of font.
+    if not isinstance(font, BorbDictionary) or _SUBSET_TAG_REGEX.match(str(font.get('BaseFont', ''))):
+        return None  # (A font whose name has a subset tag is already a subset.)
+    if font.get('Subtype') == 'Type0':
+        if font.get('Encoding') not in ('Identity-H', 'Identity-V') or len(font.get('DescendantFonts', [])) != 1:
+            return None
+        descendant_font = font['DescendantFonts'][0]
+        if descendant_font.get('Subtype') != 'CIDFontType2':
+            return None
+        if descendant_font.get('CIDToGIDMap', 'Identity') != 'Identity':
+            return None
+        font_descriptor = descendant_font.get('FontDescriptor')
+    elif font.get('Subtype') == 'TrueType':
+        font_descriptor = font.get('FontDescriptor')
+    else:
+        return None
+    if not isinstance(font_descriptor, BorbDictionary):
+        return None
+    font_file = font_descriptor.get('FontFile2')
+    if not isinstance(font_file, BorbStream) or 'DecodedBytes' not in font_file:
+        return None
+    return font_file
+
+
+@_timed('font_subsetting')
+def _get_subset_font(font: BorbDictionary, codes: Set[int]) -> Optional[BorbDictionary]:
+    # Returns a copy of font that embeds only the glyphs for these character
+    # codes, or None if the font can't be subset.
+    font_file = _get_font_file(font)
+    if font_file is None or not codes:
+        return None
+
+    key = (id(font), tuple(sorted(codes)))
+    with _subset_font_cache_lock:
+        entry = _subset_font_cache.get(key)
+        if entry is not None and entry[0] is font:
+            _subset_font_cache.move_to_end(key)
+            return entry[1]
+
+    if _is_two_byte_font(font):
+        subset_font = _subset_type_0_font(font, font_file, codes)
+    else:
+        subset_font = _subset_true_type_font(font, font_file, codes)
+
+    if subset_font is not None:
+        with _subset_font_cache_lock:
+            _subset_font_cache[key] = (font, subset_font)
+            while len(_subset_font_cache) > SUBSET_FONT_CACHE_MAX_SIZE:
+                _subset_font_cache.popitem(last=False)
+    return subset_font
+
+
+def _subset_true_type_font(font: BorbDictionary, font_file: BorbStream, codes: Set[int]) -> Optional[BorbDictionary]:
+    # A simple TrueType font's character codes are mapped to glyph names by
+    # its encoding, and glyph names are mapped to glyphs by the font file's
+    # cmap and post tables. The subset keeps both, so the content streams'
+    # character codes still show the same glyphs.
+    glyph_names_by_code = _get_differences(font)
+    if glyph_names_by_code is None or not codes.issubset(glyph_names_by_code):
+        return None
+    ttfont = FontToolsTTFont(io.BytesIO(font_file['DecodedBytes']))
+    glyph_names = [glyph_names_by_code[code] for code in sorted(codes)]
+    glyph_names = [glyph_name for glyph_name in glyph_names if glyph_name in ttfont.getReverseGlyphMap()]
+    unicodes_by_glyph_name = _get_unicodes_by_glyph_name(ttfont)
+    to_unicode = {
+        code: unicodes_by_glyph_name.get(glyph_names_by_code[code]) or fontToolsToUnicode(glyph_names_by_code[code])
+        for code in codes
+    }
+
+    subset_font_file_bytes = _subset_font_file(ttfont, glyphs=glyph_names, retain_gids=False)
+    subset_font = _copy_dictionary(font)
+    subset_font[BorbName('BaseFont')] = _subset_font_name(font['BaseFont'], codes)
+    subset_font[BorbName('FontDescriptor')] = _subset_font_descriptor(
+        font['FontDescriptor'], subset_font['BaseFont'], subset_font_file_bytes
+    )
+    subset_font[BorbName('ToUnicode')] = _to_unicode_cmap(to_unicode, code_length=1)
+    return subset_font
+
+
+def _subset_type_0_font(font: BorbDictionary, font_file: BorbStream, codes: Set[int]) -> BorbDictionary:
+    # The character codes in the content streams are glyph IDs, so the
+    # subset keeps every glyph at the same glyph ID (with the unused glyphs
+    # left empty), and only the used glyphs' widths and Unicode mappings.
+    ttfont = FontToolsTTFont(io.BytesIO(font_file['DecodedBytes']))
+    glyph_order = ttfont.getGlyphOrder()
+    codes = set(code for code in codes if code < len(glyph_order))
+    unicodes_by_glyph_name = _get_unicodes_by_glyph_name(ttfont)
+    to_unicode = {code: unicodes_by_glyph_name.get(glyph_order[code]) for code in codes}
+
+    subset_font_file_bytes = _subset_font_file(ttfont, gids=sorted(codes), retain_gids=True)
+    base_font = _subset_font_name(font['BaseFont'], codes)
+    descendant_font = _copy_dictionary(font['DescendantFonts'][0])
+    descendant_font[BorbName('BaseFont')] = base_font
+    descendant_font[BorbName('FontDescriptor')] = _subset_font_descriptor(
+        descendant_font['FontDescriptor'], base_font, subset_font_file_bytes
+    )
+    if 'W' in descendant_font:
+        descendant_font[BorbName('W')] = _subset_widths(descendant_font['W'], codes)
+
+    subset_font = _copy_dictionary(font)
+    subset_font[BorbName('BaseFont')] = base_font
+    subset_font[BorbName('DescendantFonts')] = BorbList()
+    subset_font['DescendantFonts'].append(descendant_font)
+    subset_font[BorbName('ToUnicode')] = _to_unicode_cmap(to_unicode, code_length=2)
+    return subset_font
+
+
+def _subset_font_file(ttfont: FontToolsTTFont, retain_gids: bool, **glyphs) -> bytes:
+    # Fonts whose glyphs keep their glyph IDs are used by glyph ID, so they
+    # don't need the glyph names (which are most of the font for big fonts).
+    # Simple fonts' encodings refer to glyphs by name.
+    options = FontToolsSubsetOptions()
+    options.retain_gids = retain_gids
+    options.glyph_names = not retain_gids
+    options.notdef_outline = True
+    # PDF viewers don't use OpenType layout tables (the content stream already
+    # says where each glyph goes), and they are slow to subset. FFTM tables
+    # are FontForge timestamps, which fontTools warns about.
+    options.drop_tables += ['BASE', 'GDEF', 'GPOS', 'GSUB', 'JSTF', 'MATH', 'FFTM']
+    subsetter = FontToolsSubsetter(options=options)
+    subsetter.populate(**glyphs)
+    subsetter.subset(ttfont)
+    with io.BytesIO() as font_file_bytes:
+        ttfont.save(font_file_bytes)
+        return font_file_bytes.getvalue()
+
+
+def _get_differences(font: BorbDictionary) -> Optional[Dict[int, str]]:
+    # Returns the glyph names that a simple font's encoding maps character
+    # codes to with its Differences array.
+    encoding = font.get('Encoding')
+    if not isinstance(encoding, BorbDictionary) or not isinstance(encoding.get('Differences'), list):
+        return None
+    glyph_names_by_code = {}
+    code = 0
+    for item in encoding['Differences']:
+        if isinstance(item, BorbName):
+            glyph_names_by_code[code] = str(item)
+            code += 1
+        else:
+            code = int(item)
+    return glyph_names_by_code
+
+
+def _get_unicodes_by_glyph_name(ttfont: FontToolsTTFont) -> Dict[str, str]:
+    # (The lowest code point wins when a glyph has more than one.)
+    unicodes_by_glyph_name: Dict[str, str] = {}
+    for code_point, glyph_name in sorted((ttfont.getBestCmap() or {}).items()):
+        unicodes_by_glyph_name.setdefault(glyph_name, chr(code_point))
+    return unicodes_by_glyph_name
+
+
+def _subset_font_name(base_font: str, codes: Set[int]) -> BorbName:
+    # A subset font's name starts with a tag of six capital letters that's
+    # different for each subset. Deriving it from the glyphs means saving
+    # the same document twice produces the same PDF.
+    digest = hashlib.sha1(('%s:%s' % (base_font, sorted(codes))).encode('utf-8')).digest()
+    tag = ''.join(chr(ord('A') + byte % 26) for byte in digest[:6])
+    return BorbName('%s+%s' % (tag, base_font))
+
+
+def _subset_font_descriptor(
+    font_descriptor: BorbDictionary, font_name: BorbName, font_file_bytes: bytes
+) -> BorbDictionary:
+    subset_font_descriptor = _copy_dictionary(font_descriptor)
+    subset_font_descriptor[BorbName('FontName')] = font_name
+    font_file = BorbStream()
+    font_file[BorbName('Length1')] = BorbDecimal(len(font_file_bytes))
+    font_file[BorbName('Filter')] = BorbName('FlateDecode')
+    font_file[BorbName('DecodedBytes')] = font_file_bytes
+    subset_font_descriptor[BorbName('FontFile2')] = font_file
+    return subset_font_descriptor
+
+
+def _subset_widths(widths: List[Any], codes: Set[int]) -> BorbList:
+    # Returns a W array with only these CIDs' widths, with consecutive CIDs
+    # grouped together ("c [w1 w2 ...]").
+    widths_by_cid = {}
+    i = 0
+    while i < len(widths):
+        first_cid = int(widths[i])
+        if isinstance(widths[i + 1], list):  # c [w1 w2 ...]
+            for offset, width in enumerate(widths[i + 1]):
+                widths_by_cid[first_cid + offset] = width
+            i += 2
+        else:  # c_first c_last w
+            for cid in range(first_cid, int(widths[i + 1]) + 1):
+                widths_by_cid[cid] = widths[i + 2]
+            i += 3
+
+    subset_widths = BorbList()
+    previous_cid = None
+    for cid in sorted(code for code in codes if code in widths_by_cid):
+        if previous_cid is None or cid != previous_cid + 1:
+            subset_widths.append(BorbDecimal(cid))
+            subset_widths.append(BorbList().set_is_inline(True))
+        subset_widths[-1].append(widths_by_cid[cid])
+        previous_cid = cid
+    return subset_widths
+
+
+def _to_unicode_cmap(unicodes_by_code: Dict[int, Optional[str]], code_length: int) -> BorbStream:
+    # Builds a ToUnicode CMap stream for the codes that have Unicode text.
+    code_format = '<%%0%dX>' % (code_length * 2)
+    mappings = [
+        '%s <%s>' % (code_format % code, text.encode('utf-16-be').hex().upper())
+        for code, text in sorted(unicodes_by_code.items())
+        if text
+    ]
+    lines = [
+        '/CIDInit /ProcSet findresource begin',
+        '12 dict begin',
+        'begincmap',
+        '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def',
+        '/CMapName /Adobe-Identity-UCS def',
+        '/CMapType 2 def',
+        '1 begincodespacerange',
+        '%s %s' % (code_format % 0, code_format % (256**code_length - 1)),
+        'endcodespacerange',
+    ]
+    for i in range(0, len(mappings), 100):  # (At most 100 mappings per section.)
+        lines.append('%d beginbfchar' % len(mappings[i : i + 100]))
+        lines.extend(mappings[i : i + 100])
+        lines.append('endbfchar')
+    lines += ['endcmap', 'CMapName currentdict /CMap defineresource pop', 'end', 'end']
+
+    to_unicode = BorbStream()
+    to_unicode[BorbName('Filter')] = BorbName('FlateDecode')
+    to_unicode[BorbName('DecodedBytes')] = '\n'.join(lines).encode('latin1')
+    return to_unicode
+
+
+def _copy_dictionary(dictionary: BorbDictionary) -> BorbDictionary:
+    # A shallow copy, as a plain Dictionary. (Copying a borb Font object
+    # would copy its parsed font data too.)
+    copy = BorbDictionary()
+    for key, value in dictionary.items():
+        copy[key] = value
+    return copy
+
+
+def clear_subset_font_cache() -> None:
+    """Removes all of the font subsets made while saving documents from the subset font cache."""
+    with _subset_font_cache_lock:
+        _subset_font_cache.clear()
@@ -0,0 +1,447 @@
+from borb.pdf import Alignment as BorbAlignment
+from borb.pdf.canvas.font.font import Font as BorbFont
+from borb.pdf.canvas.font.simple_font.true_type_font import TrueTypeFont as BorbTrueTypeFont
+from borb.pdf.canvas.geometry.rectangle import Rectangle as BorbRectangle
+from borb.pdf.canvas.layout.layout_element import LayoutElement as BorbLayoutElement
+from borb.io.read.types import Dictionary as BorbDictionary, Name as BorbName
+
+from .style import ParagraphStyle
+from .util import _standard_font
+from .warblertypes import NumberType
+
+from collections.abc import Mapping
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import functools
+import itertools
+
+# How literal strings in content streams escape the characters that would
+# otherwise end the string or be changed when it's read.
+_LITERAL_STRING_ESCAPES = str.maketrans(
+    dict({i: '\\%03o' % i for i in range(32)}, **{'(': '\\(', ')': '\\)', '\\': '\\\\'})
+)
+
+
+def _add_table(
+    page: Any,
+    add_page_like: Callable[[Any], Any],
+    rows: Iterable[Any],
+    header: Optional[Sequence[Any]],
+    column_widths: Optional[Sequence[NumberType]],
+    sample_size: int,
+    style: ParagraphStyle,
+    header_style: ParagraphStyle,
+) -> Any:
+    # Document.add_table() and DocumentWriter.add_table(): lays out the rows
+    # below everything else on page, calling add_page_like(page) to continue
+    # on a new page whenever one is full. Rows are read from the iterable one
+    # at a time, drawn into the current page's _TableChunk, and dropped, so
+    # only one page of the table is ever held in memory. Returns the page
+    # that the table ends on.
+    rows = iter(rows)
+    sample = [] if column_widths is not None else list(itertools.islice(rows, sample_size))
+    if header is not None:
+        number_of_columns = len(header)
+    elif column_widths is not None:
+        number_of_columns = len(column_widths)
+    else:
+        number_of_columns = max((len(row) for row in sample), default=0)
+    if number_of_columns == 0:
+        return page
+    if column_widths is not None and len(column_widths) != number_of_columns:
+        raise ValueError(
+            'there must be one column width per column, not %d for %d columns' % (len(column_widths), number_of_columns)
+        )
+
+    body_style = _CellStyle(style)
+    head_style = _CellStyle(header_style)
+    header_texts = None if header is None else _row_texts(header, None, number_of_columns)
+    layout = page._get_default_layout()
+    table_width = float(layout._column_width)
+    if column_widths is None:
+        # Each column is as wide as its widest text in the header and the
+        # sample rows, and then they're all stretched or squeezed to fit.
+        natural_widths = [0.0] * number_of_columns
+        sample_texts = [(_row_texts(row, header, number_of_columns), body_style) for row in sample]
+        if header_texts is not None:
+            sample_texts.append((header_texts, head_style))
+        for texts, cell_style in sample_texts:
+            for i, text in enumerate(texts):
+                natural_widths[i] = max(natural_widths[i], cell_style.natural_width(text))
+        widths = _fit_column_widths(natural_widths, table_width)
+    else:
+        # Relative widths, like borb's FixedColumnWidthTable's.
+        weights = [float(width) for width in column_widths]
+        if min(weights) < 0 or sum(weights) <= 0:
+            raise ValueError('column widths must not be negative, and at least one must be positive')
+        widths = [table_width * weight / sum(weights) for weight in weights]
+
+    table = _Table(float(layout._horizontal_margin), widths, body_style, head_style, header_texts)
+    chunk = _TableChunk(page, table)
+    for row in itertools.chain(sample, rows):
+        texts = _row_texts(row, header, number_of_columns)
+        if chunk.add_row(texts):
+            continue
+        if chunk.row_count == 0 and page._layout_is_empty(chunk.layout):
+            raise ValueError('a table row is too tall to fit on an empty page')
+        chunk.finish()
+        page = add_page_like(page)
+        chunk = _TableChunk(page, table)
+        if not chunk.add_row(texts):
+            raise ValueError('a table row is too tall to fit on an empty page')
+    chunk.finish()
+    return page
+
+
+def _row_texts(row: Any, header: Optional[Sequence[Any]], number_of_columns: int) -> List[str]:
+    # Returns the text of each of a row's cells, with empty cells added at
+    # the end of a short row. A row can also be a dict (e.g. from a
+    # csv.DictReader), whose values are looked up by the header's names.
+    if isinstance(row, Mapping):
+        if header is None:
+            raise ValueError('a table with dict rows needs a header')
+        row = [row.get(name) for name in header]
+    texts = ['' if value is None else str(value) for value in row]
+    if len(texts) > number_of_columns:
+        raise ValueError('a row has %d cells, but the table has %d columns' % (len(texts), number_of_columns))
+    return texts + [''] * (number_of_columns - len(texts))
+
+
+def _fit_column_widths(natural_widths: List[float], table_width: float) -> List[float]:
+    # Returns column widths that add up to table_width. If the natural widths
+    # are too wide, the columns that fit in an equal share of the width keep
+    # their natural widths, and the rest share what's left in proportion to
+    # their natural widths. Otherwise, every column is widened in proportion.
+    total = sum(natural_widths)
+    if total <= 0:
+        return [table_width / len(natural_widths)] * len(natural_widths)
+    if total <= table_width:
+        return [width * table_width / total for width in natural_widths]
+
+    widths = list(natural_widths)
+    wide_columns = set(range(len(widths)))
+    remaining_width = table_width
+    while True:
+        share = remaining_width / len(wide_columns)
+        narrow_columns = [i for i in wide_columns if natural_widths[i] <= share]
+        if not narrow_columns:
+            break
+        for i in narrow_columns:
+            wide_columns.remove(i)
+            remaining_width -= natural_widths[i]
+    wide_total = sum(natural_widths[i] for i in wide_columns)
+    for i in wide_columns:
+        widths[i] = remaining_width * natural_widths[i] / wide_total
+    return widths
+
+
+class _FontMetrics(dict):
+    # Each character's code in a font and its width (in thousandths of the
+    # font size), looked up in the font the first time the character is
+    # used. borb measures text by making an object for every glyph, which
+    # takes far too long for the hundreds of thousands of cells in a table.
+    def __init__(self, font: BorbFont):
+        super().__init__()
+        self._font = font
+        # (Like borb's ChunkOfText, text in a TrueType font, or with characters
+        # whose codes aren't their Unicode code points, is shown as hex codes.)
+        self._always_hex = isinstance(font, BorbTrueTypeFont)
+        self._code_format = '%04x' if font.get('Encoding') in ('Identity-H', 'Identity-V') else '%02x'
+        self._literal_characters: Set[str] = set()  # The characters looked up so far whose code is ord(character).
+
+    def __missing__(self, character: str) -> Tuple[Optional[int], float]:
+        code = self._font.unicode_to_character_identifier(character)
+        metrics = self[character] = (code, float(self._font.get_width(code or 0) or 0))
+        if code == ord(character) and not self._always_hex:
+            self._literal_characters.add(character)
+        return metrics
+
+    def width(self, text: str) -> float:
+        return sum([self[character][1] for character in text])
+
+    def show(self, text: str) -> str:
+        # Returns the content stream operator that shows text.
+        if not self._literal_characters.issuperset(text):
+            codes = [self[character][0] for character in text]  # (Looking up any new characters.)
+            if not self._literal_characters.issuperset(text):
+                if None in codes:
+                    font_name = self._font.get_font_name()
+                    raise ValueError('the font %s has no glyph for a character in %r' % (font_name, text))
+                return '<%s> Tj' % ''.join([self._code_format % code for code in codes])
+        return '(%s) Tj' % text.translate(_LITERAL_STRING_ESCAPES)
+
+
+class _CellStyle:
+    # The settings of a ParagraphStyle that table cells use, as floats, and
+    # the metrics of its font. Cells use the style's font, font size, font
+    # color, leading, padding, text alignment, background color, borders,
+    # and respect_newlines_in_text.
+    __slots__ = (
+        'font',
+        'metrics',
+        'font_size',
+        'line_height',
+        'descent',
+        'padding_top',
+        'padding_right',
+        'padding_bottom',
+        'padding_left',
+        'text_alignment',
+        'respect_newlines_in_text',
+        'text_operators',
+        'background_operators',
+        'border_operators',
+        'borders',
+    )
+
+    def __init__(self, style: ParagraphStyle):
+        kwargs = style._borb_kwargs
+        font = kwargs['font']
+        self.font = _standard_font(font) if isinstance(font, str) else font
+        self.metrics = _FontMetrics(self.font)
+        font_size = kwargs['font_size']
+        self.font_size = float(font_size)
+
+        # The same line height and baseline as borb's Paragraph:
+        multiplied_leading, fixed_leading = kwargs['multiplied_leading'], kwargs['fixed_leading']
+        if multiplied_leading is None and fixed_leading is None:
+            multiplied_leading = Decimal(1.2)
+        line_height = font_size
+        if multiplied_leading is not None:
+            line_height *= multiplied_leading
+        if fixed_leading is not None:
+            line_height += fixed_leading
+        self.line_height = float(line_height)
+        self.descent = float(self.font.get_descent() / Decimal(1000) * font_size)
+
+        self.padding_top = float(kwargs['padding_top'])
+        self.padding_right = float(kwargs['padding_right'])
+        self.padding_bottom = float(kwargs['padding_bottom'])
+        self.padding_left = float(kwargs['padding_left'])
+        self.text_alignment = kwargs['text_alignment']
+        self.respect_newlines_in_text = kwargs['respect_newlines_in_text']
+
+        rgb = kwargs['font_color'].to_rgb()
+        self.text_operators = '%f %f %f rg' % (rgb.red, rgb.green, rgb.blue)
+        self.background_operators = None
+        if kwargs['background_color'] is not None:
+            rgb = kwargs['background_color'].to_rgb()
+            self.background_operators = '%f %f %f rg' % (rgb.red, rgb.green, rgb.blue)
+        self.borders = (kwargs['border_top'], kwargs['border_right'], kwargs['border_bottom'], kwargs['border_left'])
+        rgb = kwargs['border_color'].to_rgb()
+        self.border_operators = '%f w %f %f %f RG' % (kwargs['border_width'], rgb.red, rgb.green, rgb.blue)
+
+    def natural_width(self, text: str) -> float:
+        # The width of a cell that fits text without breaking any lines.
+        paragraphs = text.split('\n') if self.respect_newlines_in_text else [text]
+        text_width = max(self.metrics.width(paragraph) for paragraph in paragraphs) * self.font_size / 1000
+        return text_width + self.padding_left + self.padding_right
+
+    def lines(self, text: str, width: float) -> List[Tuple[str, float]]:
+        # Breaks text into lines (and their widths, in points) that fit in a
+        # cell width points wide, at spaces, and at newlines if the style
+        # respects them. A word that's too long for a line of its own is
+        # broken between characters, since the column widths only come from
+        # the sample rows, and cutting it off would hide part of the value.
+        scale = self.font_size / 1000
+        max_width = (width - self.padding_left - self.padding_right) / scale
+        metrics = self.metrics
+        paragraphs = text.split('\n') if self.respect_newlines_in_text else [text.replace('\n', ' ')]
+        lines = []
+        for paragraph in paragraphs:
+            paragraph_width = metrics.width(paragraph)
+            if paragraph_width <= max_width:
+                lines.append((paragraph, paragraph_width * scale))
+                continue
+            space_width = metrics[' '][1]
+            line, line_width = None, 0.0
+            for word in paragraph.split():
+                word_width = metrics.width(word)
+                if line is not None and line_width + space_width + word_width <= max_width:
+                    line += ' ' + word
+                    line_width += space_width + word_width
+                    continue
+                if line is not None:
+                    lines.append((line, line_width * scale))
+                line, line_width = word, word_width
+                if word_width > max_width:
+                    line, line_width = '', 0.0
+                    for character in word:
+                        character_width = metrics[character][1]
+                        if line_width + character_width <= max_width:
+                            line += character
+                            line_width += character_width
+                            continue
+                        if not line:
+                            raise ValueError('a table column is too narrow for the character %r' % character)
+                        lines.append((line, line_width * scale))
+                        line, line_width = character, character_width
+            lines.append((line or '', line_width * scale))
+        return lines
+
+
+class _Table:
+    # The columns and styles of a table that's being added, which every
+    # page's _TableChunk shares, and its header row, laid out once.
+    def __init__(
+        self,
+        left: float,
+        widths: List[float],
+        body_style: _CellStyle,
+        head_style: _CellStyle,
+        header_texts: Optional[List[str]],
+    ):
+        self.columns = list(zip(itertools.accumulate([left] + widths[:-1]), widths))  # The (left, width) of each.
+        self.width = sum(widths)
+        self.body_style = body_style
+        self.head_style = head_style
+        self.header = None if header_texts is None else self.layout_row(header_texts, head_style)
+
+    def layout_row(self, texts: List[str], cell_style: _CellStyle) -> Tuple[List[List[Tuple[str, float]]], float]:
+        # Returns the lines of each of the row's cells, and the row's height.
+        lines = [cell_style.lines(text, width) for text, (left, width) in zip(texts, self.columns)]
+        height = max(len(cell_lines) for cell_lines in lines) * cell_style.line_height
+        return lines, height + cell_style.padding_top + cell_style.padding_bottom
+
+
+class _TableChunk(BorbLayoutElement):
+    # The part of a table on one page. Rows are drawn into lists of content
+    # stream operators as they're added, and finish() adds them to the page's
+    # content stream all at once. The chunk then becomes the page layout's
+    # previous element, so that whatever is added to the page next goes
+    # below the table.
+    def __init__(self, page: Any, table: _Table):
+        super().__init__()
+        self.page = page
+        self.layout = page._get_default_layout()
+        self.row_count = 0
+        self._table = table
+        previous_element = self.layout._previous_element
+        if previous_element is None:
+            self._top = float(self.layout._page_height - self.layout._vertical_margin_top)
+        else:
+            self._top = float(
+                previous_element.get_previous_layout_box().get_y()
+                - self.layout._get_margin_between_elements(previous_element, None)
+                - previous_element.get_margin_bottom()
+            )
+        self._y = self._top  # Where the next row goes.
+        self._bottom = float(self.layout._vertical_margin_bottom)
+        self._font_names: Dict[int, str] = {}  # By the id of the font.
+
+        # Backgrounds are drawn first and text last, so that nothing on one
+        # row covers the borders or text on the rows before it.
+        self._backgrounds: List[str] = []
+        self._borders: List[str] = []
+        self._texts: List[str] = []
+
+    def add_row(self, texts: List[str]) -> bool:
+        # Draws a row below the rows before it (and below the header, for the
+        # chunk's first row) and returns True, or returns False if it doesn't
+        # fit on the page.
+        table = self._table
+        lines, height = table.layout_row(texts, table.body_style)
+        needed_height = height
+        if self.row_count == 0 and table.header is not None:
+            needed_height += table.header[1]
+        if round(self._y - needed_height - self._bottom, 2) < 0:
+            return False
+        if self.row_count == 0 and table.header is not None:
+            self._draw_row(table.header[0], table.header[1], table.head_style)
+        self._draw_row(lines, height, table.body_style)
+        self.row_count += 1
+        return True
+
+    def finish(self) -> None:
+        # Adds the chunk's rows to the page, and lets go of them.
+        if self.row_count > 0:
+            self.page.append_to_content_stream(''.join(self._backgrounds + self._borders + self._texts))
+            left = self._table.columns[0][0]
+            self._previous_layout_box = BorbRectangle(
+                Decimal(left), Decimal(self._y), Decimal(self._table.width), Decimal(self._top - self._y)
+            )
+            self.layout._previous_element = self
+            self.layout._previous_element_layout_rect = self._previous_layout_box
+        self._backgrounds, self._borders, self._texts = [], [], []
+        self.page = self._table = None
+
+    def _draw_row(self, lines: List[List[Tuple[str, float]]], height: float, cell_style: _CellStyle) -> None:
+        top = self._y
+        bottom = top - height
+        self._y = bottom
+        columns = self._table.columns
+
+        if cell_style.background_operators is not None:
+            self._backgrounds.append(
+                '%s %.2f %.2f %.2f %.2f re f\n'
+                % (cell_style.background_operators, columns[0][0], bottom, self._table.width, height)
+            )
+
+        border_top, border_right, border_bottom, border_left = cell_style.borders
+        if any(cell_style.borders):
+            segments = []
+            for left, width in columns:
+                right = left + width
+                if all(cell_style.borders):
+                    segments.append('%.2f %.2f %.2f %.2f re' % (left, bottom, width, height))
+                    continue
+                if border_top:
+                    segments.append('%.2f %.2f m %.2f %.2f l' % (left, top, right, top))
+                if border_right:
+                    segments.append('%.2f %.2f m %.2f %.2f l' % (right, top, right, bottom))
+                if border_bottom:
+                    segments.append('%.2f %.2f m %.2f %.2f l' % (left, bottom, right, bottom))
+                if border_left:
+                    segments.append('%.2f %.2f m %.2f %.2f l' % (left, top, left, bottom))
+            self._borders.append('%s\n%s S\n' % (cell_style.border_operators, '\n'.join(segments)))
+
+        font_name = self._font_name(cell_style.font)
+        start_text = 'BT /%s %.2f Tf %s\n' % (font_name, cell_style.font_size, cell_style.text_operators)
+        texts = [start_text]
+        for (left, width), cell_lines in zip(columns, lines):
+            inner_left = left + cell_style.padding_left
+            inner_width = width - cell_style.padding_left - cell_style.padding_right
+            baseline = top - cell_style.padding_top - cell_style.font_size - cell_style.descent
+            for line, line_width in cell_lines:
+                if line:
+                    x = inner_left
+                    if cell_style.text_alignment == BorbAlignment.RIGHT:
+                        x += inner_width - line_width
+                    elif cell_style.text_alignment == BorbAlignment.CENTERED:
+                        x += (inner_width - line_width) / 2
+                    texts.append('1 0 0 1 %.2f %.2f Tm %s\n' % (x, baseline, cell_style.metrics.show(line)))
+                baseline -= cell_style.line_height
+        texts.append('ET\n')
+        self._texts.append(''.join(texts))
+
+    def _font_name(self, font: BorbFont) -> str:
+        # The name of the font in the page's resources, which is added to
+        # them if it isn't there yet (the same way as borb's ChunkOfText).
+        name = self._font_names.get(id(font))
+        if name is None:
+            if 'Resources' not in self.page:
+                self.page[BorbName('Resources')] = BorbDictionary().set_parent(self.page)
+            if 'Font' not in self.page['Resources']:
+                self.page['Resources'][BorbName('Font')] = BorbDictionary()
+            fonts = self.page['Resources']['Font']
+            name = next((str(key) for key, value in fonts.items() if value is font), None)
+            if name is None:
+                name = 'F%d' % (len(fonts) + 1)
+                fonts[BorbName(name)] = font
+            self._font_names[id(font)] = name
+        return name
+
+
+def _table_style(style: Optional[ParagraphStyle], style_kwargs: Dict[str, Any]) -> ParagraphStyle:
+    # Document.add_table() and DocumentWriter.add_table() take a
+    # ParagraphStyle for the cells, the keyword arguments for one, or a
+    # ParagraphStyle plus overrides. The keyword arguments override the
+    # default table style, not the default paragraph style.
+    if style is None:
+        style = _default_table_style()
+    return style.derive(**style_kwargs) if style_kwargs else style
+
+
+@functools.lru_cache(maxsize=None)
+def _default_table_style() -> ParagraphStyle:
+    return ParagraphStyle(font_size=10, padding=3, border=True, border_width=Decimal('0.5'))
@@ -1,19 +1,68 @@
 from borb.pdf import Alignment as BorbAlignment
 from borb.pdf.canvas.color.color import Color as BorbColor, HexColor as BorbHexColor, X11Color as BorbX11Color
 from borb.pdf.canvas.layout.hyphenation.hyphenation import Hyphenation as BorbHyphenation
+from borb.pdf.canvas.font.font import Font as BorbFont
+from borb.pdf.canvas.font.glyph_line import GlyphLine as BorbGlyphLine
+from borb.pdf.canvas.font.simple_font.font_type_1 import StandardType1Font as BorbStandardType1Font
 from borb.pdf.canvas.font.simple_font.true_type_font import TrueTypeFont as BorbTrueTypeFont
 from borb.pdf.canvas.geometry.rectangle import Rectangle as BorbRectangle
+from borb.io.read.types import Decimal as BorbDecimal, Dictionary as BorbDictionary, List as BorbList
+from borb.io.read.types import CanvasOperatorName as BorbCanvasOperatorName, Name as BorbName
+from borb.io.read.types import Reference as BorbReference, String as BorbString
 
+import functools
+import os
+import threading
 import typing
+from collections import OrderedDict, namedtuple
 from typing import Union, Sequence, Tuple, Dict, Optional
 from pathlib import Path
 from decimal import Decimal
 
+from .profiling import _timed
 from .warblertypes import ColorType, RectangleType, AlignmentType, NumberType
 
 # For our copy of COLOR_DEFINITION, have a lowercase color name
 COLOR_DEFINITION: Dict[str, str] = {str(k).lower(): str(v) for k, v in BorbX11Color.COLOR_DEFINITION.items()}
 
+# Colors are interned: normalizing the same color returns the same object,
+# and the COLOR_CACHE_MAX_SIZE most recently used colors are kept around.
+COLOR_CACHE_MAX_SIZE: int = 1024
+
+# Parsing a .ttf file is by far the slowest part of creating a Paragraph with
+# a custom font, so the parsed TrueTypeFont objects are shared process-wide.
+# The cache is keyed on the resolved path plus the file's mtime and size, so
+# an edited font file is picked up again. The least recently used font is
+# evicted once there are more than FONT_CACHE_MAX_SIZE fonts in the cache.
+FONT_CACHE_MAX_SIZE: int = 32
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+_font_cache: 'OrderedDict[Tuple[str, int, int], BorbTrueTypeFont]' = OrderedDict()
+_font_cache_lock = threading.Lock()
+_font_cache_hits: int = 0
+_font_cache_misses: int = 0
+
+# Each language's hyphenation patterns are loaded once and the Hyphenation
+# object is shared. Each one remembers the hyphenated form of its
+# HYPHENATION_WORD_CACHE_MAX_SIZE most recently used words.
+HYPHENATION_WORD_CACHE_MAX_SIZE: int = 4096
+
+_hyphenation_registry: Dict[str, BorbHyphenation] = {}
+_hyphenation_registry_lock = threading.Lock()
+
+# Line breaking measures the same words in the same fonts over and over, so
+# the widths of recently measured words are cached process-wide. The cache is
+# keyed on the font object's identity, the font size, and the text. (Each
+# entry also holds on to its font, so a font's id can't be reused by another
+# font while the entry is in the cache.)
+TEXT_WIDTH_CACHE_MAX_SIZE: int = 65536
+
+_text_width_cache: 'OrderedDict[Tuple[int, Decimal, str], Tuple[BorbFont, Decimal]]' = OrderedDict()
+_text_width_cache_lock = threading.Lock()
+_text_width_cache_hits: int = 0
+_text_width_cache_misses: int = 0
+
 
 def _normalize_text_alignment(alignment: AlignmentType) -> BorbAlignment:
     # If alignment is already an enum object, just return it.
@@ -148,27 +197,116 @@ def _normalize_color(color: ColorType) -> BorbColor:
     #   - a BorbColor object
     #   - the x11 name string of a color
     #   - the hex string of an RGB color, optionally prefixed with #
+    #   - a tuple of three 0 to 255 RGB ints
+    # The same color always returns the same interned, immutable color object.
     if isinstance(color, BorbColor):
         return color
     elif isinstance(color, str):
-        color = color.lower()
-        if color in COLOR_DEFINITION:
-            return BorbHexColor(COLOR_DEFINITION[color])
-        else:
-            return BorbHexColor(color)
+        return _color_from_str(color)
     else:
         if len(color) != 3:
             raise ValueError('invalid value used for color, must be a color name str or a str of the RGB hex value')
-        return BorbHexColor(hex(color[0])[2:].zfill(2) + hex(color[1])[2:].zfill(2) + hex(color[2])[2:].zfill(2))
+        return _interned_hex_color('%02x%02x%02x' % (color[0], color[1], color[2]))
+
+
+def normalize_colors(colors: typing.Iterable[ColorType]) -> typing.List[BorbColor]:
+    # Returns the shared color object for each color in a whole sequence of
+    # colors (e.g. for the cells of a large table), in any of the forms that
+    # Warbler takes colors in. Each distinct color is only normalized once.
+    normalized_by_key: Dict[typing.Any, BorbColor] = {}
+    normalized = []
+    for color in colors:
+        key = color if isinstance(color, (str, BorbColor)) else tuple(color)
+        if key not in normalized_by_key:
+            normalized_by_key[key] = _normalize_color(color)
+        normalized.append(normalized_by_key[key])
+    return normalized
+
+
+@functools.lru_cache(maxsize=COLOR_CACHE_MAX_SIZE)
+def _color_from_str(color: str) -> BorbColor:
+    color = color.lower()
+    if color in COLOR_DEFINITION:
+        color = COLOR_DEFINITION[color]
+    if color.startswith('#'):
+        color = color[1:]
+    if len(color) == 8:
+        # The x11 colors are 'AARRGGBB' strings, but borb's HexColor ignores
+        # the alpha byte anyway, so drop it to share the 'RRGGBB' object.
+        color = color[2:]
+    return _interned_hex_color(color.lower())
+
+
+@functools.lru_cache(maxsize=COLOR_CACHE_MAX_SIZE)
+def _interned_hex_color(hex_string: str) -> BorbColor:
+    # hex_string is a lowercase hex string without the # prefix, so that
+    # every way of writing the same color shares one object.
+    return _InternedHexColor(hex_string)
+
+
+class _InternedHexColor(BorbHexColor):
+    # A HexColor that is shared by everything that uses the same color, so it
+    # can't be changed after it is created.
+    def __init__(self, hex_string: str):
+        super().__init__(hex_string)
+        object.__setattr__(self, '_is_frozen', True)
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_is_frozen', False):
+            raise AttributeError('interned color objects are immutable')
+        super().__setattr__(name, value)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memodict={}):
+        return self
 
 
 def _normalize_hyphenation(iso_language_code: Union[BorbHyphenation, str]) -> BorbHyphenation:
     if isinstance(iso_language_code, BorbHyphenation):
         return iso_language_code
 
-    return BorbHyphenation(iso_language_code)
+    return _get_shared_hyphenation(iso_language_code)
+
 
+class _SharedHyphenation(BorbHyphenation):
+    # A Hyphenation object that is shared by every paragraph in the process
+    # that uses the same language. Besides loading the language's pattern
+    # data only once, it remembers the hyphenation of recently seen words,
+    # since the same words come up again and again in justified text.
+    def __init__(self, iso_language_code: str):
+        super().__init__(iso_language_code)
+        self.iso_language_code = iso_language_code
+        self._hyphenate_word = functools.lru_cache(maxsize=HYPHENATION_WORD_CACHE_MAX_SIZE)(super().hyphenate)
 
+    def hyphenate(self, s: str, hyphenation_character: str = chr(173)) -> str:
+        return self._hyphenate_word(s, hyphenation_character)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        # borb deep copies some layout elements (like tables). The patterns
+        # never change, so copies can keep sharing this object.
+        return self
+
+
+def _get_shared_hyphenation(iso_language_code: str) -> _SharedHyphenation:
+    iso_language_code = iso_language_code.lower()
+    with _hyphenation_registry_lock:
+        if iso_language_code not in _hyphenation_registry:
+            _hyphenation_registry[iso_language_code] = _SharedHyphenation(iso_language_code)
+        return _hyphenation_registry[iso_language_code]
+
+
+def preload_hyphenation(*iso_language_codes: str) -> None:
+    """Loads the hyphenation patterns for these languages now (e.g. when a worker process starts) instead of on first use."""
+    for iso_language_code in iso_language_codes:
+        _get_shared_hyphenation(iso_language_code)
+
+
+@_timed('font_loading')
 def _normalize_font(fontFile: Union[BorbTrueTypeFont, str, Path]) -> Union[BorbTrueTypeFont, str]:
     if isinstance(fontFile, BorbTrueTypeFont):
         return fontFile
@@ -197,7 +335,129 @@ def _normalize_font(fontFile: Union[BorbTrueTypeFont, str, Path]) -> Union[BorbT
             fontFile = Path(fontFile)
 
     if isinstance(fontFile, Path):
-        return BorbTrueTypeFont.true_type_font_from_file(fontFile)
+        return _load_true_type_font(fontFile)
+
+
+def _load_true_type_font(fontPath: Path) -> BorbTrueTypeFont:
+    # Returns the cached TrueTypeFont for this file, parsing the file only
+    # if it isn't in the cache or has changed since it was cached.
+    global _font_cache_hits, _font_cache_misses
+
+    fontPath = fontPath.resolve()
+    stat = os.stat(fontPath)
+    key = (str(fontPath), stat.st_mtime_ns, stat.st_size)
+
+    with _font_cache_lock:
+        if key in _font_cache:
+            _font_cache_hits += 1
+            _font_cache.move_to_end(key)
+            return _font_cache[key]
+        _font_cache_misses += 1
+
+    # Parse the file outside of the lock so that other threads can still get
+    # cache hits in the meantime.
+    font = BorbTrueTypeFont.true_type_font_from_file(fontPath)
+
+    with _font_cache_lock:
+        # Another thread may have loaded the same font while we parsed it.
+        # Keep the first one so that every caller shares a single object.
+        font = _font_cache.setdefault(key, font)
+        _font_cache.move_to_end(key)
+        while len(_font_cache) > FONT_CACHE_MAX_SIZE:
+            _font_cache.popitem(last=False)
+    return font
+
+
+def clear_font_cache() -> None:
+    """Removes all fonts from the TrueType font cache and resets its hit and miss counters."""
+    global _font_cache_hits, _font_cache_misses
+
+    with _font_cache_lock:
+        _font_cache.clear()
+        _font_cache_hits = 0
+        _font_cache_misses = 0
+
+
+def font_cache_info() -> CacheInfo:
+    """Returns a CacheInfo named tuple with the hits, misses, maxsize, and currsize of the TrueType font cache."""
+    with _font_cache_lock:
+        return CacheInfo(_font_cache_hits, _font_cache_misses, FONT_CACHE_MAX_SIZE, len(_font_cache))
+
+
+@functools.lru_cache(maxsize=None)
+def _standard_font(fontName: str) -> BorbStandardType1Font:
+    # borb parses the font's .afm metrics file every time a Paragraph is
+    # created with a font name, so each of the standard 14 fonts is loaded
+    # once and shared instead. Sharing the font object also lets the text
+    # width cache recognize it.
+    return _SharedStandardType1Font(fontName)
+
+
+class _SharedStandardType1Font(BorbStandardType1Font):
+    # A standard font that is shared by every paragraph in the process that
+    # uses it. borb looks up each glyph's width by scanning all of the font's
+    # metrics, so the widths are put in a dict the first time one is needed.
+    def get_width(self, character_identifier: int) -> Decimal:
+        if '_widths_by_character_identifier' not in vars(self):
+            widths: Dict[int, typing.List[Decimal]] = {}
+            for value in self._afm._chars.values():
+                widths.setdefault(value[0], []).append(value[1])
+            # (Like borb, a character identifier that doesn't match exactly
+            # one glyph has a width of 0.)
+            self._widths_by_character_identifier = {
+                key: BorbDecimal(value[0]) for key, value in widths.items() if len(value) == 1
+            }
+        return self._widths_by_character_identifier.get(character_identifier, BorbDecimal(0))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        # borb deep copies some layout elements (like tables). The font
+        # metrics never change, so copies can keep sharing this object.
+        return self
+
+
+def _text_width(font: BorbFont, font_size: Decimal, text: str) -> Decimal:
+    # Returns the width of text in this font and size, the same as
+    # GlyphLine.from_str(text, font, font_size).get_width_in_text_space().
+    global _text_width_cache_hits, _text_width_cache_misses
+
+    key = (id(font), font_size, text)
+    with _text_width_cache_lock:
+        entry = _text_width_cache.get(key)
+        if entry is not None and entry[0] is font:
+            _text_width_cache_hits += 1
+            _text_width_cache.move_to_end(key)
+            return entry[1]
+        _text_width_cache_misses += 1
+
+    width = BorbGlyphLine.from_str(text, font, font_size).get_width_in_text_space()
+
+    with _text_width_cache_lock:
+        _text_width_cache[key] = (font, width)
+        _text_width_cache.move_to_end(key)
+        while len(_text_width_cache) > TEXT_WIDTH_CACHE_MAX_SIZE:
+            _text_width_cache.popitem(last=False)
+    return width
+
+
+def clear_text_width_cache() -> None:
+    """Removes all widths from the text width cache and resets its hit and miss counters."""
+    global _text_width_cache_hits, _text_width_cache_misses
+
+    with _text_width_cache_lock:
+        _text_width_cache.clear()
+        _text_width_cache_hits = 0
+        _text_width_cache_misses = 0
+
+
+def text_width_cache_info() -> CacheInfo:
+    """Returns a CacheInfo named tuple with the hits, misses, maxsize, and currsize of the text width cache."""
+    with _text_width_cache_lock:
+        return CacheInfo(
+            _text_width_cache_hits, _text_width_cache_misses, TEXT_WIDTH_CACHE_MAX_SIZE, len(_text_width_cache)
+        )
 
 
 def _normalize_rectangle(rect: RectangleType) -> BorbRectangle:
@@ -207,4 +467,108 @@ def _normalize_rectangle(rect: RectangleType) -> BorbRectangle:
     return BorbRectangle(Decimal(rect[0]), Decimal(rect[1]), Decimal(rect[2]), Decimal(rect[3]))
 
 
+class _LeanObject:
+    # The methods that borb's add_base_methods() adds to every PDF object it
+    # makes, defined once on the class. borb binds ten new methods to each
+    # object instead, which takes most of the time it takes to make one (and
+    # every bound method is a reference cycle for the garbage collector to
+    # find). The Lean classes below are borb's types without that, for the
+    # code that makes tens of thousands of objects at a time.
+    _parent = None
+    _reference = None
+    _is_inline = False
+    _is_unique = False
+
+    def get_parent(self):
+        return self._parent
+
+    def set_parent(self, parent):
+        self._parent = parent
+        return self
+
+    def get_root(self):
+        e = self
+        while e.get_parent() is not None:
+            e = e.get_parent()
+        return e
+
+    def set_reference(self, reference):
+        # (The same check as borb's.)
+        assert (
+            self._reference is None
+            or reference is None
+            or self._reference.object_number == reference.object_number
+            or (
+                self._reference.parent_stream_object_number == reference.parent_stream_object_number
+                and self._reference.index_in_parent_stream == reference.index_in_parent_stream
+            )
+        )
+        self._reference = reference
+        return self
+
+    def get_reference(self):
+        return self._reference
+
+    def set_is_inline(self, a_flag: bool):
+        self._is_inline = a_flag
+        return self
+
+    def is_inline(self) -> bool:
+        return self._is_inline
+
+    def set_is_unique(self, a_flag: bool):
+        self._is_unique = a_flag
+        return self
+
+    def is_unique(self) -> bool:
+        return self._is_unique
+
+    def to_json_serializable(self):
+        return _to_json_serializable(self)
+
+
+def _to_json_serializable(value: typing.Any) -> typing.Any:
+    # The same as the to_json_serializable() method that borb adds.
+    if isinstance(value, dict):
+        return {_to_json_serializable(k): _to_json_serializable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_to_json_serializable(v) for v in value]
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (BorbString, BorbName, BorbCanvasOperatorName)):
+        return str(value)
+    return None
+
+
+class _LeanDictionary(_LeanObject, BorbDictionary):
+    def __init__(self):
+        dict.__init__(self)
+
+
+class _LeanList(_LeanObject, BorbList):
+    def __init__(self):
+        list.__init__(self)
+
+
+class _LeanDecimal(_LeanObject, BorbDecimal):
+    def __init__(self, obj: typing.Union[str, float, int, Decimal]):
+        pass  # (decimal.Decimal.__new__() sets the value.)
+
+
+class _LeanString(_LeanObject, BorbString):
+    def __init__(self, text: str):
+        self._text = text
+
+
+class _LeanReference(_LeanObject, BorbReference):
+    def __init__(self, object_number: int):
+        self.object_number = object_number
+        self.generation_number = None
+        self.parent_stream_object_number = None
+        self.index_in_parent_stream = None
+        self.byte_offset = None
+        self.is_in_use = True
+        self.document = None
+
+
 # TODO - add NormalizeFont that makes it easy to add in custom fonts?
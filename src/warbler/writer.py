@@ -0,0 +1,339 @@
+from borb.pdf import Page as BorbPage
+from borb.io.read.types import Dictionary as BorbDictionary, List as BorbList, Reference as BorbReference
+from borb.io.read.types import Stream as BorbStream, Element as BorbElement, Name as BorbName
+from borb.io.read.types import Decimal as BorbDecimal
+from borb.io.write.any_object_transformer import AnyObjectTransformer as BorbAnyObjectTransformer
+from borb.io.write.document.information_dictionary_transformer import (
+    InformationDictionaryTransformer as BorbInformationDictionaryTransformer,
+)
+from borb.io.write.transformer import WriteTransformerState as BorbWriteTransformerState
+from PIL.Image import Image as PILImage
+
+from .compress import _ResolvedReferences, _write_lock
+from .document import Document, Page, _PDFStreamWriter, _page_like
+from .images import _check_image_dpi, _share_images
+from .profiling import _page_entries, _record_document, _timed
+from .style import ParagraphStyle
+from .table import _add_table, _table_style
+from .warblertypes import NumberType
+
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import os
+import secrets
+import time
+import typing
+import weakref
+
+# Every PDF written by a DocumentWriter starts with these three objects,
+# which are written last but numbered first.
+_CATALOG_OBJECT_NUMBER = 1
+_PAGES_OBJECT_NUMBER = 2
+_INFO_OBJECT_NUMBER = 3
+
+# The types of objects that borb writes as separate, numbered objects
+# (unless they are marked as inline).
+_INDIRECT_OBJECT_TYPES = (BorbDictionary, BorbList, BorbStream, PILImage, BorbElement)
+
+
+class DocumentWriter:
+    # Writes a PDF one page at a time, for documents too big to keep in
+    # memory all at once:
+    #
+    #     with warbler.DocumentWriter('statements.pdf') as writer:
+    #         for statement in statements:
+    #             page = writer.add_page()
+    #             page.add(...)
+    #
+    # Each page is written to the file as soon as the next page is added (or
+    # the writer is closed), and is then removed from the writer so its
+    # memory can be freed. Fonts and images are written the first time a page
+    # uses them, and later pages refer back to them. The page tree and cross-
+    # reference table are written when the writer is closed. Document-level
+    # features that need every page at once, like outlines and interactive
+    # forms, aren't supported.
+    #
+    # Copies of the same image are written once, the same as with
+    # Document.save(), and image_dpi scales down images the same way too
+    # (though at the largest size each one is drawn at on each page).
+    def __init__(self, file: Union[str, Path, typing.BinaryIO], image_dpi: Optional[NumberType] = None):
+        _check_image_dpi(image_dpi)
+        if hasattr(file, 'write'):
+            self._file_handle = None
+            self._filename = None
+            stream = file
+        else:
+            self._file_handle = open(file, 'wb')
+            self._filename = file
+            stream = self._file_handle
+        self._destination = _PDFStreamWriter(stream)
+
+        # Pages are added to this Document while they are being built, so
+        # that layouts can find it (e.g. to add a page when text overflows).
+        self._document = Document()
+        self._document.add_page(Page())
+        self._pages_dictionary = self._document['XRef']['Trailer']['Root']['Pages']
+        self._pages_reference = BorbReference(object_number=_PAGES_OBJECT_NUMBER)
+        self._kids().pop(0)
+        self._pages_dictionary[BorbName('Count')] = BorbDecimal(0)
+
+        self._transformer = BorbAnyObjectTransformer()
+        self._next_object_number = _INFO_OBJECT_NUMBER + 1
+        self._byte_offsets = array('q', [0] * self._next_object_number)  # By object number.
+        self._page_object_numbers = array('q')
+        self._page_count = 0
+        self._profile_pages: List[Dict[str, Any]] = []  # Each written page's entry, while being profiled.
+        self._seconds_writing = 0.0
+
+        # Objects shared between pages (fonts, images, etc.) are tracked by
+        # identity, but only as long as something else keeps them alive.
+        self._shared_references: Dict[int, Tuple[weakref.ref, BorbReference]] = {}
+        self._image_dpi = image_dpi
+        self._image_streams: Dict[Tuple[bytes, int, int], BorbStream] = {}  # See _share_images().
+        self._closed = False
+
+        self._destination.write(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self) -> 'DocumentWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._abort()
+
+    @property
+    def page_count(self) -> int:
+        # The number of pages written so far, plus the pages in progress.
+        return self._page_count + len(self._kids())
+
+    def add_page(self, page: typing.Optional[BorbPage] = None) -> BorbPage:
+        # Writes out every page added so far and starts a new page. If called
+        # with no arguments, a new (Letter sized) Page object is created.
+        # Returns the new page.
+        if self._closed:
+            raise ValueError('cannot add pages to a closed DocumentWriter')
+        self._write_pending_pages()
+        if page is None:
+            page = Page()
+        self._document.add_page(page)
+        return page
+
+    @_timed('layout')
+    def add_table(
+        self,
+        rows: Iterable[Any],
+        header: Optional[Sequence[Any]] = None,
+        column_widths: Optional[Sequence[NumberType]] = None,
+        sample_size: int = 100,
+        style: Optional[ParagraphStyle] = None,
+        header_style: Optional[ParagraphStyle] = None,
+        **style_kwargs,
+    ) -> BorbPage:
+        # Adds a table after everything else on the last page, the same as
+        # Document.add_table() (see it for the arguments). Each page of the
+        # table is written as soon as the table continues on the next one, so
+        # memory use stays the same no matter how many rows there are. Returns
+        # the page the table ends on.
+        if self._closed:
+            raise ValueError('cannot add tables to a closed DocumentWriter')
+        kids = self._kids()
+        page = kids[-1] if len(kids) > 0 and isinstance(kids[-1], Page) else self.add_page()
+        style = _table_style(style, style_kwargs)
+        return _add_table(
+            page,
+            lambda page: self.add_page(_page_like(page)),
+            rows,
+            header,
+            column_widths,
+            sample_size,
+            style,
+            header_style or style,
+        )
+
+    def close(self) -> None:
+        # Writes the remaining pages, the page tree, and the cross-reference
+        # table, and closes the file (if the writer opened it).
+        if self._closed:
+            return
+        try:
+            self._write_pending_pages()
+            self._write_document_objects()
+            self._destination.flush()
+            _record_document(self._profile_pages, self._destination.tell(), self._seconds_writing)
+        finally:
+            self._closed = True
+            if self._file_handle is not None:
+                self._file_handle.close()
+
+    def _abort(self) -> None:
+        # Closes the writer without finishing the PDF. A file that the writer
+        # created is removed instead of being left half-written.
+        self._closed = True
+        if self._file_handle is not None:
+            self._file_handle.close()
+            os.remove(self._filename)
+
+    def _kids(self) -> List[Any]:
+        return self._pages_dictionary['Kids']
+
+    def _new_object_number(self) -> int:
+        self._byte_offsets.append(0)
+        self._next_object_number += 1
+        return self._next_object_number - 1
+
+    @_timed('save')
+    def _write_pending_pages(self) -> None:
+        start_time = time.perf_counter()
+        kids = self._kids()
+        while len(kids) > 0:
+            self._write_page(kids[0])
+            self._profile_pages.extend(_page_entries([kids[0]]))
+            del kids[0]  # Release the page, so it can be garbage collected.
+            self._page_count += 1
+        self._seconds_writing += time.perf_counter() - start_time
+
+    def _write_page(self, page: BorbPage) -> None:
+        # Each page is written with a fresh WriteTransformerState that only
+        # knows about this page's objects, so the cost of writing a page
+        # doesn't grow with the number of pages before it.
+        if isinstance(page, Page):
+            page.layout_deferred()  # (Text that doesn't fit adds pages, which are written next.)
+        with _write_lock:  # (The page's fonts and images can be shared with other documents.)
+            self._write_page_objects(page)
+
+    def _write_page_objects(self, page: BorbPage) -> None:
+        context = BorbWriteTransformerState(destination=self._destination, root_object=self._document)
+        context.resolved_references = _ResolvedReferences()
+        self._pages_dictionary.set_reference(None)
+        self._pages_dictionary.set_reference(self._pages_reference)
+        context.indirect_objects_by_id[id(self._pages_dictionary)] = self._pages_dictionary
+
+        # (borb's PageTransformer marks these inline while writing, but they
+        # must be inline before their references are assigned.)
+        for box_name in ('ArtBox', 'BleedBox', 'CropBox', 'MediaBox', 'TrimBox'):
+            if box_name in page:
+                page[box_name].set_is_inline(True)
+
+        with _share_images([page], self._image_dpi, self._image_streams):
+            written_objects = self._assign_references(page, context)
+            self._page_object_numbers.append(page.get_reference().object_number)
+            self._transformer.transform(page, context)
+
+        for obj in written_objects:
+            reference = obj.get_reference()
+            if reference is not None and reference.byte_offset is not None:
+                self._byte_offsets[reference.object_number] = reference.byte_offset
+
+    def _assign_references(self, page: BorbPage, context: BorbWriteTransformerState) -> List[Any]:
+        # Numbers every object that will be written along with this page, the
+        # same objects that borb's transformers would number. Doing this up
+        # front means borb finds each object's reference by its id, instead
+        # of numbering it by scanning every object written so far. Returns
+        # the objects that were numbered.
+        shared_objects = set()
+        resources = page.get('Resources')
+        if isinstance(resources, BorbDictionary):
+            for category in resources.values():
+                if isinstance(category, BorbDictionary):
+                    shared_objects.update(id(resource) for resource in category.values())
+
+        numbered_objects = []
+        objects_todo = [page]
+        while objects_todo:
+            obj = objects_todo.pop()
+            if id(obj) in context.indirect_objects_by_id:
+                continue
+            context.indirect_objects_by_id[id(obj)] = obj
+
+            if id(obj) in shared_objects and self._reuse_shared_reference(obj, context):
+                continue  # This object was already written for an earlier page.
+
+            reference = BorbReference(object_number=self._new_object_number())
+            obj.set_reference(None)
+            obj.set_reference(reference)
+            numbered_objects.append(obj)
+            if id(obj) in shared_objects:
+                self._add_shared_reference(obj, reference)
+
+            if isinstance(obj, BorbDictionary):
+                children = [v for k, v in obj.items() if k not in ('Bytes', 'DecodedBytes')]
+            elif isinstance(obj, BorbList):
+                children = obj
+            else:
+                children = []
+            for child in children:
+                if isinstance(child, _INDIRECT_OBJECT_TYPES) and not child.is_inline():
+                    objects_todo.append(child)
+        return numbered_objects
+
+    def _reuse_shared_reference(self, obj: Any, context: BorbWriteTransformerState) -> bool:
+        entry = self._shared_references.get(id(obj))
+        if entry is None or entry[0]() is not obj:
+            return False
+        reference = entry[1]
+        obj.set_reference(None)
+        obj.set_reference(reference)
+        context.resolved_references.append(reference)
+        return True
+
+    def _add_shared_reference(self, obj: Any, reference: BorbReference) -> None:
+        key = id(obj)
+
+        def forget(dead_ref):
+            if self._shared_references.get(key, (None,))[0] is dead_ref:
+                del self._shared_references[key]
+
+        try:
+            self._shared_references[key] = (weakref.ref(obj, forget), reference)
+        except TypeError:
+            pass  # Objects that can't be weakly referenced are written with each page.
+
+    @_timed('save')
+    def _write_document_objects(self) -> None:
+        # Writes the catalog, page tree, and document information objects,
+        # then the cross-reference table and trailer.
+        start_time = time.perf_counter()
+        write = self._destination.write
+        now = BorbInformationDictionaryTransformer._now_as_iso_8824_date_format()
+
+        self._byte_offsets[_CATALOG_OBJECT_NUMBER] = self._destination.tell()
+        write(b'%d 0 obj\n<</Pages %d 0 R /Type /Catalog>>\nendobj\n\n' % (_CATALOG_OBJECT_NUMBER, _PAGES_OBJECT_NUMBER))
+
+        self._byte_offsets[_PAGES_OBJECT_NUMBER] = self._destination.tell()
+        kids = b' '.join(b'%d 0 R' % object_number for object_number in self._page_object_numbers)
+        write(
+            b'%d 0 obj\n<</Count %d /Kids [%s] /Type /Pages>>\nendobj\n\n'
+            % (_PAGES_OBJECT_NUMBER, len(self._page_object_numbers), kids)
+        )
+
+        self._byte_offsets[_INFO_OBJECT_NUMBER] = self._destination.tell()
+        write(
+            b'%d 0 obj\n<</CreationDate (%s) /ModDate (%s) /Producer (borb)>>\nendobj\n\n'
+            % (_INFO_OBJECT_NUMBER, now.encode('latin1'), now.encode('latin1'))
+        )
+
+        start_of_xref = self._destination.tell()
+        write(b'xref\n0 %d\n' % len(self._byte_offsets))
+        write(b'0000000000 65535 f\r\n')
+        for byte_offset in self._byte_offsets[1:]:
+            if byte_offset:
+                write(b'%010d 00000 n\r\n' % byte_offset)
+            else:
+                write(b'0000000000 65535 f\r\n')  # A number that wasn't used after all.
+
+        document_id = secrets.token_hex(16).encode('latin1')
+        write(
+            b'trailer\n<</Root %d 0 R /Info %d 0 R /Size %d /ID [<%s> <%s>]>>\nstartxref\n%d\n%%%%EOF'
+            % (
+                _CATALOG_OBJECT_NUMBER,
+                _INFO_OBJECT_NUMBER,
+                len(self._byte_offsets),
+                document_id,
+                document_id,
+                start_of_xref,
+            )
+        )
+        self._seconds_writing += time.perf_counter() - start_time
@@ -1,7 +1,12 @@
 from __future__ import division, print_function
 import pytest
 import warbler
+import io
+import json
 import os
+import re
+import subprocess
+import sys
 
 from pathlib import Path
 from pdf2image import convert_from_path
@@ -51,6 +56,30 @@ def test_imports_and_access():
     warbler.Pantone
     warbler.TrueTypeFont
     warbler.SquareAnnotation
+    warbler.preload_hyphenation
+    warbler.normalize_colors
+
+
+def test_import_time():
+    # Importing warbler shouldn't import borb until one of its names is used.
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import warbler'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    # Each line of -X importtime output looks like: "import time: self | cumulative | module"
+    import_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, module_name = line[len('import time:') :].split('|')
+        import_times[module_name.strip()] = int(cumulative_us)
+
+    assert 'warbler' in import_times
+    assert not any(module_name.startswith('borb') for module_name in import_times)
+    assert import_times['warbler'] < 50000  # Less than 50 milliseconds.
 
 
 def test_basic_hello_world_document():
@@ -206,6 +235,467 @@ def test_custom_font():
     assert diff.getbbox() is None  # Images are the same.
 
 
+def test_save_to_file_like_objects(tmp_path):
+    doc = warbler.Document()
+    page = doc.add_page()
+    page.add('Hello, world!')
+
+    pdf_bytes = doc.to_bytes()
+    assert pdf_bytes.startswith(b'%PDF-1.7')
+    assert pdf_bytes.endswith(b'%%EOF')
+
+    # Streams that don't support tell() or seek(), like HTTP responses, work too:
+    class WriteOnlyStream:
+        def __init__(self):
+            self.chunks = []
+
+        def write(self, data):
+            self.chunks.append(data)
+
+    stream = WriteOnlyStream()
+    doc.save(stream)
+    streamed_bytes = b''.join(stream.chunks)
+    assert len(streamed_bytes) == len(pdf_bytes)
+
+    # The startxref offset is relative to the start of the PDF, even if the
+    # stream already had data in it:
+    stream = io.BytesIO(b'existing data')
+    stream.seek(0, io.SEEK_END)
+    doc.save(stream)
+    streamed_bytes = stream.getvalue()[len(b'existing data') :]
+    startxref = int(streamed_bytes.rsplit(b'startxref', 1)[1].split()[0])
+    assert streamed_bytes[startxref:].startswith(b'xref')
+
+    # Atomic saves replace the file and don't leave temporary files behind:
+    filename = tmp_path / 'output.pdf'
+    filename.write_bytes(b'old contents')
+    doc.save(filename, atomic=True)
+    assert filename.read_bytes().startswith(b'%PDF-1.7')
+    assert os.listdir(tmp_path) == ['output.pdf']
+
+    with pytest.raises(ValueError):
+        doc.save(io.BytesIO(), atomic=True)
+
+
+def test_document_writer(tmp_path):
+    from borb.pdf import PDF as BorbPDF
+
+    fontPath = Path(__file__).parent / 'Minecraft.ttf'
+    stream = io.BytesIO()
+    with warbler.DocumentWriter(stream) as writer:
+        for i in range(3):
+            page = writer.add_page()
+            page.add('Page %d' % i)
+            page.add('Custom font', font=fontPath)
+        assert writer.page_count == 3
+    pdf_bytes = stream.getvalue()
+
+    # Fonts used on every page are only written once:
+    assert pdf_bytes.count(b'/BaseFont /Helvetica') == 1
+    assert pdf_bytes.count(b'/FontFile2') == 1
+
+    # borb can read the written PDF back in:
+    doc = BorbPDF.loads(io.BytesIO(pdf_bytes))
+    assert int(doc.get_document_info().get_number_of_pages()) == 3
+
+    # Pages are written out while the next ones are being added, so the PDF reaches the stream before it's closed:
+    stream = io.BytesIO()
+    writer = warbler.DocumentWriter(stream)
+    sizes = []
+    for i in range(300):
+        writer.add_page().add('Page %d' % i)
+        sizes.append(stream.tell())
+    assert sizes == sorted(sizes) and 0 < sizes[-1]
+    writer.close()
+    assert stream.tell() > sizes[-1]
+    doc = BorbPDF.loads(io.BytesIO(stream.getvalue()))
+    assert int(doc.get_document_info().get_number_of_pages()) == 300
+
+    filename = tmp_path / 'output.pdf'
+    writer = warbler.DocumentWriter(filename)
+    writer.add_page().add('First page')
+    writer.close()
+    assert filename.read_bytes().endswith(b'%%EOF')
+    with pytest.raises(ValueError):
+        writer.add_page()
+
+    # A writer that fails part way through doesn't leave a broken file behind:
+    with pytest.raises(ZeroDivisionError):
+        with warbler.DocumentWriter(tmp_path / 'broken.pdf') as writer:
+            writer.add_page().add('Hello')
+            1 / 0
+    assert os.listdir(tmp_path) == ['output.pdf']
+
+
+def _build_greeting(name):
+    # This is a module-level function so that render_many() can pickle it.
+    if name is None:
+        raise ValueError('no name')
+    doc = warbler.Document()
+    page = doc.add_page()
+    page.add('Hello, %s!' % name)
+    return doc
+
+
+def _build_or_exit(name):
+    if name == 'exit':
+        os._exit(1)
+    return _build_greeting(name)
+
+
+def test_render_many(tmp_path):
+    fontPath = Path(__file__).parent / 'Minecraft.ttf'
+    progress_calls = []
+    result = warbler.render_many(
+        _build_greeting,
+        iter(['Alice', 'Bob', None, 'Carol', 'David']),
+        tmp_path,
+        workers=2,
+        fonts=[fontPath],
+        hyphenation=['en-us'],
+        progress=lambda rendered, failed: progress_calls.append((rendered, failed)),
+        chunk_size=2,
+    )
+    assert result.rendered == 4
+    assert len(result.durations) == 4
+    assert [failure.index for failure in result.failures] == [2]
+    assert 'no name' in result.failures[0].error
+    assert progress_calls[-1] == (4, 1)
+    assert sorted(os.listdir(tmp_path)) == ['000000.pdf', '000001.pdf', '000003.pdf', '000004.pdf']
+
+    # Rendering in the current process, with a filename function:
+    result = warbler.render_many(
+        _build_greeting, ['Eve'], tmp_path / 'sub', workers=1, filename=lambda index, name: name + '.pdf'
+    )
+    assert result.rendered == 1
+    assert (tmp_path / 'sub' / 'Eve.pdf').read_bytes().startswith(b'%PDF')
+
+    # Records that can't be pickled fail their chunks instead of stopping the batch:
+    result = warbler.render_many(
+        _build_greeting, ['Frank', lambda: 'Grace', 'Heidi'], tmp_path / 'pickle', workers=2, chunk_size=1
+    )
+    assert result.rendered == 2
+    assert [failure.index for failure in result.failures] == [1]
+    assert 'pickle' in result.failures[0].error
+    # A record that kills its worker process only fails itself, and the rest of the batch is rendered in a new pool:
+    names = ['Name %d' % i for i in range(40)]
+    names[5] = names[23] = 'exit'
+    progress_calls.clear()
+    result = warbler.render_many(
+        _build_or_exit,
+        names,
+        tmp_path / 'exit',
+        workers=2,
+        chunk_size=3,
+        progress=lambda rendered, failed: progress_calls.append((rendered, failed)),
+    )
+    assert result.rendered == 38
+    assert [failure.index for failure in result.failures] == [5, 23]
+    assert all('BrokenProcessPool' in failure.error for failure in result.failures)
+    assert progress_calls[-1] == (38, 2)
+    assert len(os.listdir(tmp_path / 'exit')) == 38
+
+
+class _AsyncWriter:
+    # Like an asyncio.StreamWriter: write() buffers the data and drain() waits for it to be sent.
+    def __init__(self, fail=False):
+        self.chunks = []
+        self.drain_calls = 0
+        self.fail = fail
+
+    def write(self, data):
+        if self.fail and self.chunks:
+            raise ConnectionResetError('client went away')
+        self.chunks.append(data)
+
+    async def drain(self):
+        self.drain_calls += 1
+
+
+def test_render_async(tmp_path):
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    async def main():
+        # With no file, render_async() returns the PDF's bytes:
+        pdf_bytes = await warbler.render_async(_build_greeting, 'Alice')
+        assert pdf_bytes.startswith(b'%PDF')
+
+        # Async writers get the PDF in chunks, with a drain() after each one:
+        doc = warbler.Document()
+        doc.add_text(' '.join(str(i) for i in range(6000)))
+        writer = _AsyncWriter()
+        await doc.save_async(writer, compression_level=0, subset_fonts=False)
+        assert len(writer.chunks) > 1 and writer.drain_calls == len(writer.chunks)
+        assert len(b''.join(writer.chunks)) == len(doc.to_bytes(compression_level=0, subset_fonts=False))
+
+        # A writer that fails stops the rest of the PDF from being sent, and the error is raised:
+        with pytest.raises(ConnectionResetError):
+            await doc.save_async(_AsyncWriter(fail=True), compression_level=0, subset_fonts=False)
+
+        # Renders run at the same time, up to the limiter's limit:
+        limiter = asyncio.Semaphore(2)
+        renders = [warbler.render_async(_build_greeting, name, tmp_path / name, limiter=limiter) for name in 'ABC']
+        await asyncio.gather(*renders)
+        assert sorted(os.listdir(tmp_path)) == ['A', 'B', 'C']
+
+        with ProcessPoolExecutor(1) as executor:
+            writer = _AsyncWriter()
+            await warbler.render_async(_build_greeting, 'Bob', writer, executor=executor)
+            assert b''.join(writer.chunks).startswith(b'%PDF')
+            with pytest.raises(ValueError):
+                await doc.save_async(io.BytesIO(), executor=executor)
+        with pytest.raises(ValueError):
+            await warbler.render_async(_build_greeting, None)
+
+        # By default, documents are rendered in a shared pool of processes, which is replaced if a worker dies:
+        pool = warbler.aio._default_process_pool
+        assert isinstance(pool, ProcessPoolExecutor)
+        with pytest.raises(BrokenProcessPool):
+            await warbler.render_async(_build_or_exit, 'exit')
+        assert (await warbler.render_async(_build_greeting, 'Dan')).startswith(b'%PDF')
+        assert warbler.aio._default_process_pool is not pool
+
+        # Build functions that can't be sent to another process need a thread executor:
+        with ThreadPoolExecutor(2) as executor:
+            pdf_bytes = await warbler.render_async(lambda name: _build_greeting(name), 'Eve', executor=executor)
+            assert pdf_bytes.startswith(b'%PDF')
+
+    asyncio.run(main())
+
+
+def _build_with_shared_font(number):
+    doc = warbler.Document()
+    for page_number in range(3):
+        page = doc.add_page()
+        page.add('Hello %d, page %d' % (number, page_number), font=Path(__file__).parent / 'Minecraft.ttf')
+        page.add('Standard font %d' % number, font='Helvetica')
+    return doc
+
+
+def test_concurrent_saves():
+    from concurrent.futures import ThreadPoolExecutor
+
+    def to_bytes(doc):
+        # (Without the random document ID and the dates, which change from save to save.)
+        return re.sub(rb'/ID \[<\w+> <\w+>\]|/(CreationDate|ModDate) \([^)]*\)', b'', doc.to_bytes())
+
+    # Documents that share the cached TrueType font and the standard fonts can be saved in many threads at once:
+    expected = [to_bytes(_build_with_shared_font(number)) for number in range(8)]
+    for attempt in range(3):
+        docs = [_build_with_shared_font(number) for number in range(8)]
+        with ThreadPoolExecutor(8) as executor:
+            assert list(executor.map(to_bytes, docs)) == expected
+
+    # So can the template and the documents filled from it, which share its pages, fonts, and resources:
+    fontPath = Path(__file__).parent / 'Minecraft.ttf'
+    template = warbler.Document()
+    page = template.add_page()
+    page.add('Invoice', font=fontPath)
+    page.add_slot('customer', font=fontPath)
+    template.add_page().add('Terms', font=fontPath)
+    names = ['Customer %d' % number for number in range(8)]
+    expected = [to_bytes(template.fill({'customer': name})) for name in names]
+    expected_template = to_bytes(template)
+    for attempt in range(3):
+        with ThreadPoolExecutor(8) as executor:
+            template_future = executor.submit(to_bytes, template)
+            assert list(executor.map(lambda name: to_bytes(template.fill({'customer': name})), names)) == expected
+            assert template_future.result() == expected_template
+
+
+def test_command_line_batch_render(tmp_path, capsys):
+    import json
+    from warbler.__main__ import main
+
+    template = {
+        'size': 'A4',
+        'blocks': [
+            {'text': 'Invoice {invoice_id}', 'style': {'font': 'Helvetica-Bold', 'font_size': 20}},
+            {'text': 'Total: {total}', 'style': {'text_alignment': 'right'}},
+            {'text': 'Thank you', 'style': {'font': str(Path(__file__).parent / 'Minecraft.ttf')}},
+        ],
+    }
+    (tmp_path / 'template.json').write_text(json.dumps(template))
+    (tmp_path / 'records.jsonl').write_text('{"invoice_id": 1, "total": 5}\n{"invoice_id": 2}\n')
+    (tmp_path / 'records.csv').write_text('invoice_id,total\n3,7\n4,8\n')
+
+    exit_code = main(
+        [
+            str(tmp_path / 'template.json'),
+            str(tmp_path / 'records.jsonl'),
+            '--out-dir',
+            str(tmp_path / 'out'),
+            '--jobs',
+            '1',
+            '--filename',
+            'invoice-{invoice_id}.pdf',
+        ]
+    )
+    assert exit_code == 1  # The second record has no total field.
+    assert os.listdir(tmp_path / 'out') == ['invoice-1.pdf']
+    output = capsys.readouterr()
+    assert "Record 1 failed: KeyError: 'total'" in output.err
+    assert 'Rendered 1 records (1 failed)' in output.out
+
+    # --merge builds the records in worker processes, and puts their pages together in order:
+    merged = []
+    for jobs in ('1', '2'):
+        exit_code = main(
+            [
+                str(tmp_path / 'template.json'),
+                str(tmp_path / 'records.csv'),
+                '--merge',
+                str(tmp_path / 'merged.pdf'),
+                '--jobs',
+                jobs,
+            ]
+        )
+        assert exit_code == 0
+        merged.append(
+            re.sub(
+                rb'/ID \[<\w+> <\w+>\]|/(CreationDate|ModDate) \([^)]*\)', b'', (tmp_path / 'merged.pdf').read_bytes()
+            )
+        )
+    assert merged[0] == merged[1]
+    assert b'/Count 2 /Kids' in merged[0]
+    merged_doc = warbler.PDF.loads(io.BytesIO(merged[0]))
+    for page_number, invoice_id in enumerate((b'3', b'4')):
+        page = merged_doc.get_page(page_number)
+        assert b'(Invoice %s)' % invoice_id in page['Contents']['DecodedBytes']
+        assert sorted(str(name) for name in page['Resources']['Font']) == ['F1', 'F2', 'F3']
+    with pytest.raises(SystemExit):
+        main([str(tmp_path / 'template.json'), str(tmp_path / 'records.csv'), '--jobs', '0'])
+
+    # The second run with --cache reuses the PDFs from the first run:
+    for out_dir in ('cached1', 'cached2'):
+        exit_code = main(
+            [
+                str(tmp_path / 'template.json'),
+                str(tmp_path / 'records.csv'),
+                '--out-dir',
+                str(tmp_path / out_dir),
+                '--jobs',
+                '2',
+                '--cache',
+                str(tmp_path / 'cache'),
+            ]
+        )
+        assert exit_code == 0
+    assert (tmp_path / 'cached1' / '000001.pdf').read_bytes() == (tmp_path / 'cached2' / '000001.pdf').read_bytes()
+    assert len(list((tmp_path / 'cache').glob('*/*.pdf'))) == 2
+
+
+def test_render_cache(tmp_path, monkeypatch):
+    import asyncio
+    import importlib.metadata
+
+    # Keys depend on every input, but not on the order of dict items:
+    fontPath = Path(__file__).parent / 'Minecraft.ttf'
+    style = warbler.ParagraphStyle(font_size=12, font_color='red')
+    key = warbler.cache_key('Hello', style, {'a': 1, 'b': [Decimal('2.5'), None]})
+    same_style = warbler.ParagraphStyle(font_size=12, font_color='red')
+    assert key == warbler.cache_key('Hello', same_style, {'b': [Decimal('2.5'), None], 'a': 1})
+    other_style = warbler.ParagraphStyle(font_size=13, font_color='red')
+    assert key != warbler.cache_key('Hello', other_style, {'a': 1, 'b': [Decimal('2.5'), None]})
+    assert warbler.cache_key(warbler.ParagraphStyle(font=fontPath)) != warbler.cache_key(warbler.ParagraphStyle())
+    assert warbler.cache_key(('ab', 'c')) != warbler.cache_key(('a', 'bc'))
+    assert warbler.cache_key(Image.new('RGB', (4, 4), 'red')) == warbler.cache_key(Image.new('RGB', (4, 4), 'red'))
+    assert warbler.cache_key(Image.new('RGB', (4, 4), 'red')) != warbler.cache_key(Image.new('RGB', (4, 4), 'blue'))
+    with pytest.raises(TypeError):
+        warbler.cache_key(object())
+    assert warbler.cache_key({'tags': {'b', 'a'}}) == warbler.cache_key({'tags': {'a', 'b'}})
+
+    # The borb version is only looked up once, not for each dict key and set item:
+    version_lookups = []
+    monkeypatch.setattr(importlib.metadata, 'version', lambda name: version_lookups.append(name) or '2.1.4')
+    warbler.cache._borb_version.cache_clear()
+    record = {'lines': [{'sku': 'A%d' % i, 'quantity': i, 'tags': {'new', 'sale'}} for i in range(20)]}
+    assert warbler.cache_key(record) == warbler.cache_key(record)
+    assert version_lookups == ['borb']
+    warbler.cache._borb_version.cache_clear()
+    monkeypatch.undo()
+
+    # Build functions are told apart by their code, and partials by their arguments:
+    import functools
+    from warbler.__main__ import _TemplateBuilder
+    from warbler.cache import _render_key
+
+    namespace = {}
+    exec('def build(record):\n    return record + 1', namespace)
+    edited_namespace = {}
+    exec('def build(record):\n    return record + 2', edited_namespace)
+    assert _render_key(namespace['build'], 1, None) != _render_key(edited_namespace['build'], 1, None)
+    assert _render_key(functools.partial(_build_greeting), 'Alice', None) != _render_key(
+        functools.partial(namespace['build']), 'Alice', None
+    )
+    assert _render_key(functools.partial(namespace['build'], 1), 1, None) != _render_key(
+        functools.partial(namespace['build'], 2), 1, None
+    )
+    # Build functions with state the key can't see need cache_inputs:
+    with pytest.raises(ValueError):
+        _render_key(lambda record: record, 'Alice', None)
+    with pytest.raises(ValueError):
+        _render_key(functools.partial(lambda record: record), 'Alice', None)
+    builder = _TemplateBuilder({'blocks': [{'text': '{name}'}]})
+    with pytest.raises(ValueError):
+        warbler.render_many(builder, [{'name': 'Alice'}], tmp_path / 'out', cache=warbler.RenderCache(tmp_path))
+    assert _render_key(builder, {'name': 'Alice'}, builder.cache_inputs) != _render_key(
+        builder, {'name': 'Bob'}, builder.cache_inputs
+    )
+
+    cache = warbler.RenderCache(tmp_path / 'cache')
+    assert cache.get(key) is None
+    cache.put(key, b'%PDF-1.7 test')
+    assert cache.get(key) == b'%PDF-1.7 test'
+    with pytest.raises(ValueError):
+        cache.get('../../etc/passwd')
+
+    cache.clear()
+    assert cache.get(key) is None
+
+    # The second run writes every PDF from the cache without building it:
+    cache = warbler.RenderCache(tmp_path / 'cache')
+    warbler.render_many(_build_greeting, ['Alice', 'Bob'], tmp_path / 'first', workers=1, cache=cache)
+    assert (cache.hits, cache.misses) == (0, 2)
+    result = warbler.render_many(_build_greeting, ['Alice', 'Bob', None], tmp_path / 'second', workers=1, cache=cache)
+    assert (cache.hits, cache.misses) == (2, 3)
+    assert result.rendered == 2 and len(result.failures) == 1
+    assert (tmp_path / 'first' / '000001.pdf').read_bytes() == (tmp_path / 'second' / '000001.pdf').read_bytes()
+
+    async def main():
+        pdf_bytes = await warbler.render_async(_build_greeting, 'Alice', cache=cache)
+        assert pdf_bytes == (tmp_path / 'first' / '000000.pdf').read_bytes()
+        await warbler.render_async(_build_greeting, 'Carol', tmp_path / 'carol.pdf', cache=cache, atomic=True)
+        pdf_bytes = await warbler.render_async(_build_greeting, 'Carol', cache=cache)
+        assert pdf_bytes == (tmp_path / 'carol.pdf').read_bytes()
+
+    asyncio.run(main())
+    assert (cache.hits, cache.misses) == (4, 4)
+
+    # The least recently used PDFs are evicted when the cache is too big:
+    small_cache = warbler.RenderCache(tmp_path / 'small', max_size=2500)
+    keys = [warbler.cache_key(i) for i in range(3)]
+    for i, key in enumerate(keys[:2]):
+        small_cache.put(key, b'%PDF' + bytes(996))
+        os.utime(small_cache._path(key), (i, i))
+    small_cache.get(keys[0])
+    small_cache.put(keys[2], b'%PDF' + bytes(996))
+    assert [small_cache.get(key) is not None for key in keys] == [True, False, True]
+
+    # The size limit holds for a folder shared by several processes (each with its own copy of the cache):
+    import pickle
+
+    shared_cache = warbler.RenderCache(tmp_path / 'shared', max_size=64000)
+    shared_caches = [pickle.loads(pickle.dumps(shared_cache)) for _ in range(4)]
+    largest_size = 0
+    for i in range(300):
+        shared_caches[i % 4].put(warbler.cache_key(i), b'%PDF' + bytes(996))
+        largest_size = max(largest_size, sum(path.stat().st_size for path in (tmp_path / 'shared').glob('*/*.pdf')))
+    assert 64000 < largest_size <= 64000 + 4 * (64000 / 32 + 1000)
+
+
 def _test_rectangle_annotations():
     # Create the PDF in Warbler:
     import warbler
@@ -337,6 +827,24 @@ def test_normalize_color():
                 )  # .to_hex_string() == "#{:02x}{:02x}{:02x}".format(r, g, b)
 
 
+def test_interned_colors():
+    red = warbler.util._normalize_color('red')
+    assert warbler.util._normalize_color('RED') is red
+    assert warbler.util._normalize_color('#FF0000') is red
+    assert warbler.util._normalize_color('ff0000') is red
+    assert warbler.util._normalize_color((255, 0, 0)) is red
+    assert red.to_hex_string().lower() == '#ff0000'
+
+    with pytest.raises(AttributeError):
+        red.red = Decimal(0)  # Shared color objects can't be changed.
+
+    blue = warbler.util._normalize_color('blue')
+    assert warbler.normalize_colors(['red', (0, 0, 255), [255, 0, 0], '#0000ff']) == [red, blue, red, blue]
+
+    with pytest.raises(ValueError):
+        warbler.util._normalize_color((255, 0))
+
+
 def test_normalize_hyphenation():
     # These tests don't work because of a Borb issue.
     # for iso_language_code in ('af', 'as', 'be', 'bg', 'bn', 'ca', 'cy', 'da', 'de', 'en-gb', 'en-us', 'es', 'et', 'fi', 'fr', 'lt', 'nl', 'ro', 'ru'):
@@ -344,6 +852,17 @@ def test_normalize_hyphenation():
         assert warbler.util._normalize_hyphenation(iso_language_code)
         assert warbler.util._normalize_hyphenation(BorbHyphenation(iso_language_code))
 
+    # Each language's patterns are only loaded once:
+    hyphenation = warbler.util._normalize_hyphenation('en-us')
+    assert warbler.util._normalize_hyphenation('EN-US') is hyphenation
+    assert warbler.Paragraph('Hello', hyphenation='en-us')._hyphenation is hyphenation
+
+    # The shared object hyphenates words the same as borb's Hyphenation:
+    assert hyphenation.hyphenate('hyphenation') == BorbHyphenation('en-us').hyphenate('hyphenation')
+    assert hyphenation.hyphenate('hyphenation', '-') == BorbHyphenation('en-us').hyphenate('hyphenation', '-')
+    hyphenation.hyphenate('hyphenation')
+    assert hyphenation._hyphenate_word.cache_info().hits >= 1
+
 
 def test_normalize_font():
     # This doesn't test that warbler is equivalent to borb, just that the warbler function doesn't fail.
@@ -361,6 +880,641 @@ def test_normalize_font():
     assert isinstance(warbler.util._normalize_font(fontPath), BorbTrueTypeFont)
 
 
+def test_paragraph_style():
+    style = warbler.ParagraphStyle(
+        font='Courier',
+        font_size=14,
+        text_alignment='right',
+        font_color='red',
+        border=True,
+        padding=(1, 2, 3, 4),
+        hyphenation='en-us',
+    )
+    kwargs = style._borb_kwargs
+    assert kwargs['font'] == 'Courier'
+    assert kwargs['font_size'] == Decimal(14)
+    assert kwargs['text_alignment'] == BorbAlignment.RIGHT
+    assert (kwargs['border_top'], kwargs['border_right'], kwargs['border_bottom'], kwargs['border_left']) == (True,) * 4
+    assert (kwargs['padding_top'], kwargs['padding_right'], kwargs['padding_bottom'], kwargs['padding_left']) == (1, 2, 3, 4)
+    assert kwargs['margin_top'] is None
+
+    # A Paragraph made from a style gets the normalized settings without normalizing them again:
+    paragraph = warbler.Paragraph('Hello', style=style)
+    assert paragraph._font_size == Decimal(14)
+    assert paragraph._text_alignment == BorbAlignment.RIGHT
+    assert paragraph._hyphenation is kwargs['hyphenation']
+    assert paragraph._font_color is kwargs['font_color']
+
+    # Derived styles only change the overridden settings:
+    derived = style.derive(font_size=20, margin=5)
+    assert derived._borb_kwargs['font_size'] == Decimal(20)
+    assert derived._borb_kwargs['margin_left'] == Decimal(5)
+    assert derived._borb_kwargs['font'] == 'Courier'
+    assert style._borb_kwargs['font_size'] == Decimal(14)  # The base style is unchanged.
+
+    with pytest.raises(TypeError):
+        style.derive(font_sise=20)
+
+    doc = warbler.Document()
+    page = doc.add_page()
+    page.add('Hello, world!', style=style)
+    page.add('Hello, world!', style=derived)
+
+
+def test_add_many():
+    texts = ['Line item %d' % i for i in range(100)]
+
+    # add_many() lays the texts out in the same places as calling add() on each of them:
+    doc = warbler.Document()
+    added_page = doc.add_page()
+    for text in texts[:10]:
+        added_page.add(text, font_size=10)
+    many_page = doc.add_page()
+    result = many_page.add_many(iter(texts[:10]), font_size=10)
+    assert result.count == 10
+    assert list(result.remaining) == []
+    assert result.y == added_page.default_layout_obj._previous_element.get_previous_layout_box().get_y()
+
+    # It stops at the first text that doesn't fit, and the rest can go on the next page:
+    style = warbler.ParagraphStyle(font_size=10)
+    doc = warbler.Document()
+    first_page = doc.add_page()
+    first_result = first_page.add_many(texts, style=style)
+    assert 0 < first_result.count < 100
+    total, remaining = first_result.count, first_result.remaining
+    while total < 100:
+        result = doc.add_page().add_many(remaining, style=style)
+        total, remaining = total + result.count, result.remaining
+    assert total == 100
+    assert list(remaining) == []
+    # add_many() never adds pages itself, so each page holds the same number of texts:
+    assert int(doc.get_document_info().get_number_of_pages()) == -(-100 // first_result.count)
+
+    # A full page adds nothing more:
+    assert first_page.add_many(['One more'], style=style).count == 0
+
+    # Painting only appends to the decoded content stream, which is compressed once when the page is saved:
+    content_stream = first_page['Contents']
+    assert 'Bytes' not in content_stream
+    assert content_stream['DecodedBytes'].count(b'Line item') == first_result.count
+    assert first_page.append_to_content_stream('') is first_page
+    assert doc.to_bytes(preset='fast').count(b'Line item') == 100
+
+    with pytest.raises(ValueError):
+        doc.add_page().add_many(['Too big'], font_size=1000)
+
+
+def test_defer():
+    style = warbler.ParagraphStyle(font_size=14)
+    texts = ['Paragraph %d. ' % i + LOREM_IPSUM[:300] for i in range(8)]
+
+    added_doc = warbler.Document()
+    deferred_doc = warbler.Document()
+    for page_number in range(2):
+        added_doc.add_page().add_many(texts[page_number * 4 : page_number * 4 + 4], style=style)
+        page = deferred_doc.add_page()
+        for text in texts[page_number * 4 : page_number * 4 + 4]:
+            spec = page.defer(text, style=style)
+        assert spec.style is style and 'Contents' not in page  # Nothing is laid out yet.
+
+    # The deferred paragraphs are laid out when the next page is added and when the document is saved:
+    assert deferred_doc.get_page(0)['Contents']['DecodedBytes'] != b''
+    assert len(deferred_doc.get_page(1).deferred_paragraphs) == 4
+    deferred_bytes = deferred_doc.to_bytes()
+    for page_number in range(2):
+        assert deferred_doc.get_page(page_number)['Contents']['DecodedBytes'] == (
+            added_doc.get_page(page_number)['Contents']['DecodedBytes']
+        )
+
+    # Adding to a page lays out its deferred paragraphs first, and specs can be moved between pages:
+    page = warbler.Page()
+    spec = page.defer('First', font_size=20)
+    other_page = warbler.Page()
+    other_page.defer(spec)
+    assert other_page.add_many(['Second']).count == 1 and other_page.deferred_paragraphs == []
+    assert other_page['Contents']['DecodedBytes'].index(b'(First)') < other_page['Contents']['DecodedBytes'].index(
+        b'(Second)'
+    )
+    assert not hasattr(spec, '__dict__')  # Specs use __slots__.
+
+    with pytest.raises(ValueError):
+        page.defer(spec, font_size=10)
+    with pytest.raises(ValueError):
+        warbler.ParagraphSpec('text', style=None)
+
+
+def test_add_text(monkeypatch):
+    words = ['word%d' % i for i in range(1500)]
+
+    # add_text() continues after whatever is already on the last page:
+    doc = warbler.Document()
+    first_page = doc.add_page()
+    first_page.add('Title', font_size=20)
+    last_page = doc.add_text(' '.join(words), font_size=10)
+    number_of_pages = int(doc.get_document_info().get_number_of_pages())
+    assert number_of_pages >= 3
+    assert last_page is doc.get_page(number_of_pages - 1)
+
+    # The paragraph is split between lines, and every word ends up on exactly one page:
+    parts = [doc.get_page(i).default_layout_obj._previous_element for i in range(number_of_pages)]
+    assert all(part._fixed_lines is not None for part in parts)
+    assert ' '.join(' '.join(part._fixed_lines) for part in parts).split() == words
+
+    # Short texts go on the same page while they fit:
+    assert doc.add_text('A short paragraph.', font_size=10) is last_page
+
+    # Each page only lays out its own lines, so flowing text across pages takes linear time:
+    laid_out_lines = []
+    from_lines = warbler.document.Paragraph._from_lines.__func__
+
+    def counting_from_lines(cls, lines, style, is_last_part):
+        laid_out_lines.append(len(lines))
+        return from_lines(cls, lines, style, is_last_part)
+
+    monkeypatch.setattr(warbler.document.Paragraph, '_from_lines', classmethod(counting_from_lines))
+    doc = warbler.Document()
+    doc.add_text(' '.join(words * 4), font_size=10)
+    assert sum(laid_out_lines) < 2 * sum(
+        len(doc.get_page(i).default_layout_obj._previous_element._fixed_lines)
+        for i in range(int(doc.get_document_info().get_number_of_pages()))
+    )
+
+    # An empty document gets a Letter sized first page:
+    doc = warbler.Document()
+    page = doc.add_text('Hello, world!')
+    assert page.get_page_info().get_width() == 612
+
+    with pytest.raises(ValueError):
+        warbler.Document().add_text('Too big', font_size=1000)
+
+
+def test_page_template():
+    letterhead = warbler.PageTemplate()
+    letterhead.add('ACME Corporation', font_size=20)
+    letterhead_y = letterhead.default_layout_obj._previous_element.get_previous_layout_box().get_y()
+
+    doc = warbler.Document()
+    pages = [warbler.Page(template=letterhead) for i in range(3)]
+    for i, page in enumerate(pages):
+        page.add('Statement %d' % i)
+        doc.add_page(page)
+
+    # Every page shares the same Form XObject, and the page's own text goes below the template's text:
+    assert all(page['Resources']['XObject']['Template'] is pages[0]['Resources']['XObject']['Template'] for page in pages)
+    assert pages[0].default_layout_obj._previous_element.get_previous_layout_box().get_y() < letterhead_y
+
+    # add_text() gives the pages it adds the same template:
+    doc.add_text(' '.join(['word'] * 3000))
+    number_of_pages = int(doc.get_document_info().get_number_of_pages())
+    assert number_of_pages > 3
+    assert doc.get_page(number_of_pages - 1)._template is letterhead
+    with pytest.raises(ValueError):
+        doc.add_text('Too big', font_size=1000)
+
+    # The PDF holds the template's drawing once, whether it's saved all at once or page by page:
+    assert doc.to_bytes().count(b'/Subtype /Form') == 1
+    pdf_file = io.BytesIO()
+    with warbler.DocumentWriter(pdf_file) as writer:
+        for i in range(3):
+            writer.add_page(warbler.Page(template=letterhead)).add('Statement %d' % i)
+    assert pdf_file.getvalue().count(b'/Subtype /Form') == 1
+
+    # The template can't change after a page has used it:
+    with pytest.raises(ValueError):
+        letterhead.add('Too late')
+
+
+def test_fill():
+    template = warbler.Document()
+    page = template.add_page()
+    page.add('INVOICE', font_size=20)
+    page.add_slot('customer', font_size=14)
+    page.add_slot('address', placeholder='Street\nCity', respect_newlines_in_text=True)
+    page.add('Thank you for your business.')
+    page.add_annotation(warbler.SquareAnnotation((50, 50, 100, 100), fill_color='blue', stroke_color='red'))
+    template.add_page().add('Terms and conditions')
+    template_bytes = template.to_bytes()
+
+    # The slots are painted (after the template page's content) where add() would have put the same text:
+    doc = template.fill({'customer': 'Alice', 'address': '1 Main St\nSpringfield'})
+    expected_page = warbler.Page()
+    expected_page.add('INVOICE', font_size=20)
+    expected_page.add('Alice', font_size=14)
+    expected_page.add('1 Main St\nSpringfield', respect_newlines_in_text=True)
+    expected_page.add('Thank you for your business.')
+    filled_page = doc.get_page(0)
+    filled_content = b'\n'.join(stream['DecodedBytes'] for stream in filled_page['Contents'])
+    assert sorted(re.findall(rb'BT.*?ET', filled_content, re.DOTALL)) == sorted(
+        re.findall(rb'BT.*?ET', expected_page['Contents']['DecodedBytes'], re.DOTALL)
+    )
+
+    # Everything that didn't change is shared with the template:
+    assert filled_page['Contents'][0] is page['Contents']
+    assert filled_page['Annots'][0]['P'] is filled_page
+    assert filled_page['Annots'][0]['Rect'] is page['Annots'][0]['Rect']
+    assert doc.get_page(1)['Contents'] is template.get_page(1)['Contents']
+    bob_bytes = template.fill({'customer': 'Bob'}).to_bytes(compression_level=0)
+    assert b'(Bob)' in bob_bytes and b'(Alice)' not in bob_bytes
+    assert len(template.to_bytes()) == len(template_bytes)  # Filling doesn't change the template.
+
+    # New text goes on a new page after the filled ones:
+    assert doc.add_text('P.S.') is doc.get_page(2)
+
+    with pytest.raises(ValueError):
+        template.add_page()  # The template is frozen.
+    with pytest.raises(ValueError):
+        page.add('Too late')
+    with pytest.raises(ValueError):
+        template.fill({'no such slot': 'text'})
+    with pytest.raises(ValueError):
+        template.fill({'customer': ' '.join(['word'] * 100)})  # Too tall for the slot.
+    with pytest.raises(ValueError):
+        warbler.Page().add_slot('tall', height=1000)
+
+
+def test_add_square_annotations():
+    import array
+
+    rectangles = [(50, 60.25, 100, 20), (10, 10, 0, 0), (300.5, 400, 12.75, 3)]
+    colors = ['red', (0, 0, 255), 'red']
+
+    # The same annotations, in the same PDF, as a loop of add_annotation() calls (except for the timestamps):
+    def without_timestamps(pdf_bytes):
+        return re.sub(rb'\((D:\d+)\)', b'()', re.sub(rb'<[0-9a-f]{32}>', b'<>', re.sub(rb'D:\d+[^)]*', b'', pdf_bytes)))
+
+    bulk = warbler.Document()
+    bulk_page = bulk.add_page()
+    bulk_page.add('Boxes')
+    bulk_page.add_annotation(warbler.SquareAnnotation((1, 2, 3, 4), stroke_color='green'))
+    assert bulk_page.add_square_annotations(rectangles, fill_color=colors, stroke_color='black') is bulk_page
+    bulk_page.add_square_annotations(array.array('d', [5, 6, 7, 8]))
+    looped = warbler.Document()
+    looped_page = looped.add_page()
+    looped_page.add('Boxes')
+    looped_page.add_annotation(warbler.SquareAnnotation((1, 2, 3, 4), stroke_color='green'))
+    for rectangle, color in zip(rectangles, colors):
+        looped_page.add_annotation(warbler.SquareAnnotation(rectangle, fill_color=color, stroke_color='black'))
+    looped_page.add_annotation(warbler.SquareAnnotation((5, 6, 7, 8)))
+    assert without_timestamps(bulk.to_bytes(compression_level=0)) == without_timestamps(
+        looped.to_bytes(compression_level=0)
+    )
+    assert [annotation['NM'] for annotation in bulk_page['Annots']] == ['annotation-%03d' % i for i in range(5)]
+    assert bulk_page['Annots'][1]['IC'] is bulk_page['Annots'][3]['IC']  # Each distinct color is shared.
+    assert bulk_page['Annots'][1]['IC'][1] is bulk_page['Annots'][2]['IC'][0]  # And so is each distinct number.
+
+    # Flat sequences and Rectangle objects, and thousands of annotations on one page:
+    page = warbler.Document().add_page()
+    page.add_square_annotations(array.array('i', range(4 * 3000)), fill_color=(0, 0, 0))
+    page.add_square_annotations([warbler.Rectangle(1, 2, 3, 4)])
+    assert len(page['Annots']) == 3001
+    assert [float(n) for n in page['Annots'][1]['Rect']] == [4, 5, 10, 12]
+    assert [float(n) for n in page['Annots'][3000]['Rect']] == [1, 2, 4, 6]
+    assert page.get_document().to_bytes(compression_level=0).count(b'/Subtype /Square') == 3001
+
+    # Nothing is added unless every rectangle is valid:
+    for rectangles, colors in [
+        ([(1, 2, 3)], None),
+        ([1, 2, 3, 4, 5], None),
+        ([(1, 2, 3, 4), (1, 2, -3, 4)], None),
+        ([(1, 2, float('nan'), 4)], None),
+        ([(1, float('-inf'), 3, 4)], None),
+        ([(1, 2, 'x', 4)], None),
+        ([(1, 2, 3, 4), (5, 6, 7, 8)], ['red', 'green', 'blue']),
+    ]:
+        with pytest.raises(ValueError):
+            page.add_square_annotations(rectangles, fill_color=colors)
+    assert len(page['Annots']) == 3001
+
+    # Each number is checked on its own, so large numbers whose sum would overflow are fine:
+    page.add_square_annotations([(1e308, 1e308, 1e308, 1e308)])
+    assert len(page['Annots']) == 3002
+
+
+def test_add_table(tmp_path):
+    def page_words(pdf_bytes):
+        # The words that each page's content stream shows, in order:
+        doc = warbler.PDF.loads(io.BytesIO(pdf_bytes))
+        pages = [doc.get_page(i) for i in range(int(doc.get_document_info().get_number_of_pages()))]
+        contents = [page['Contents']['DecodedBytes'].decode('latin-1') for page in pages]
+        return [' '.join(re.findall(r'\((.*?)\) Tj', content)).split() for content in contents]
+
+    # A long table continues on new pages, with the header row at the top of each one:
+    doc = warbler.Document()
+    doc.add_text('Before')
+    rows = ((i, 'row (%d) \\' % i, None) for i in range(200))
+    last_page = doc.add_table(rows, header=['Number', 'Text', 'Note'])
+    doc.add_text('After')
+    pages = page_words(doc.to_bytes())
+    assert last_page is doc.get_page(len(pages) - 1)
+    assert len(pages) > 2
+    assert pages[0][:4] == ['Before', 'Number', 'Text', 'Note']
+    assert all(words[:3] == ['Number', 'Text', 'Note'] for words in pages[1:])
+    numbers = [int(word) for words in pages for word in words if word.isdigit()]
+    assert numbers == list(range(200))
+    assert pages[0][4:8] == ['0', 'row', r'\(0\)', '\\\\'] and pages[-1][-1] == 'After'  # (Escaped in the PDF.)
+
+    # DocumentWriter writes each page as soon as it's full, and rows can be dicts:
+    with warbler.DocumentWriter(tmp_path / 'table.pdf') as writer:
+        rows = ({'Name': 'name %d' % i, 'Amount': i / 4} for i in range(300))
+        writer.add_table(rows, header=['Name', 'Amount'], column_widths=[3, 1], font_size=12)
+        assert writer.page_count > 2
+    pages = page_words((tmp_path / 'table.pdf').read_bytes())
+    assert all(words[:2] == ['Name', 'Amount'] for words in pages)
+    assert pages[-1][-3:] == ['name', '299', '74.75']
+
+    # Columns are measured from the sample rows, so longer words in later rows are broken onto more lines:
+    doc = warbler.Document()
+    rows = [(1, 'a sample row of text that is much wider than the numbers'), (79999, 'x' * 200 + ' end')]
+    doc.add_table(rows, header=['N', 'Text'], sample_size=1)
+    content = doc.get_page(0)['Contents']['DecodedBytes'].decode('latin-1')
+    assert 'W n' not in content  # (Nothing is cut off.)
+    lines = re.findall(r'1 0 0 1 ([\d.]+) [\d.]+ Tm \((.*?)\) Tj', content)
+    texts = [text for x, text in lines][4:]  # (After the header row and the sample row.)
+    assert ''.join(texts) == '79999' + 'x' * 200 + ' end' and '79999' not in texts and len(texts) > 4
+    cells = re.findall(r'([\d.]+) [\d.]+ ([\d.]+) [\d.]+ re', content)
+    column_rights = {float(left) + float(width) for left, width in cells}
+    font = warbler.util._standard_font('Helvetica')
+    for x, text in lines:
+        right = float(x) + float(warbler.util._text_width(font, Decimal(10), text))
+        assert right <= min(r for r in column_rights if r > float(x)) - 3  # (Inside the cell's padding.)
+    with pytest.raises(ValueError):
+        warbler.Document().add_table([('a',), ('W',)], column_widths=[1], sample_size=1, padding=400)
+
+    for kwargs in [
+        dict(rows=[(1, 2, 3)], header=['a', 'b']),
+        dict(rows=[(1, 2)], header=['a', 'b'], column_widths=[1, 2, 3]),
+        dict(rows=[(1, 2)], column_widths=[1, -1]),
+        dict(rows=[{'a': 1}]),
+        dict(rows=[('\n'.join(['tall'] * 100),)], respect_newlines_in_text=True),
+    ]:
+        with pytest.raises(ValueError):
+            warbler.Document().add_table(**kwargs)
+
+
+def test_shared_images(tmp_path):
+    logo = Image.new('RGB', (400, 200), 'red')
+    ImageDraw.Draw(logo).ellipse((50, 20, 350, 180), fill='blue')
+    logo.save(tmp_path / 'logo.png')
+    warbler.clear_image_cache()
+
+    # Separately loaded copies of the same image are written once:
+    doc = warbler.Document()
+    for i in range(4):
+        page = doc.add_page()
+        page._get_default_layout().add(warbler.Image(Path(tmp_path / 'logo.png'), width=100, height=50))
+        page._get_default_layout().add(warbler.Image(Image.new('RGB', (10, 10), 'green')))
+        page.add('Page %d' % i)
+    for preset in ('default', 'fast', 'small'):
+        pdf_bytes = doc.to_bytes(preset=preset)
+        assert pdf_bytes.count(b'/Filter /DCTDecode') == 2
+        assert re.findall(rb'/Width (\d+) /Height (\d+)', pdf_bytes) == [(b'400', b'200'), (b'10', b'10')]
+    assert len(warbler.images._image_cache) == 2  # Each image was only encoded once.
+
+    # image_dpi scales down images that are drawn smaller than their pixels need:
+    pdf_bytes = doc.to_bytes(image_dpi=144)
+    assert re.findall(rb'/Width (\d+) /Height (\d+)', pdf_bytes) == [(b'200', b'100'), (b'10', b'10')]
+    reloaded_doc = warbler.PDF.loads(io.BytesIO(pdf_bytes))
+    image = reloaded_doc.get_page(3)['Resources']['XObject']['Im1']
+    assert image.size == (200, 100) and image.getpixel((100, 50))[2] > 200  # (Still the blue ellipse.)
+    with pytest.raises(ValueError):
+        doc.to_bytes(image_dpi=0)
+
+    # The same goes for a DocumentWriter's pages:
+    with warbler.DocumentWriter(tmp_path / 'writer.pdf', image_dpi=72) as writer:
+        for i in range(3):
+            page = writer.add_page()
+            page._get_default_layout().add(warbler.Image(Image.open(tmp_path / 'logo.png'), width=100, height=50))
+    pdf_bytes = (tmp_path / 'writer.pdf').read_bytes()
+    assert re.findall(rb'/Width (\d+) /Height (\d+)', pdf_bytes) == [(b'100', b'50')]
+
+
+def _embedded_font_file(pdf_bytes):
+    # Returns the parsed TrueType font file of the first page's F1 font.
+    from fontTools.ttLib import TTFont
+
+    font = warbler.PDF.loads(io.BytesIO(pdf_bytes)).get_page(0)['Resources']['Font']['F1']
+    if 'DescendantFonts' in font:
+        font = font['DescendantFonts'][0]
+    return TTFont(io.BytesIO(font['FontDescriptor']['FontFile2']['DecodedBytes']))
+
+
+def test_font_subsetting():
+    fontPath = Path(__file__).parent / 'Minecraft.ttf'
+    doc = warbler.Document()
+    page = doc.add_page()
+    page.add('Hello, world!', font=fontPath)
+    page.add('Helvetica is not embedded.')
+    font = page['Resources']['Font']['F1']
+
+    full_pdf = doc.to_bytes(subset_fonts=False)
+    subset_pdf = doc.to_bytes()
+    assert len(subset_pdf) < len(full_pdf)
+    # The subset's name tag is the same every time:
+    assert re.findall(rb'/BaseFont /([A-Z]{6}\+Minecraft)', doc.to_bytes()) == re.findall(
+        rb'/BaseFont /([A-Z]{6}\+Minecraft)', subset_pdf
+    )
+    assert page['Resources']['Font']['F1'] is font  # The shared font object is put back after saving.
+
+    # Only the glyphs for the characters on the page are embedded, with a ToUnicode map for them:
+    assert set(_embedded_font_file(subset_pdf).getBestCmap()) == set(ord(c) for c in 'Hello, world!')
+    assert b'/ToUnicode' in subset_pdf
+    assert b'+Minecraft' in subset_pdf and b'+Minecraft' not in full_pdf
+
+
+@pytest.mark.skipif(
+    not Path('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf').exists(), reason='needs a font with over 256 glyphs'
+)
+def test_font_subsetting_type_0_font():
+    # Fonts with more than 256 glyphs are embedded as Type0 fonts, whose glyphs keep their glyph IDs.
+    fontPath = Path('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+    template = warbler.PageTemplate()
+    template.add('Ünïcödé €', font=fontPath)
+    doc = warbler.Document()
+    for i in range(3):
+        page = warbler.Page(template=template)
+        page.add('Page %d' % i, font=fontPath)
+        doc.add_page(page)
+
+    subset_pdf = doc.to_bytes()
+    assert len(subset_pdf) < len(doc.to_bytes(subset_fonts=False)) / 10
+    assert subset_pdf.count(b'/FontFile2') == 1  # The template and the pages share one subset.
+    font_file = _embedded_font_file(subset_pdf)
+    assert set(font_file.getBestCmap()) == set(ord(c) for c in 'Ünïcödé €Page 012')
+    # (Accented letters also keep the glyphs they are built from.)
+    glyph_table = font_file['glyf']
+    assert len([name for name in font_file.getGlyphOrder() if glyph_table[name].numberOfContours != 0]) < 40
+
+
+def test_save_compression_options(tmp_path):
+    doc = warbler.Document()
+    for i in range(3):
+        page = doc.add_page()
+        page.add('Page %d' % i)
+        page.add('Hello, world! ' * 20, font=Path(__file__).parent / 'Minecraft.ttf')
+
+    default_pdf = doc.to_bytes()
+    assert b'/FlateDecode' in default_pdf and b'(Page 0)' not in default_pdf
+
+    # The fast preset doesn't compress anything:
+    fast_pdf = doc.to_bytes(preset='fast')
+    assert b'/FlateDecode' not in fast_pdf and b'(Page 0)' in fast_pdf
+    assert len(fast_pdf) > len(default_pdf)
+
+    # Content streams can have their own level:
+    content_pdf = doc.to_bytes(content_compression_level=0)
+    assert b'(Page 0)' in content_pdf and b'/FlateDecode' in content_pdf
+
+    # Object streams pack everything except streams, with a cross-reference stream instead of a table:
+    small_pdf = doc.to_bytes(preset='small')
+    assert len(small_pdf) < len(default_pdf)
+    assert b'/Type /ObjStm' in small_pdf and b'/Type /XRef' in small_pdf
+    assert b'\nxref' not in small_pdf and b'/Type /Page' not in small_pdf
+    startxref = int(small_pdf.rsplit(b'startxref', 1)[1].split()[0])
+    assert re.match(rb'\d+ 0 obj\n<</Type /XRef', small_pdf[startxref:])
+    doc.save(tmp_path / 'small.pdf', object_streams=True)
+    reloaded_doc = warbler.PDF.loads(io.BytesIO((tmp_path / 'small.pdf').read_bytes()))
+    assert reloaded_doc.get_document_info().get_number_of_pages() == 3
+    assert b'(Page 2)' in reloaded_doc.get_page(2)['Contents']['DecodedBytes']
+
+    with pytest.raises(ValueError):
+        doc.to_bytes(preset='tiny')
+    with pytest.raises(ValueError):
+        doc.to_bytes(compression_level=10)
+
+
+def test_save_object_numbering():
+    from borb.io.read.types import Reference
+    from borb.pdf.canvas.layout.forms.text_field import TextField
+    from warbler.compress import _ResolvedReferences
+
+    doc = warbler.Document()
+    for i in range(2):
+        page = doc.add_page()
+        page.add('Page %d' % i)
+        for _ in range(2):
+            page._get_default_layout().add(TextField(value='same'))
+            page.add_annotation(warbler.SquareAnnotation((10, 10, 5, 5), stroke_color='red'))
+
+    # The objects are numbered the same way as borb does, so the PDF is the same as borb's (apart from the /ID and
+    # dates), every time the document is saved:
+    def normalized(pdf_bytes):
+        return re.sub(rb'/ID \[<\w+> <\w+>\]|/(CreationDate|ModDate) \([^)]*\)', b'', pdf_bytes)
+
+    borb_pdf = io.BytesIO()
+    warbler.PDF.dumps(borb_pdf, doc)
+    assert normalized(doc.to_bytes(subset_fonts=False)) == normalized(borb_pdf.getvalue())
+    assert normalized(doc.to_bytes(subset_fonts=False)) == normalized(borb_pdf.getvalue())
+
+    # Equal objects share a number, except for unique ones, like the text fields' equal widgets:
+    assert doc.to_bytes(preset='fast').count(b'/FT /Tx') == 4
+
+    references = _ResolvedReferences()
+    references.append(Reference(object_number=1))
+    assert Reference(object_number=1) in references and references == [Reference(object_number=1)]
+    assert Reference(object_number=2) not in references
+
+
+def test_profile():
+    reports = []
+    with warbler.Profile(callback=reports.append) as profile:
+        doc = warbler.Document()
+        page = doc.add_page()
+        page.add('Hello, world!', font=Path(__file__).parent / 'Minecraft.ttf')
+        page.add_many(['one', 'two'])
+        pdf_bytes = doc.to_bytes()
+
+        with warbler.Profile() as inner_profile:
+            doc.add_text('More text')
+    doc.add_text('Not profiled')
+
+    report = profile.as_dict()
+    assert reports == [report]
+    assert set(report['stages']) == {'font_loading', 'paragraph', 'layout', 'font_subsetting', 'save'}
+    assert report['stages']['layout']['calls'] == 3  # (Including the inner profile's add_text() call.)
+    assert inner_profile.stages['layout']['calls'] == 1
+    assert report['stages']['paragraph']['calls'] == 4
+    layout = report['stages']['layout']
+    assert 0 < layout['self_seconds'] < layout['seconds']  # Making the paragraphs is another stage.
+
+    (document,) = report['documents']
+    assert document['bytes_written'] == len(pdf_bytes)
+    (page_entry,) = document['pages']
+    assert page_entry['layout_calls'] == 2
+    assert page_entry['content_bytes'] > 0
+    assert json.loads(profile.to_json()) == report
+
+
+def test_font_cache():
+    warbler.clear_font_cache()
+    assert warbler.font_cache_info().currsize == 0
+
+    fontPath = Path(__file__).parent / 'Minecraft.ttf'
+    font1 = warbler.util._normalize_font(fontPath)
+    font2 = warbler.util._normalize_font(str(fontPath))
+    assert font1 is font2  # The same font file is only parsed once.
+
+    info = warbler.font_cache_info()
+    assert info.hits == 1
+    assert info.misses == 1
+    assert info.currsize == 1
+
+    # Fonts are shared between Paragraph objects, too:
+    paragraph = warbler.Paragraph('Hello', font=fontPath)
+    assert paragraph._font is font1
+
+    warbler.clear_font_cache()
+    assert warbler.font_cache_info() == (0, 0, warbler.util.FONT_CACHE_MAX_SIZE, 0)
+    assert warbler.util._normalize_font(fontPath) is not font1
+
+
+def test_text_width_cache():
+    from borb.pdf.canvas.font.glyph_line import GlyphLine
+    from borb.pdf.canvas.layout.text.paragraph import Paragraph as BorbParagraph
+
+    # Paragraphs with the same standard font share one font object:
+    paragraph = warbler.Paragraph(LOREM_IPSUM, font='Times-Roman', hyphenation='en-us', text_alignment='justified')
+    assert paragraph._font is warbler.Paragraph('Hello', font='Times-Roman')._font
+
+    warbler.clear_text_width_cache()
+    assert warbler.text_width_cache_info() == (0, 0, warbler.util.TEXT_WIDTH_CACHE_MAX_SIZE, 0)
+
+    width = warbler.util._text_width(paragraph._font, Decimal(12), 'Lorem')
+    assert width == GlyphLine.from_str('Lorem', paragraph._font, Decimal(12)).get_width_in_text_space()
+    assert warbler.util._text_width(paragraph._font, Decimal(12), 'Lorem') == width
+    assert warbler.text_width_cache_info()[:2] == (1, 1)
+
+    # Line breaking with the cached word widths gives the same lines as borb does:
+    for width in (100, 200, 468):
+        box = BorbRectangle(Decimal(0), Decimal(0), Decimal(width), Decimal(1000))
+        assert paragraph._split_text(box) == BorbParagraph._split_text(paragraph, box)
+    assert warbler.text_width_cache_info().hits > warbler.text_width_cache_info().misses
+
+
+def test_page_sizes():
+    from borb.pdf.page.page_size import PageSize
+
+    assert warbler.document._pageSizeFromName('letter') == PageSize.LETTER_PORTRAIT.value
+    assert warbler.document._pageSizeFromName('Letter Portrait') == PageSize.LETTER_PORTRAIT.value
+    assert warbler.document._pageSizeFromName('LETTER_LANDSCAPE') == PageSize.LETTER_LANDSCAPE.value
+    assert warbler.document._pageSizeFromName('landscape legal') == PageSize.LEGAL_LANDSCAPE.value
+    assert warbler.document._pageSizeFromName('a4') == PageSize.A4_PORTRAIT.value
+    assert warbler.document._pageSizeFromName('A1 landscape') == PageSize.A1_LANDSCAPE.value
+    assert warbler.document._pageSizeFromName('A10 LANDSCAPE') == PageSize.A10_LANDSCAPE.value  # Not A1.
+    assert warbler.document._pageSizeFromName('b10-portrait') == PageSize.B10_PORTRAIT.value
+
+    with pytest.raises(ValueError):
+        warbler.document._pageSizeFromName('LET')  # Partial names don't match.
+    with pytest.raises(ValueError):
+        warbler.document._pageSizeFromName('A11')
+
+    warbler.register_page_size('Avery 5160', 189, 72)
+    assert warbler.document._pageSizeFromName('avery 5160') == (Decimal(189), Decimal(72))
+    assert warbler.document._pageSizeFromName('AVERY_5160_LANDSCAPE') == (Decimal(72), Decimal(189))
+    page = warbler.Page(size='Avery 5160')
+    assert page.get_page_info().get_width() == 189
+    assert page.get_page_info().get_height() == 72
+
+
 def test_normalize_rectangle():
     r = warbler.util._normalize_rectangle(BorbRectangle(Decimal(1), Decimal(2), Decimal(3), Decimal(4)))
     assert r.get_x() == 1